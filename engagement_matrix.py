@@ -0,0 +1,295 @@
+"""
+Matriz densa de engajamento por usuário (snapshots x usuários), persistida em disco.
+
+Para cada pasta, o Engagement_Total somado por usuário em cada snapshot fica em:
+    snapshot_store/week=<pasta>/_engagement_matrix.npy    (int64, mapeável com mmap)
+    snapshot_store/week=<pasta>/_engagement_matrix.json   (snapshots, timestamps, usuários)
+A linha i é o i-ésimo snapshot da pasta e a coluna j o j-ésimo usuário (na ordem em
+que apareceram); usuário ausente de um snapshot fica com MISSING (-1), para não se
+confundir com quem aparece com engajamento zero. O arquivo .npy é alocado com folga nas duas dimensões: um snapshot
+novo só grava a sua linha, e o arquivo só é realocado (dobrando) quando a folga acaba.
+O .json é gravado depois dos dados e é ele que diz quantas linhas e colunas valem.
+
+Uso:
+    python engagement_matrix.py update                 # pastas csv_week*
+    python engagement_matrix.py update csv_week1 ...   # pastas específicas
+"""
+import argparse
+import os
+import threading
+from collections import namedtuple
+from datetime import timedelta
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from snapshot_catalog import SnapshotCatalog
+from snapshot_schema import POST_ID_COLUMN, dedupe_posts
+from snapshot_store import (
+    STORE_DIR,
+    _read_json,
+    _tmp_path,
+    _write_json,
+    debug_print,
+    default_directories,
+    directory_key,
+    read_compact_snapshot,
+)
+
+MATRIX_FILE = "_engagement_matrix.npy"
+MATRIX_INDEX_FILE = "_engagement_matrix.json"
+MATRIX_COLUMNS = ["User", "Link", POST_ID_COLUMN, "Engagement_Total"]
+INITIAL_ROWS = 64
+INITIAL_USERS = 256
+MISSING = -1  # usuário ausente do snapshot
+MATRIX_FORMAT = 2  # matrizes de versões anteriores (ausência gravada como 0) são refeitas
+
+GRANULARITIES = {"hourly": "h", "daily": "D"}
+# Maior intervalo visível atendido por cada nível; o gráfico usa o nível mais grosso necessário
+RAW_MAX_SPAN = timedelta(days=2)
+HOURLY_MAX_SPAN = timedelta(days=21)
+
+# values: ndarray (snapshots x usuários); timestamps: DatetimeIndex das linhas;
+# users: lista dos usuários das colunas; user_index: {usuário: coluna}
+MatrixView = namedtuple("MatrixView", ["values", "timestamps", "users", "user_index"])
+
+def matrix_paths(directory, store_dir=STORE_DIR):
+    week_dir = os.path.join(store_dir, f"week={directory_key(directory)}")
+    return os.path.join(week_dir, MATRIX_FILE), os.path.join(week_dir, MATRIX_INDEX_FILE)
+
+def present_values(values):
+    """
+    Cópia de 'values' com os ausentes (MISSING) contados como engajamento zero.
+    """
+    values = np.asarray(values)
+    return np.where(values == MISSING, 0, values)
+
+def user_engagement(df):
+    """
+    Engagement_Total por usuário de um snapshot (linhas repetidas e posts duplicados contam uma vez).
+    """
+    df = dedupe_posts(df.dropna(subset=["User", "Engagement_Total"]).drop_duplicates())
+    return df.groupby(df["User"].astype(str))["Engagement_Total"].sum()
+
+def _capacity(needed, initial):
+    capacity = initial
+    while capacity < needed:
+        capacity *= 2
+    return capacity
+
+def update_matrix(directory, store_dir=STORE_DIR, catalog=None, loader=None):
+    """
+    Acrescenta à matriz da pasta uma linha por snapshot novo e retorna o índice (.json).
+    Se a lista de snapshots mudou antes do fim da matriz (snapshot removido ou fora de ordem),
+    a matriz é refeita. Um snapshot que falha na leitura não é gravado: a atualização para
+    nele, e ele e os seguintes continuam pendentes até a próxima chamada.
+    """
+    catalog = catalog or SnapshotCatalog([directory], store_dir=store_dir)
+    loader = loader or partial(read_compact_snapshot, store_dir=store_dir)
+    snapshots = catalog.snapshots([directory])
+    matrix_path, index_path = matrix_paths(directory, store_dir)
+
+    index = _read_json(index_path)
+    known = index.get("snapshots", [])
+    if (
+        known != [snapshot.snapshot_id for snapshot in snapshots[:len(known)]]
+        or index.get("format") != MATRIX_FORMAT
+        or not os.path.exists(matrix_path)
+    ):
+        if known:
+            debug_print(f"[DEBUG] Snapshot list or format of {directory} changed; rebuilding engagement matrix.")
+        index, known = {}, []
+    pending = snapshots[len(known):]
+    if not pending:
+        return index
+
+    users = list(index.get("users", []))
+    user_index = {user: column for column, user in enumerate(users)}
+    rows = []
+    loaded = []
+    for snapshot in pending:
+        try:
+            series = user_engagement(loader(snapshot.path, columns=MATRIX_COLUMNS))
+        except Exception as e:
+            # As linhas seguem a ordem dos snapshots: os seguintes esperam este ser lido
+            debug_print(f"[ERROR] Failed to load {snapshot.path}: {e}; retrying on the next update.")
+            break
+        for user in series.index:
+            if user not in user_index:
+                user_index[user] = len(users)
+                users.append(user)
+        rows.append(series)
+        loaded.append(snapshot)
+    if not loaded:
+        return index
+
+    n_rows = len(known) + len(rows)
+    shape = index.get("capacity", [0, 0])
+    if os.path.exists(matrix_path) and known and n_rows <= shape[0] and len(users) <= shape[1]:
+        matrix = np.lib.format.open_memmap(matrix_path, mode="r+")
+        tmp_path = None
+    else:
+        # Realoca com o dobro da folga e copia a parte já preenchida
+        shape = [_capacity(n_rows, INITIAL_ROWS), _capacity(len(users), INITIAL_USERS)]
+        os.makedirs(os.path.dirname(matrix_path), exist_ok=True)
+        tmp_path = _tmp_path(matrix_path)
+        matrix = np.lib.format.open_memmap(tmp_path, mode="w+", dtype="int64", shape=tuple(shape))
+        matrix[:] = MISSING
+        if known:
+            previous = np.load(matrix_path, mmap_mode="r")
+            matrix[:len(known), :len(index["users"])] = previous[:len(known), :len(index["users"])]
+            del previous
+
+    for offset, series in enumerate(rows):
+        row = len(known) + offset
+        matrix[row, :] = MISSING
+        if len(series):
+            columns = np.fromiter((user_index[user] for user in series.index), dtype="int64", count=len(series))
+            matrix[row, columns] = series.to_numpy(dtype="int64")
+    matrix.flush()
+    del matrix
+    if tmp_path is not None:
+        os.replace(tmp_path, matrix_path)
+
+    index = {
+        "snapshots": known + [snapshot.snapshot_id for snapshot in loaded],
+        "timestamps": index.get("timestamps", []) + [snapshot.timestamp.isoformat() for snapshot in loaded],
+        "users": users,
+        "capacity": shape,
+        "format": MATRIX_FORMAT,
+    }
+    _write_json(index, index_path)
+    debug_print(f"[DEBUG] Engagement matrix of {directory}: {n_rows} snapshots x {len(users)} users")
+    return index
+
+def _empty_view():
+    return MatrixView(np.zeros((0, 0), dtype="int64"), pd.DatetimeIndex([]), [], {})
+
+class EngagementMatrix:
+    """
+    Lado do dashboard: mantém as matrizes atualizadas e as mapeia em memória (somente leitura).
+    """
+
+    def __init__(self, catalog, store_dir=STORE_DIR, loader=None):
+        self.catalog = catalog
+        self.store_dir = store_dir
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._views = {}  # directory -> (snapshots considerados, MatrixView)
+
+    def _directory_view(self, directory):
+        snapshots = self.catalog.snapshots([directory])
+        with self._lock:
+            cached = self._views.get(directory)
+            if cached is not None and cached[0] is snapshots:
+                return cached[1]
+            index = update_matrix(directory, self.store_dir, self.catalog, self.loader)
+            if not index.get("snapshots"):
+                view = _empty_view()
+            else:
+                n_rows, n_users = len(index["snapshots"]), len(index["users"])
+                values = np.load(matrix_paths(directory, self.store_dir)[0], mmap_mode="r")[:n_rows, :n_users]
+                users = index["users"]
+                view = MatrixView(
+                    values,
+                    pd.DatetimeIndex(pd.to_datetime(index["timestamps"])),
+                    users,
+                    {user: column for column, user in enumerate(users)},
+                )
+            self._views[directory] = (snapshots, view)
+            return view
+
+    def view(self, directories):
+        """
+        Matriz das pastas informadas. Com uma pasta, é uma fatia do mapeamento (sem cópia);
+        com várias, as linhas são intercaladas em ordem cronológica e os usuários unidos.
+        """
+        views = [self._directory_view(directory) for directory in directories]
+        views = [view for view in views if len(view.timestamps)]
+        if not views:
+            return _empty_view()
+        if len(views) == 1:
+            return views[0]
+
+        users = []
+        user_index = {}
+        for view in views:
+            for user in view.users:
+                if user not in user_index:
+                    user_index[user] = len(users)
+                    users.append(user)
+        timestamps = np.concatenate([view.timestamps.values for view in views])
+        values = np.full((len(timestamps), len(users)), MISSING, dtype="int64")
+        start = 0
+        for view in views:
+            columns = np.array([user_index[user] for user in view.users], dtype="int64")
+            values[start:start + len(view.timestamps), columns] = view.values
+            start += len(view.timestamps)
+        order = np.argsort(timestamps, kind="stable")
+        return MatrixView(values[order], pd.DatetimeIndex(timestamps[order]), users, user_index)
+
+def user_series(view, user):
+    """
+    Série de engajamento do usuário em cada snapshot (zeros onde ele não aparece).
+    """
+    column = view.user_index.get(user)
+    if column is None:
+        return pd.Series(0, index=view.timestamps, dtype="int64")
+    return pd.Series(present_values(view.values[:, column]), index=view.timestamps)
+
+def ranking_order(view):
+    """
+    Usuários ordenados pelo engajamento somado em todos os snapshots (maior primeiro).
+    """
+    totals = present_values(view.values).sum(axis=0)
+    return [view.users[column] for column in np.argsort(-totals, kind="stable")]
+
+def select_rows(view, rows):
+    """
+    Subconjunto das linhas (snapshots) da matriz, mantendo as colunas.
+    """
+    return MatrixView(view.values[rows], view.timestamps[rows], view.users, view.user_index)
+
+def select_window(view, start=None, end=None):
+    """
+    Linhas com start <= timestamp <= end (limites None são abertos), por busca binária.
+    """
+    lo = view.timestamps.searchsorted(start, side="left") if start is not None else 0
+    hi = view.timestamps.searchsorted(end, side="right") if end is not None else len(view.timestamps)
+    return select_rows(view, slice(lo, hi))
+
+def select_granularity(start, end):
+    """
+    'raw', 'hourly' ou 'daily': o nível mais grosso adequado ao intervalo visível.
+    """
+    span = end - start
+    if span <= RAW_MAX_SPAN:
+        return "raw"
+    if span <= HOURLY_MAX_SPAN:
+        return "hourly"
+    return "daily"
+
+def bucket_rows(timestamps, granularity):
+    """
+    Posições (em 'timestamps', ordenado) do último snapshot de cada intervalo; 'raw' mantém todos.
+    As métricas são acumuladas, então o último snapshot do intervalo representa o intervalo.
+    """
+    if granularity == "raw":
+        return np.arange(len(timestamps))
+    buckets = pd.DatetimeIndex(timestamps).floor(GRANULARITIES[granularity]).asi8
+    return np.flatnonzero(np.append(buckets[1:] != buckets[:-1], True))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Matriz de engajamento snapshots x usuários.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    update_parser = subparsers.add_parser("update", help="Acrescenta os snapshots novos à matriz.")
+    update_parser.add_argument("directories", nargs="*", help="Pastas com *_ranked_results.csv (padrão: csv_week*).")
+    update_parser.add_argument("--store", default=STORE_DIR, help="Diretório do snapshot store.")
+
+    args = parser.parse_args()
+    if args.command == "update":
+        for directory in args.directories or default_directories():
+            index = update_matrix(os.path.abspath(directory), args.store)
+            print(f"{directory}: {len(index.get('snapshots', []))} snapshots x {len(index.get('users', []))} users")
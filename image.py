@@ -4,6 +4,25 @@ import plotly.express as px
 import plotly.graph_objects as go
 import os
 import time
+from datetime import timedelta
+import numpy as np
+
+from cardinality_sketch import merge_counts
+from quantile_sketch import KLLSketch, merge_sketches
+from snapshot_cache import SnapshotCache
+from snapshot_catalog import SnapshotCatalog
+from snapshot_schema import concat_frames, dedupe_posts, memory_report, normalize_users
+from shared_plane import SharedHistory
+from snapshot_deltas import DeltaEngine
+from snapshot_prefetch import Prefetcher, neighbours_first
+from engagement_matrix import MISSING, EngagementMatrix, bucket_rows, present_values, ranking_order, select_granularity, select_rows, select_window, user_series
+from series_downsampling import CHART_MAX_POINTS, downsample
+from snapshot_watcher import read_store_version
+from snapshot_store import TOP_USERS, compute_aggregates, discover_week_directories, load_aggregates, top_user_value
+from user_index import UserIndex
+from post_index import PostIndex
+from velocity_anomalies import VelocityMonitor
+from user_summary import summarize_users, top_k
 
 # Set up a debug flag
 DEBUG = True  # Set to False to reduce verbosity
@@ -39,33 +58,171 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # Diretório base do repositório
+
+# Semanas descobertas a partir das pastas csv_week<N>: uma semana nova aparece sem mudar o código
+week_directories = discover_week_directories(BASE_DIR)
+
 # Week selection menu
 selected_week = st.radio(
     "Select Week:",
-    ["Week1", "Week2", "Week3", "Week4", "All Weeks"],
+    list(week_directories) + ["All Weeks"],
     horizontal=True
 )
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # Diretório base do repositório
-
-week_directories = {
-    'Week1': os.path.join(BASE_DIR, "csv_week1"),
-    'Week2': os.path.join(BASE_DIR, "csv_week2"),
-    'Week3': os.path.join(BASE_DIR, "csv_week3"),
-    'Week4': os.path.join(BASE_DIR, "csv_week4"),
-}
+# Janela de tempo dos gráficos de histórico (relativa ao snapshot mais recente da seleção)
+TIME_WINDOWS = ["Whole period", "Last 24 hours", "Last 7 days", "Custom range"]
+selected_window = st.selectbox("Time window:", TIME_WINDOWS)
 
 # Set the CSV directories based on the selected week
 if selected_week == 'All Weeks':
-    CSV_DIRS = [
-        week_directories['Week1'],
-        week_directories['Week2'],
-        week_directories['Week3'],
-        week_directories['Week4']
-    ]
+    CSV_DIRS = list(week_directories.values())
 else:
     CSV_DIRS = [week_directories[selected_week]]
 
+STORE_REFRESH_SECONDS = float(os.getenv("SNAPSHOT_REFRESH_SECONDS", "30"))
+# Limites dos gráficos de evolução: séries desenhadas (o resto vira "Others") e pontos por série (LTTB)
+CHART_MAX_TRACES = int(os.getenv("SNAPSHOT_CHART_MAX_TRACES", "50"))
+# Com o plano compartilhado, o cache privado só guarda snapshots ainda não publicados
+PLANE_CACHE_MAX_BYTES = int(os.getenv("SNAPSHOT_PLANE_CACHE_MB", "64")) * 1024 * 1024
+# Seções dos gráficos abertas já na primeira pintura (por padrão, só as métricas de resumo aparecem)
+SECTIONS_EXPANDED = os.getenv("SNAPSHOT_SECTIONS_EXPANDED", "0") == "1"
+
+@st.cache_resource
+def get_snapshot_catalog():
+    """
+    Catálogo de snapshots compartilhado entre reruns e sessões.
+    """
+    return SnapshotCatalog(week_directories.values())
+
+@st.cache_resource
+def get_snapshot_cache():
+    """
+    Cache de DataFrames compartilhado entre reruns e sessões: cada snapshot é lido uma vez por processo.
+    Com o plano compartilhado ativo, os snapshots publicados são lidos do mapeamento (read_snapshot)
+    e o cache fica limitado a SNAPSHOT_PLANE_CACHE_MB.
+    """
+    if os.getenv("SNAPSHOT_PLANE_DIR"):
+        return SnapshotCache(max_bytes=PLANE_CACHE_MAX_BYTES)
+    return SnapshotCache()
+
+@st.cache_resource
+def get_shared_history():
+    """
+    Histórico mapeado do plano compartilhado (shared_plane.py), se SNAPSHOT_PLANE_DIR estiver definido.
+    """
+    plane_dir = os.getenv("SNAPSHOT_PLANE_DIR")
+    return SharedHistory(plane_dir) if plane_dir else None
+
+@st.cache_resource
+def get_delta_engine():
+    """
+    Deltas entre snapshots consecutivos (snapshot_deltas.py), calculados uma vez por snapshot.
+    """
+    return DeltaEngine(get_snapshot_catalog(), loader=read_snapshot)
+
+@st.cache_resource
+def get_engagement_matrix():
+    """
+    Matriz snapshots x usuários (engagement_matrix.py): cada snapshot novo acrescenta uma linha.
+    """
+    return EngagementMatrix(get_snapshot_catalog(), loader=read_snapshot)
+
+@st.cache_resource
+def get_user_index():
+    """
+    Índice usuário → linhas do histórico (user_index.py), para o drill-down por usuário.
+    """
+    return UserIndex(get_snapshot_catalog(), loader=read_snapshot)
+
+@st.cache_resource
+def get_post_index():
+    """
+    Índice post → (snapshot, linha) (post_index.py), para o histórico de um post no drill-down.
+    """
+    return PostIndex(get_snapshot_catalog(), loader=read_snapshot)
+
+@st.cache_resource
+def get_velocity_monitor():
+    """
+    Alertas de velocidade de engajamento por post (velocity_anomalies.py), atualizados uma vez por snapshot.
+    """
+    return VelocityMonitor(get_snapshot_catalog(), loader=read_snapshot)
+
+@st.cache_resource
+def get_prefetcher():
+    """
+    Pré-carregamento das outras semanas em segundo plano (snapshot_prefetch.py).
+    O orçamento de memória é medido no cache de snapshots compartilhado.
+    """
+    cache = get_snapshot_cache()
+    return Prefetcher(usage=lambda: cache.current_bytes)
+
+def week_prefetch_steps(directory):
+    """
+    Passos que aquecem os caches usados pela visão de uma semana, na ordem em que a tela os usa.
+    Os objetos compartilhados são obtidos aqui, na thread do script.
+    """
+    catalog = get_snapshot_catalog()
+    cache = get_snapshot_cache()
+    shared_history = get_shared_history()
+    matrix = get_engagement_matrix()
+    delta_engine = get_delta_engine()
+    velocity_monitor = get_velocity_monitor()
+    user_index = get_user_index()
+    post_index = get_post_index()
+
+    def latest_snapshot():
+        latest = catalog.latest([directory])
+        # Um snapshot já publicado no plano compartilhado não precisa de cópia no cache
+        if latest is not None and (shared_history is None or shared_history.snapshot(latest.path) is None):
+            cache.get(latest.path)
+
+    return [
+        latest_snapshot,
+        lambda: load_aggregates([snapshot.path for snapshot in catalog.snapshots([directory])]),
+        lambda: matrix.view([directory]),
+        lambda: delta_engine.tables(directory),
+        lambda: velocity_monitor.flags([directory]),
+        lambda: user_index.search([directory], ""),
+        lambda: post_index.index(directory),
+    ]
+
+def resolve_time_window(directories, window):
+    """
+    (início, fim) da janela escolhida, a partir dos limites do catálogo (nenhum arquivo é aberto).
+    (None, None) significa sem limite.
+    """
+    bounds = get_snapshot_catalog().time_bounds(directories)
+    if bounds is None or window == "Whole period":
+        return None, None
+    first, last = bounds
+    if window == "Last 24 hours":
+        return last - timedelta(hours=24), last
+    if window == "Last 7 days":
+        return last - timedelta(days=7), last
+    selected = st.date_input(
+        "Custom range:", (first.date(), last.date()), min_value=first.date(), max_value=last.date()
+    )
+    if len(selected) != 2:
+        return None, None
+    start = pd.Timestamp(selected[0]).to_pydatetime()
+    end = (pd.Timestamp(selected[1]) + pd.Timedelta(days=1, microseconds=-1)).to_pydatetime()
+    return start, end
+
+def read_snapshot(path, columns=None):
+    """
+    Lê um snapshot: do plano compartilhado, se ele já estiver publicado (só esse snapshot é
+    convertido para pandas, nada fica guardado no processo), senão através do cache compartilhado.
+    É o loader da matriz, dos deltas, da velocidade e do índice de usuários.
+    """
+    shared_history = get_shared_history()
+    if shared_history is not None:
+        table = shared_history.snapshot(path, columns)
+        if table is not None:
+            return table.to_pandas()
+    return get_snapshot_cache().get(path, columns=columns)
+
 def extract_datetime_from_filename(filename):
     """
     Extract datetime from the filename.
@@ -78,48 +235,21 @@ def extract_datetime_from_filename(filename):
         debug_print(f"[ERROR] Failed to extract datetime from filename '{filename}': {e}")
         return pd.NaT
 
-def ensure_engagement_total(df):
-    """
-    Garante que a coluna 'Engagement_Total' exista.
-    Se não existir, calcula usando a fórmula:
-    Engagement_Total = Views + (Comments x 6) + (Retweets x 3) + (Likes x 2) + (Bookmarks)
-    """
-    if 'Engagement_Total' not in df.columns:
-        debug_print("[DEBUG] 'Engagement_Total' column missing. Calculating it.")
-        df['Engagement_Total'] = (
-            df['Views'].fillna(0) +
-            df['Comments'].fillna(0) * 6 +
-            df['Retweets'].fillna(0) * 3 +
-            df['Likes'].fillna(0) * 2 +
-            df['Bookmarks'].fillna(0)
-        )
-    else:
-        debug_print("[DEBUG] 'Engagement_Total' column exists.")
-    return df
-
 def load_latest_csv(directories):
     """
     Carrega o CSV mais recente com base no timestamp no nome do arquivo.
     Retorna o DataFrame resultante e o nome do arquivo.
     """
-    files = []
-    for directory in directories:
-        if not os.path.isdir(directory):
-            debug_print(f"[WARNING] Directory not found: {directory}")
-            continue
-        dir_files = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".csv")]
-        debug_print(f"[DEBUG] Found files in {directory}: {dir_files}")
-        files.extend(dir_files)
-
-    if not files:
+    latest = get_snapshot_catalog().latest(directories)
+    if latest is None:
         raise FileNotFoundError("No CSV files found in the specified directories.")
 
     # Seleciona o arquivo mais recente
-    latest_file = max(files, key=lambda f: extract_datetime_from_filename(os.path.basename(f)))
+    latest_file = latest.path
     debug_print(f"[DEBUG] Latest file selected: {latest_file}")
 
     try:
-        df = pd.read_csv(latest_file)
+        df = dedupe_posts(read_snapshot(latest_file))
         debug_print(f"[DEBUG] File {latest_file} loaded successfully. Shape: {df.shape}")
         debug_print(f"[DEBUG] File head:\n{df.head()}")
         debug_print(f"[DEBUG] File columns: {df.columns.tolist()}")
@@ -127,44 +257,30 @@ def load_latest_csv(directories):
         debug_print(f"[ERROR] Failed to read {latest_file}: {e}")
         raise e
 
-    # Garantir que 'Engagement_Total' exista
-    df = ensure_engagement_total(df)
-    df["Datetime"] = extract_datetime_from_filename(os.path.basename(latest_file))
+    df["Datetime"] = latest.timestamp
     return df, latest_file
 
-def load_latest_and_second_latest_csv(directories):
+def load_latest_and_second_latest_aggregates(directories):
     """
-    Carrega o CSV mais recente e o segundo mais recente.
-    Retorna dois DataFrames e os nomes dos arquivos.
+    Carrega os agregados do CSV mais recente e do segundo mais recente, sem ler os snapshots.
+    Retorna os dois dicionários de agregados e os nomes dos arquivos.
     """
-    files = []
-    for directory in directories:
-        if not os.path.isdir(directory):
-            debug_print(f"[WARNING] Directory not found: {directory}")
-            continue
-        dir_files = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".csv")]
-        files.extend(dir_files)
-
-    if len(files) < 2:
+    latest_snapshots = get_snapshot_catalog().latest_n(directories, 2)
+    if len(latest_snapshots) < 2:
         raise FileNotFoundError("Less than two CSV files found in the specified directories.")
 
-    # Ordena pelos timestamps decrescente
-    sorted_files = sorted(files, key=lambda f: extract_datetime_from_filename(os.path.basename(f)), reverse=True)
-    latest_file = sorted_files[0]
-    second_latest_file = sorted_files[1]
-
-    debug_print(f"[DEBUG] Loading latest CSV file: {latest_file}")
-    debug_print(f"[DEBUG] Loading second latest CSV file: {second_latest_file}")
+    # Os dois snapshots mais recentes, do mais novo para o mais antigo
+    latest, second_latest = latest_snapshots
+    latest_file = latest.path
+    second_latest_file = second_latest.path
 
-    latest_df = pd.read_csv(latest_file)
-    latest_df = ensure_engagement_total(latest_df)
-    latest_df["Datetime"] = extract_datetime_from_filename(os.path.basename(latest_file))
+    debug_print(f"[DEBUG] Loading aggregates for latest CSV file: {latest_file}")
+    debug_print(f"[DEBUG] Loading aggregates for second latest CSV file: {second_latest_file}")
 
-    second_latest_df = pd.read_csv(second_latest_file)
-    second_latest_df = ensure_engagement_total(second_latest_df)
-    second_latest_df["Datetime"] = extract_datetime_from_filename(os.path.basename(second_latest_file))
-
-    return latest_df, second_latest_df, latest_file, second_latest_file
+    latest_aggregates, second_latest_aggregates = load_aggregates([latest_file, second_latest_file])
+    if latest_aggregates is None:
+        raise ValueError(f"Failed to read {latest_file}.")
+    return latest_aggregates, second_latest_aggregates, latest_file, second_latest_file
 
 def load_week_data(week):
     """
@@ -182,23 +298,19 @@ def load_week_data(week):
             debug_print(f"[WARNING] Directory does not exist: {directory}")
             raise FileNotFoundError(f"Directory {directory} does not exist.")
 
-        csv_files = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".csv")]
-        debug_print(f"[DEBUG] Found {len(csv_files)} CSV files in {directory}: {csv_files}")
-
-        if not csv_files:
+        latest = get_snapshot_catalog().latest([directory])
+        if latest is None:
             raise FileNotFoundError(f"No CSV files found in {directory} for {week}.")
 
-        latest_file = max(csv_files, key=lambda f: extract_datetime_from_filename(os.path.basename(f)))
+        latest_file = latest.path
         debug_print(f"[DEBUG] Latest file selected for {week}: {latest_file}")
 
-        df = pd.read_csv(latest_file)
+        df = dedupe_posts(read_snapshot(latest_file))
         debug_print(f"[DEBUG] DataFrame loaded from {latest_file}. Shape: {df.shape}")
         debug_print(f"[DEBUG] File head:\n{df.head()}")
         debug_print(f"[DEBUG] File columns: {df.columns.tolist()}")
 
-        df = ensure_engagement_total(df)
-        df["Datetime"] = extract_datetime_from_filename(os.path.basename(latest_file))
-        df["Date"] = df["Datetime"].dt.strftime("%d/%m %H:%M")
+        df["Datetime"] = latest.timestamp
 
         return df
 
@@ -207,18 +319,28 @@ def load_week_data(week):
         st.error(f"Error loading data for {week}: {e}")
         return pd.DataFrame()
 
+window_start, window_end = resolve_time_window(CSV_DIRS, selected_window)
+debug_print(f"[DEBUG] Time window: {window_start} - {window_end}")
+
+# A tela atual tem prioridade: o pré-carregamento da rodada anterior é interrompido
+get_prefetcher().cancel()
+
 # Carrega dados com base na seleção do usuário
-if selected_week in ["Week1", "Week2", "Week3", "Week4"]:
+if selected_week in week_directories:
     week_data = load_week_data(selected_week)
 elif selected_week == "All Weeks":
-    # Carrega dados de todas as semanas
+    # Carrega dados de todas as semanas: lê os snapshots mais recentes em paralelo
+    # para o cache e depois monta cada semana (com as mensagens de erro) na thread do script
+    latest_snapshots = [get_snapshot_catalog().latest([directory]) for directory in week_directories.values()]
+    if get_shared_history() is None:
+        get_snapshot_cache().get_many([snapshot.path for snapshot in latest_snapshots if snapshot is not None])
     all_week_data = []
     for week, directory in week_directories.items():
         week_df = load_week_data(week)
         if not week_df.empty:
             week_df["Week"] = week
             all_week_data.append(week_df)
-    week_data = pd.concat(all_week_data, ignore_index=True) if all_week_data else pd.DataFrame()
+    week_data = concat_frames(all_week_data) if all_week_data else pd.DataFrame()
 else:
     week_data = pd.DataFrame()
 
@@ -229,59 +351,60 @@ else:
     st.success(f"Data loaded successfully for {selected_week}!")
     debug_print(week_data.head())
 
-def sum_weekly_data(weekly_data):
-    """
-    Concatena todos os DataFrames semanais em um único DataFrame.
-    """
-    if not weekly_data:
-        raise ValueError("No weekly data to sum.")
-    combined_df = pd.concat(weekly_data.values(), ignore_index=True)
-    debug_print("[DEBUG] Combined weekly DataFrame:")
-    debug_print(combined_df.head())
-    debug_print(f"[DEBUG] Combined DataFrame shape: {combined_df.shape}")
-    return combined_df
-
-def load_all_csv_files(directories):
+def load_all_csv_files(directories, columns=None, start=None, end=None):
     """
     Carrega todos os CSVs em várias pastas, retornando um DataFrame combinado.
+    Se 'columns' for informado, lê apenas essas colunas de cada snapshot.
+    Com 'start'/'end', só os snapshots dentro da janela são abertos.
     """
+    snapshots = get_snapshot_catalog().in_range(directories, start, end)
+    debug_print(f"[DEBUG] Loading {len(snapshots)} CSV files for all weeks")
+    # Leitura paralela; os DataFrames voltam na ordem cronológica dos snapshots
+    frames = get_snapshot_cache().get_many([snapshot.path for snapshot in snapshots], columns=columns)
     dataframes = []
-    for directory in directories:
-        if not os.path.isdir(directory):
-            debug_print(f"[WARNING] Directory not found: {directory}")
+    for snapshot, df in zip(snapshots, frames):
+        if df is None:
             continue
-        for file in os.listdir(directory):
-            if file.endswith(".csv"):
-                file_path = os.path.join(directory, file)
-                debug_print(f"[DEBUG] Loading CSV file for all weeks: {file_path}")
-                try:
-                    df = pd.read_csv(file_path)
-                    df = ensure_engagement_total(df)
-                    df["Datetime"] = extract_datetime_from_filename(file)
-                    df["Date"] = df["Datetime"].dt.strftime("%d/%m %H:%M")
-                    dataframes.append(df)
-                except Exception as e:
-                    debug_print(f"[ERROR] Failed to load {file_path}: {e}")
+        df["Datetime"] = snapshot.timestamp
+        dataframes.append(df)
     if not dataframes:
         raise FileNotFoundError("No CSV files found in the specified directories.")
-    combined_df = pd.concat(dataframes, ignore_index=True)
+    combined_df = concat_frames(dataframes)
     debug_print("[DEBUG] Combined DataFrame for all CSV files:")
     debug_print(combined_df.head())
     debug_print(f"[DEBUG] Combined DataFrame shape: {combined_df.shape}")
     debug_print(f"[DEBUG] Columns: {combined_df.columns}")
     debug_print(f"[DEBUG] Data types: {combined_df.dtypes}")
+    debug_print(f"[DEBUG] Memory report:\n{memory_report(combined_df)}")
     return combined_df
 
-def calculate_differences(latest_df, second_latest_df):
+def count_unique_users(directories, start=None, end=None):
+    """
+    Número exato de usuários distintos nos snapshots das pastas (dentro da janela).
+    Com o plano compartilhado ativo, conta sobre o histórico mapeado em memória, sem cópia;
+    senão, lê a coluna User de cada snapshot.
     """
-    Calcula as diferenças absolutas e percentuais entre o CSV mais recente e o segundo mais recente.
+    shared_history = get_shared_history()
+    if shared_history is not None:
+        users = shared_history.unique_values(directories, "User", start, end)
+        if users is not None:
+            debug_print(f"[DEBUG] Using shared history version {shared_history.version} for unique users.")
+            return normalize_users(pd.Series(list(users), dtype="object")).nunique()
+        debug_print("[DEBUG] Shared history does not cover the selected directories. Loading locally.")
+    users = load_all_csv_files(directories, columns=["User"], start=start, end=end)["User"]
+    return normalize_users(users).nunique()
+
+def calculate_differences(latest_aggregates, second_latest_aggregates):
+    """
+    Calcula as diferenças absolutas e percentuais entre o CSV mais recente e o segundo mais recente,
+    a partir dos agregados de cada snapshot (ver snapshot_store.compute_aggregates).
     """
     metrics = ["Likes", "Retweets", "Comments", "Bookmarks", "Views", "Engagement_Total"]
     differences = {}
     for metric in metrics:
-        latest_total = latest_df[metric].sum()
-        if second_latest_df is not None and metric in second_latest_df.columns:
-            second_latest_total = second_latest_df[metric].sum()
+        latest_total = latest_aggregates["totals"][metric]
+        if second_latest_aggregates is not None and metric in second_latest_aggregates["totals"]:
+            second_latest_total = second_latest_aggregates["totals"][metric]
         else:
             second_latest_total = 0
         abs_diff = latest_total - second_latest_total
@@ -300,7 +423,7 @@ def calculate_differences(latest_df, second_latest_df):
         )
     return differences
 
-def display_summary_metrics(latest_df, second_latest_df, differences):
+def display_summary_metrics(latest_df, second_latest_aggregates, differences):
     """
     Exibe métricas de resumo usando os componentes 'metric' do Streamlit.
     """
@@ -343,110 +466,134 @@ def display_summary_metrics(latest_df, second_latest_df, differences):
 
     # Total Posts
     total_posts = len(latest_df)
-    total_posts_diff = total_posts - len(second_latest_df) if second_latest_df is not None else 0
+    total_posts_diff = total_posts - second_latest_aggregates["posts"] if second_latest_aggregates is not None else 0
     col7.metric("Total Posts", f"{total_posts:,}", f"{total_posts_diff:+,}")
 
     # Average Engagement per Post
     avg_engagement = latest_df["Engagement_Total"].mean()
-    if second_latest_df is not None:
-        avg_engagement_diff = avg_engagement - second_latest_df["Engagement_Total"].mean()
+    if second_latest_aggregates is not None and second_latest_aggregates["posts"]:
+        second_latest_avg = second_latest_aggregates["totals"]["Engagement_Total"] / second_latest_aggregates["posts"]
+        avg_engagement_diff = avg_engagement - second_latest_avg
     else:
         avg_engagement_diff = 0
     col8.metric("Average Engagement per Post", f"{avg_engagement:.2f}", f"{avg_engagement_diff:+.2f}")
 
     # Unique Users
-    unique_users = latest_df["User"].str.strip().str.lower().nunique()
+    unique_users = latest_df["User"].nunique()
     col9.metric("Unique Users", f"{unique_users:,}")
 
-def display_full_ranking(df):
+def display_full_ranking(df, post_flags=None):
     """
     Exibe o ranking completo em uma tabela.
+    Com 'post_flags' (VelocityMonitor.post_flags), posts com alerta de velocidade mostram o maior Z_Score.
     """
     st.header("Ranking")
     columns_order = ["User", "Engagement_Total", "Views", "Likes", "Retweets", "Comments", "Bookmarks", "Link"]
     if all(col in df.columns for col in columns_order):
-        df_sorted = df[columns_order].sort_values(by="Engagement_Total", ascending=False).reset_index(drop=True)
+        df_sorted = df[columns_order].sort_values(by="Engagement_Total", ascending=False)
+        if post_flags is not None and "Post_ID" in df.columns:
+            df_sorted["Velocity_Alert_Z"] = df.loc[df_sorted.index, "Post_ID"].map(post_flags["Max_Z_Score"]).round(1)
+        df_sorted = df_sorted.reset_index(drop=True)
         st.dataframe(df_sorted)
     else:
         missing_cols = [col for col in columns_order if col not in df.columns]
         st.error(f"The DataFrame is missing the following columns required for ranking: {missing_cols}")
 
-def clean_dataframe(df):
+def plot_engagement_by_all_users_and_date(view, user_order=None, max_traces=CHART_MAX_TRACES,
+                                          max_points=CHART_MAX_POINTS):
     """
-    Limpa o DataFrame removendo colunas inválidas, NaNs e duplicados.
+    Plota o engajamento de todos os usuários ao longo do tempo,
+    com a legenda de usuários ordenada conforme ranking.
+    'view' é a matriz snapshots x usuários (ver engagement_matrix.py): cada série é uma coluna.
+    Só os 'max_traces' primeiros usuários ganham série própria; os demais são somados em "Others".
+    Cada série é reduzida a 'max_points' pontos com LTTB e desenhada em WebGL (Scattergl).
     """
-    debug_print("\n[DEBUG] Cleaning DataFrame...")
-
-    invalid_cols = [col for col in df.columns if "HEAD" in col or col.isspace()]
-    if invalid_cols:
-        debug_print(f"[DEBUG] Removing invalid columns: {invalid_cols}")
-        df = df.drop(columns=invalid_cols, errors="ignore")
-
-    critical_columns = [col for col in ["Date", "User", "Engagement_Total"] if col in df.columns]
-    debug_print(f"[DEBUG] Valid critical columns for cleaning: {critical_columns}")
+    if not len(view.timestamps):
+        st.warning("No data available to plot Engagement by User.")
+        return
 
-    if critical_columns:
-        df = df.dropna(subset=critical_columns)
+    sorted_users = user_order if user_order else ranking_order(view)
+    shown_users = sorted_users[:max_traces]
+    other_columns = [view.user_index[user] for user in sorted_users[max_traces:] if user in view.user_index]
 
-    for col in df.select_dtypes(include=["object"]).columns:
-        df[col] = df[col].str.strip().str.replace(r"<<<<<<< HEAD", "", regex=True)
+    timestamps = np.asarray(view.timestamps)
+    series = [(user, user_series(view, user).to_numpy(dtype="float64")) for user in shown_users]
+    if other_columns:
+        others = present_values(view.values[:, other_columns]).sum(axis=1).astype("float64")
+        series.append((f"Others ({len(other_columns)} users)", others))
 
-    duplicated_rows = df.duplicated().sum()
-    if duplicated_rows > 0:
-        debug_print(f"[DEBUG] Removing {duplicated_rows} duplicated rows.")
-        df = df.drop_duplicates()
+    fig = go.Figure()
+    for idx, (name, values) in enumerate(series):
+        visibility = True if idx < 10 else "legendonly"
+        x, y = downsample(timestamps, values, max_points)
+        fig.add_trace(go.Scattergl(
+            x=x,
+            y=y,
+            mode="lines+markers",
+            name=name,
+            visible=visibility,
+        ))
 
-    debug_print("[DEBUG] DataFrame after cleaning:")
-    debug_print(df.head())
-    debug_print(f"[DEBUG] Shape: {df.shape}")
-    debug_print(f"[DEBUG] Data types: {df.dtypes}")
-    if "User" in df.columns:
-        debug_print(f"[DEBUG] Unique values in 'User': {df['User'].unique()[:10]}")
+    fig.update_layout(
+        title=(
+            f"Engagement by User (Top 10 Initially, Top {max_traces} and Others in Legend)"
+            if other_columns else "Engagement by User (Top 10 Initially, All Users in Legend)"
+        ),
+        xaxis_title="Date",
+        yaxis_title="Total Engagement",
+        legend_title="Users (Ranked)",
+        xaxis_tickformat="%d/%m %H:%M",
+        xaxis_tickangle=-45,
+        autosize=False,
+        width=1600,
+        height=900,
+        margin=dict(l=40, r=40, t=50, b=100),
+    )
 
-    return df
+    st.plotly_chart(fig, use_container_width=True)
 
-def plot_engagement_by_all_users_and_date(df, user_order=None):
+def compute_rank_trajectories(view):
     """
-    Plota o engajamento de todos os usuários ao longo do tempo,
-    com a legenda de usuários ordenada conforme ranking.
+    Posição de cada usuário em cada snapshot (1 = maior engajamento), calculada de uma vez
+    com um argsort por linha da matriz snapshots x usuários.
+    Retorna uma matriz float (snapshots x usuários) com NaN onde o usuário não aparece;
+    quem aparece com engajamento zero continua com posição.
     """
-    df = clean_dataframe(df)
-    df["User"] = df["User"].str.strip().str.lower()
-
-    df["Datetime"] = pd.to_datetime(df["Date"], format="%d/%m %H:%M", errors="coerce")
-    df = df.dropna(subset=["Datetime"])
-    df = df.sort_values(by="Datetime")
-
-    grouped_df = df.groupby(["Datetime", "User"], as_index=False).agg({"Engagement_Total": "sum"})
-    pivot_df = grouped_df.pivot(index="Datetime", columns="User", values="Engagement_Total").fillna(0)
-
-    if user_order:
-        sorted_users = user_order
-    else:
-        ranking = (
-            df.groupby("User")["Engagement_Total"]
-            .sum()
-            .sort_values(ascending=False)
-        )
-        sorted_users = ranking.index.tolist()
+    values = np.asarray(view.values)
+    order = np.argsort(-values, axis=1, kind="stable")
+    ranks = np.empty(values.shape, dtype="float64")
+    positions = np.broadcast_to(np.arange(1, values.shape[1] + 1, dtype="float64"), values.shape)
+    np.put_along_axis(ranks, order, positions, axis=1)
+    ranks[values == MISSING] = np.nan
+    return ranks
+
+def plot_rank_trajectories(view, top_n=10):
+    """
+    Bump chart: trajetória de posição dos 'top_n' usuários do snapshot mais recente.
+    """
+    if not len(view.timestamps):
+        st.warning("No data available to plot Rank Trajectory.")
+        return
 
-    pivot_df = pivot_df[sorted_users]
+    ranks = compute_rank_trajectories(view)
+    latest = ranks[-1]
+    columns = np.argsort(np.where(np.isnan(latest), np.inf, latest), kind="stable")[:top_n]
+    columns = columns[~np.isnan(latest[columns])]
 
     fig = go.Figure()
-    for idx, user in enumerate(sorted_users):
-        visibility = True if idx < 10 else "legendonly"
+    for column in columns:
         fig.add_trace(go.Scatter(
-            x=pivot_df.index,
-            y=pivot_df[user],
+            x=view.timestamps,
+            y=ranks[:, column],
             mode="lines+markers",
-            name=user,
-            visible=visibility,
+            name=view.users[column],
         ))
 
     fig.update_layout(
-        title="Engagement by User (Top 10 Initially, All Users in Legend)",
+        title=f"Rank Trajectory (Top {top_n} in the Latest Snapshot)",
         xaxis_title="Date",
-        yaxis_title="Total Engagement",
+        yaxis_title="Rank",
+        yaxis_autorange="reversed",
         legend_title="Users (Ranked)",
         xaxis_tickformat="%d/%m %H:%M",
         xaxis_tickangle=-45,
@@ -458,14 +605,12 @@ def plot_engagement_by_all_users_and_date(df, user_order=None):
 
     st.plotly_chart(fig, use_container_width=True)
 
-def plot_engagement_components_from_latest_csv(latest_df):
+def plot_engagement_components_from_latest_csv(user_summary):
     """
     Plota a composição do engajamento (Comments, Retweets, Likes, Bookmarks) para os 25 usuários no topo.
+    'user_summary' é o resumo por usuário do snapshot (ver user_summary.py).
     """
-    engagement_metrics = latest_df.groupby("User")[["Comments", "Retweets", "Likes", "Bookmarks"]].sum()
-
-    top_users = engagement_metrics.sum(axis=1).sort_values(ascending=False).head(25).index
-    filtered_metrics = engagement_metrics.loc[top_users]
+    filtered_metrics = top_k(user_summary, "Components", 25)
 
     metrics = ["Comments", "Retweets", "Likes", "Bookmarks"]
     colors = ["#636EFA", "#EF553B", "#00CC96", "#AB63FA"]
@@ -498,15 +643,11 @@ def plot_engagement_components_from_latest_csv(latest_df):
 
     st.plotly_chart(fig, use_container_width=True)
 
-def plot_engagement_total_by_rank(df):
+def plot_engagement_total_by_rank(user_summary):
     """
     Plota o total de engajamento (scatter) ordenado por ranking.
     """
-    sorted_df = df.groupby("User", as_index=False)["Engagement_Total"] \
-                  .sum() \
-                  .sort_values(by="Engagement_Total", ascending=False) \
-                  .reset_index(drop=True)
-    sorted_df["Rank"] = sorted_df.index + 1
+    sorted_df = user_summary.reset_index()[["User", "Engagement_Total", "Rank"]]
 
     fig = px.scatter(
         sorted_df,
@@ -527,11 +668,11 @@ def plot_engagement_total_by_rank(df):
 
     st.plotly_chart(fig, use_container_width=True)
 
-def plot_likes_ranking(latest_df):
+def plot_likes_ranking(user_summary):
     """
     Plota um ranking de 'Likes' para os 25 usuários no topo.
     """
-    likes_ranking = latest_df.groupby("User")["Likes"].sum().reset_index().sort_values(by="Likes", ascending=False).head(25)
+    likes_ranking = top_k(user_summary, "Likes", 25).reset_index()
 
     fig = go.Figure()
     fig.add_trace(go.Bar(
@@ -554,11 +695,11 @@ def plot_likes_ranking(latest_df):
 
     st.plotly_chart(fig, use_container_width=True)
 
-def plot_views_ranking(latest_df):
+def plot_views_ranking(user_summary):
     """
     Plota um ranking de 'Views' para os 25 usuários no topo.
     """
-    views_ranking = latest_df.groupby("User")["Views"].sum().reset_index().sort_values(by="Views", ascending=False).head(25)
+    views_ranking = top_k(user_summary, "Views", 25).reset_index()
 
     fig = go.Figure()
     fig.add_trace(go.Bar(
@@ -581,45 +722,33 @@ def plot_views_ranking(latest_df):
 
     st.plotly_chart(fig, use_container_width=True)
 
-def plot_engagement_total_by_date(directories):
+def plot_engagement_total_by_date(directories, start=None, end=None, max_points=CHART_MAX_POINTS):
     """
-    Plota o engajamento total por data, obtendo dados de todos os CSVs nos diretórios informados.
+    Plota o engajamento total por data, a partir do índice de agregados dos CSVs nos diretórios informados.
+    Com 'start'/'end', só os snapshots dentro da janela entram. A série é reduzida a 'max_points'
+    pontos com LTTB e desenhada em WebGL (Scattergl).
     """
-    engagement_data = []
-    for directory in directories:
-        if not os.path.isdir(directory):
-            debug_print(f"[WARNING] Directory not found: {directory}")
-            continue
-        files = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".csv")]
-        if not files:
-            debug_print(f"[WARNING] No CSV files found in {directory}.")
-            continue
-        for file in files:
-            debug_print(f"[DEBUG] Processing file for total engagement by date: {file}")
-            try:
-                df = pd.read_csv(file)
-                df = ensure_engagement_total(df)
-                total_engagement = df["Engagement_Total"].sum()
-                date = extract_datetime_from_filename(os.path.basename(file))
-                if pd.isna(date):
-                    debug_print(f"[WARNING] Invalid date extracted from filename: {file}. Skipping.")
-                    continue
-                engagement_data.append({"Date": date, "Total_Engagement": total_engagement})
-            except Exception as e:
-                debug_print(f"[ERROR] Failed to process {file}: {e}")
+    snapshots = get_snapshot_catalog().in_range(directories, start, end)
+    aggregates = load_aggregates([snapshot.path for snapshot in snapshots])
+    engagement_data = [
+        {"Date": snapshot.timestamp, "Total_Engagement": entry["totals"]["Engagement_Total"]}
+        for snapshot, entry in zip(snapshots, aggregates)
+        if entry is not None
+    ]
 
     if not engagement_data:
         st.warning("No data available to plot Total Engagement by Date.")
         return
 
-    engagement_df = pd.DataFrame(engagement_data).sort_values(by="Date")
+    engagement_df = pd.DataFrame(engagement_data)
     debug_print("[DEBUG] Engagement DataFrame for Total Engagement by Date:")
     debug_print(engagement_df.head())
 
+    dates, totals = downsample(engagement_df["Date"].to_numpy(), engagement_df["Total_Engagement"].to_numpy(), max_points)
     fig = go.Figure()
-    fig.add_trace(go.Scatter(
-        x=engagement_df["Date"],
-        y=engagement_df["Total_Engagement"],
+    fig.add_trace(go.Scattergl(
+        x=dates,
+        y=totals,
         mode='lines+markers',
         line=dict(color='green'),
     ))
@@ -637,21 +766,209 @@ def plot_engagement_total_by_date(directories):
 
     st.plotly_chart(fig, use_container_width=True)
 
-def plot_top_post_by_user(df):
+def plot_engagement_distribution(directories, rank, start=None, end=None):
     """
-    Plota o post de maior engajamento para cada usuário (bar chart).
+    Distribuição do engajamento por usuário, a partir dos sketches de quantis do índice de
+    agregados, e engajamento da posição 'rank', exato, a partir dos 'top_users' de cada
+    snapshot (o sketch só responde percentis). Nenhum snapshot é relido.
+    Com 'start'/'end', só os snapshots dentro da janela entram.
+    """
+    snapshots = get_snapshot_catalog().in_range(directories, start, end)
+    aggregates = load_aggregates([snapshot.path for snapshot in snapshots])
+    entries = [
+        (snapshot.timestamp, entry)
+        for snapshot, entry in zip(snapshots, aggregates)
+        if entry is not None and "engagement_sketch" in entry
+    ]
+    sketches = [(timestamp, KLLSketch.from_dict(entry["engagement_sketch"])) for timestamp, entry in entries]
+    if not sketches:
+        st.warning("No data available to plot Engagement Distribution.")
+        return
+
+    latest_timestamp, latest_sketch = sketches[-1]
+    merged = merge_sketches(sketch for _, sketch in sketches)
+    latest_value = top_user_value(entries[-1][1], rank)
+    col1, col2 = st.columns(2)
+    col1.metric(f"Rank {rank} needs (latest)", "-" if latest_value is None else f"{latest_value:,.0f}")
+    col2.metric("Median per user (window)", f"{merged.quantile(0.5):,.0f}")
+
+    percentiles = np.arange(0, 101)
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=percentiles,
+        y=merged.quantiles(percentiles / 100),
+        mode='lines',
+        name="All snapshots in the window",
+    ))
+    fig.add_trace(go.Scatter(
+        x=percentiles,
+        y=latest_sketch.quantiles(percentiles / 100),
+        mode='lines',
+        name=f"Latest ({latest_timestamp:%d/%m %H:%M})",
+    ))
+    fig.update_layout(
+        title="Engagement per User by Percentile",
+        xaxis_title="Percentile",
+        yaxis_title="Engagement Total",
+        yaxis_type="log",
+        autosize=False,
+        width=1600,
+        height=600,
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    thresholds = [(timestamp, top_user_value(entry, rank)) for timestamp, entry in entries]
+    thresholds = [(timestamp, value) for timestamp, value in thresholds if value is not None]
+    if thresholds:
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(
+            x=[timestamp for timestamp, _ in thresholds],
+            y=[value for _, value in thresholds],
+            mode='lines+markers',
+        ))
+        fig.update_layout(
+            title=f"Engagement Needed for Rank {rank}",
+            xaxis_title="Date",
+            yaxis_title="Engagement Total",
+            xaxis_tickangle=-45,
+            autosize=False,
+            width=1600,
+            height=600,
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+def display_unique_creators(directories, start=None, end=None, exact=False):
     """
-    df = clean_dataframe(df)
-    df["User"] = df["User"].str.strip().str.lower()
+    Usuários únicos na seleção, por dia, por semana e na campanha inteira, a partir dos
+    HyperLogLogs do índice de agregados. Com 'exact', confere a contagem da seleção
+    lendo a coluna User de todos os snapshots.
+    """
+    catalog = get_snapshot_catalog()
+    campaign = catalog.snapshots(list(week_directories.values()))
+    sketches = {
+        snapshot.path: entry.get("users_sketch")
+        for snapshot, entry in zip(campaign, load_aggregates([snapshot.path for snapshot in campaign]))
+        if entry is not None
+    }
+    selection = catalog.in_range(directories, start, end)
+    if not selection:
+        st.warning("No data available for Unique Creators.")
+        return
+
+    selection_sketch = merge_counts(sketches.get(snapshot.path) for snapshot in selection)
+    campaign_sketch = merge_counts(sketches.values())
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Unique Creators (selection)", f"≈ {selection_sketch.count():,}")
+    col2.metric("Unique Creators (campaign to date)", f"≈ {campaign_sketch.count():,}")
+    if exact:
+        col3.metric("Unique Creators (selection, exact)", f"{count_unique_users(directories, start, end):,}")
+    else:
+        col3.metric("Error Bound", f"± {selection_sketch.relative_error:.1%}")
+
+    days = {}
+    weeks = {}
+    week_names = {path: week for week, path in week_directories.items()}
+    for snapshot in selection:
+        days.setdefault(snapshot.timestamp.date(), []).append(sketches.get(snapshot.path))
+        weeks.setdefault(week_names.get(snapshot.directory, snapshot.directory), []).append(sketches.get(snapshot.path))
+    daily = pd.DataFrame({
+        "Date": list(days),
+        "Unique_Creators": [merge_counts(day).count() for day in days.values()],
+    })
+
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=daily["Date"], y=daily["Unique_Creators"], text=daily["Unique_Creators"], textposition='auto'))
+    fig.update_layout(
+        title="Unique Creators per Day",
+        xaxis_title="Date",
+        yaxis_title="Unique Creators",
+        autosize=False,
+        width=1600,
+        height=500,
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    if len(weeks) > 1:
+        st.dataframe(pd.DataFrame({
+            "Week": list(weeks),
+            "Unique_Creators": [merge_counts(week).count() for week in weeks.values()],
+        }))
+
+def display_velocity_anomalies(directories, start=None, end=None):
+    """
+    Exibe os posts cujo ganho por hora ficou muito acima do normal (ver velocity_anomalies.py).
+    """
+    flags = get_velocity_monitor().flags(directories, start, end)
+    if flags.empty:
+        st.success("No velocity anomalies in the selected period.")
+        return
+    st.warning(f"{flags['Post_ID'].nunique()} posts with abnormal engagement growth.")
+    columns_order = ["Datetime", "User", "Gain", "Velocity", "Baseline_Mean", "Baseline_Std", "Z_Score", "Scope", "Link"]
+    st.dataframe(flags[columns_order].round({"Velocity": 1, "Baseline_Mean": 1, "Baseline_Std": 1, "Z_Score": 1}))
+
+def display_top_movers(directories, n=10):
+    """
+    Exibe os usuários e posts que mais cresceram desde a coleta anterior.
+    """
+    engine = get_delta_engine()
+    user_movers = engine.top_movers(directories, level="users", n=n)
+    post_movers = engine.top_movers(directories, level="posts", n=n)
+    if user_movers is None or user_movers.empty:
+        st.warning("No previous snapshot to compare against.")
+        return
+
+    st.caption(f"Snapshot {user_movers['Snapshot_ID'].iloc[0]} vs {user_movers['Previous_ID'].iloc[0] or 'start'}")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Users")
+        st.dataframe(user_movers[["User", "Engagement_Total", "Engagement_Total_Delta", "Views_Delta", "Likes_Delta"]])
+    with col2:
+        st.subheader("Posts")
+        if post_movers is not None and not post_movers.empty:
+            st.dataframe(post_movers[["User", "Link", "Engagement_Total", "Engagement_Total_Delta", "Views_Delta", "Likes_Delta"]])
+
+def plot_growth_over_hours(directories, hours, top_n=25):
+    """
+    Plota o crescimento do engajamento de cada usuário nas últimas 'hours' horas (top N).
+    """
+    growth = get_delta_engine().growth(directories, hours, level="users", n=top_n)
+    if growth is None or growth.empty:
+        st.warning("No data available to plot growth.")
+        return
+
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=growth["User"],
+        y=growth["Engagement_Total_Delta"],
+        text=growth["Engagement_Total_Delta"],
+        textposition='auto',
+    ))
+
+    fig.update_layout(
+        title=f"Engagement Growth over the Last {hours} Hours (Top {top_n})",
+        xaxis_title="User",
+        yaxis_title="Engagement Growth",
+        xaxis_tickangle=-45,
+        autosize=False,
+        width=1600,
+        height=900,
+        margin=dict(l=40, r=40, t=50, b=100),
+    )
 
-    top_posts = df.loc[df.groupby("User")["Engagement_Total"].idxmax()]
-    top_posts = top_posts.sort_values(by="Engagement_Total", ascending=False)
+    st.plotly_chart(fig, use_container_width=True)
+
+def plot_top_post_by_user(user_summary):
+    """
+    Plota o post de maior engajamento para cada usuário (bar chart).
+    Cada post (Post_ID) entra uma única vez, mesmo que apareça com Links diferentes.
+    """
+    top_posts = top_k(user_summary, "Top_Post_Engagement", len(user_summary)).reset_index()
 
     fig = go.Figure()
     fig.add_trace(go.Bar(
         x=top_posts["User"],
-        y=top_posts["Engagement_Total"],
-        text=top_posts["Engagement_Total"],
+        y=top_posts["Top_Post_Engagement"],
+        text=top_posts["Top_Post_Engagement"],
         textposition='auto',
     ))
 
@@ -668,18 +985,78 @@ def plot_top_post_by_user(df):
 
     st.plotly_chart(fig, use_container_width=True)
 
+def display_user_drilldown(directories):
+    """
+    Busca de usuário por prefixo do handle e histórico dos seus posts em todos os snapshots.
+    """
+    user_index = get_user_index()
+    query = st.text_input("Search user:", placeholder="@handle")
+    matches = user_index.search(directories, query, limit=50)
+    if not matches:
+        st.info("No users match this search.")
+        return
+    user = st.selectbox("User:", matches)
+    history = user_index.history(directories, user)
+    if history.empty:
+        st.info("No history for this user.")
+        return
+
+    latest = history[history["Datetime"] == history["Datetime"].max()]
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Engagement (latest)", f"{int(latest['Engagement_Total'].sum()):,}")
+    col2.metric("Posts (latest)", f"{len(latest):,}")
+    col3.metric("Snapshots", f"{history['Snapshot_ID'].nunique():,}")
+
+    history = history.assign(Link=history["Link"].astype(str))
+    fig = px.line(
+        history,
+        x="Datetime",
+        y="Engagement_Total",
+        color="Link",
+        markers=True,
+        title=f"Post History of {user}",
+    )
+    fig.update_layout(showlegend=False, autosize=False, width=1600, height=600)
+    st.plotly_chart(fig, use_container_width=True)
+
+    columns_order = ["Datetime", "Link", "Engagement_Total", "Views", "Likes", "Retweets", "Comments", "Bookmarks"]
+    st.dataframe(history[columns_order].sort_values(["Datetime", "Engagement_Total"], ascending=False).reset_index(drop=True))
+
+    # Histórico de um post pelo índice de posts: todas as aparições do status ID,
+    # inclusive com outro Link (.../photo/1) ou outro valor em 'User'
+    posts = history[history["Post_ID"] != 0].drop_duplicates(subset=["Post_ID"], keep="last")
+    if posts.empty:
+        return
+    links = dict(zip(posts["Post_ID"], posts["Link"]))
+    post_id = st.selectbox("Post:", list(links), format_func=lambda value: links[value])
+    post_history = get_post_index().history(directories, post_id)
+    if post_history.empty:
+        st.info("No history for this post.")
+        return
+    metrics = ["Engagement_Total", "Views", "Likes", "Retweets", "Comments", "Bookmarks"]
+    fig = px.line(
+        post_history.melt(id_vars="Datetime", value_vars=metrics, var_name="Metric", value_name="Value"),
+        x="Datetime",
+        y="Value",
+        color="Metric",
+        markers=True,
+        title=f"History of {links[post_id]}",
+    )
+    fig.update_layout(autosize=False, width=1600, height=600)
+    st.plotly_chart(fig, use_container_width=True)
+
 # Bloco principal de execução
 try:
     if selected_week == 'All Weeks':
         # Exibir dados consolidados
         latest_df = week_data
-        second_latest_df = None
-        differences = calculate_differences(latest_df, second_latest_df)
+        second_latest_aggregates = None
+        differences = calculate_differences(compute_aggregates(latest_df), second_latest_aggregates)
         timestamp = time.strftime("%d/%m/%Y %H:%M:%S")
     else:
-        # Carrega CSV mais recente e segundo mais recente para a semana selecionada
-        latest_df, second_latest_df, latest_file, second_latest_file = load_latest_and_second_latest_csv(CSV_DIRS)
-        differences = calculate_differences(latest_df, second_latest_df)
+        # Carrega os agregados do CSV mais recente e do segundo mais recente para a semana selecionada
+        latest_aggregates, second_latest_aggregates, latest_file, second_latest_file = load_latest_and_second_latest_aggregates(CSV_DIRS)
+        differences = calculate_differences(latest_aggregates, second_latest_aggregates)
         timestamp = extract_datetime_from_filename(os.path.basename(latest_file)).strftime("%d/%m/%Y %H:%M:%S")
 
 except FileNotFoundError as e:
@@ -693,19 +1070,13 @@ except Exception as e:
 if selected_week != 'All Weeks':
     try:
         latest_df, latest_file = load_latest_csv(CSV_DIRS)
-        latest_df["User"] = latest_df["User"].str.strip().str.lower()
         timestamp = extract_datetime_from_filename(os.path.basename(latest_file)).strftime("%d/%m/%Y %H:%M:%S")
     except Exception as e:
         st.error(f"Error loading latest CSV: {e}")
         st.stop()
 
-latest_ranking = (
-    latest_df.groupby("User")["Engagement_Total"]
-    .sum()
-    .sort_values(ascending=False)
-    .head(10)
-    .index.tolist()
-)
+# Resumo por usuário do snapshot mais recente: um único groupby, lido por todos os widgets
+user_summary = summarize_users(latest_df)
 
 user_order = latest_df['User'].drop_duplicates().tolist()
 
@@ -715,60 +1086,108 @@ st.write(
 )
 
 # Exibe métricas de resumo
-display_summary_metrics(latest_df, second_latest_df, differences)
+display_summary_metrics(latest_df, second_latest_aggregates, differences)
 
-# Se selecionar "All Weeks", não mostra os gráficos detalhados
-if selected_week != 'All Weeks':
-    # Carrega todos os CSVs para plotar evolução
-    all_data_df = load_all_csv_files(CSV_DIRS)
-
-    # Top 10 usuários por engajamento
-    ranking = (
-        latest_df.groupby("User")["Engagement_Total"]
-        .sum()
-        .sort_values(ascending=False)
-    )
-    top_10_users = ranking.head(10).index.tolist()
-    top_10_users = [user.strip().lower() for user in top_10_users]
+_evolution_views = {}  # por rerun: o script roda do início a cada interação
 
-    st.header("Engagement by User (Top 10)")
-    try:
-        plot_engagement_by_all_users_and_date(all_data_df, user_order=user_order)
-    except Exception as e:
-        st.error(f"Error plotting Engagement by User (Top 10): {e}")
+def evolution_view(directories, start=None, end=None):
+    """
+    Matriz snapshots x usuários da janela, reduzida para os gráficos de evolução: todos os
+    snapshots em janelas curtas, o último de cada hora/dia (ver engagement_matrix.bucket_rows)
+    em janelas longas. Calculada uma vez por rerun, na primeira
+    seção aberta que a usa.
+    """
+    key = (tuple(directories), start, end)
+    if key not in _evolution_views:
+        view = select_window(get_engagement_matrix().view(directories), start, end)
+        granularity = select_granularity(view.timestamps[0], view.timestamps[-1]) if len(view.timestamps) else "raw"
+        debug_print(f"[DEBUG] Evolution chart granularity: {granularity}")
+        _evolution_views[key] = select_rows(view, bucket_rows(view.timestamps, granularity))
+    return _evolution_views[key]
 
-    st.header("Engagement of Top 25 (Components)")
-    try:
-        plot_engagement_components_from_latest_csv(latest_df)
-    except Exception as e:
-        st.error(f"Error plotting Engagement Components: {e}")
 
-    st.header("Total Engagement by Ranking Order")
+def lazy_section(title, render, expanded=SECTIONS_EXPANDED):
+    """
+    Seção recolhível: 'render' (preparação dos dados e gráfico) só roda com a seção aberta.
+    Abrir ou fechar a seção dispara um rerun; o estado fica na sessão, pela chave da seção.
+    """
+    section = st.expander(title, expanded=expanded, key=f"section_{title}", on_change="rerun")
+    with section:
+        if not section.open:
+            return
+        try:
+            render()
+        except Exception as e:
+            st.error(f"Error loading {title}: {e}")
+
+def growth_section():
+    growth_hours = st.slider("Hours", min_value=1, max_value=168, value=24, step=1)
+    plot_growth_over_hours(CSV_DIRS, growth_hours)
+
+def rank_trajectory_section():
+    rank_top_n = st.slider("Users", min_value=3, max_value=25, value=10, step=1)
+    plot_rank_trajectories(evolution_view(CSV_DIRS, window_start, window_end), top_n=rank_top_n)
+
+def full_ranking_section():
     try:
-        plot_engagement_total_by_rank(latest_df)
+        ranking_flags = get_velocity_monitor().post_flags(CSV_DIRS)
     except Exception as e:
-        st.error(f"Error plotting Total Engagement by Rank: {e}")
+        debug_print(f"[ERROR] Failed to load velocity flags: {e}")
+        ranking_flags = None
+    display_full_ranking(latest_df, ranking_flags)
 
-    st.header("Likes Ranking (Top 25)")
-    try:
-        plot_likes_ranking(latest_df)
-    except Exception as e:
-        st.error(f"Error plotting Likes Ranking: {e}")
+def distribution_section():
+    distribution_rank = st.number_input("Rank N:", min_value=1, max_value=TOP_USERS, value=10, step=1)
+    plot_engagement_distribution(CSV_DIRS, int(distribution_rank), window_start, window_end)
 
-    st.header("Views Ranking (Top 25)")
-    try:
-        plot_views_ranking(latest_df)
-    except Exception as e:
-        st.error(f"Error plotting Views Ranking: {e}")
+def unique_creators_section():
+    exact_unique_creators = st.checkbox("Validate with exact count (reads every snapshot)")
+    display_unique_creators(CSV_DIRS, window_start, window_end, exact=exact_unique_creators)
 
-    st.header("Total Engagement by Date")
-    try:
-        plot_engagement_total_by_date(CSV_DIRS)
-    except Exception as e:
-        st.error(f"Error plotting Total Engagement by Date: {e}")
+# Cada gráfico fica numa seção recolhível: a primeira pintura só tem as métricas de resumo,
+# e os dados de um gráfico só são preparados quando a seção dele é aberta
+# (os motores compartilhados — matriz, deltas, agregados — guardam o resultado entre reruns)
+if selected_week != 'All Weeks':
+    lazy_section("Engagement by User (Top 10)", lambda: plot_engagement_by_all_users_and_date(
+        evolution_view(CSV_DIRS, window_start, window_end), user_order=user_order
+    ))
+    lazy_section("Rank Trajectory", rank_trajectory_section)
+    lazy_section("Engagement of Top 25 (Components)", lambda: plot_engagement_components_from_latest_csv(user_summary))
+    lazy_section("Total Engagement by Ranking Order", lambda: plot_engagement_total_by_rank(user_summary))
+    lazy_section("Likes Ranking (Top 25)", lambda: plot_likes_ranking(user_summary))
+    lazy_section("Views Ranking (Top 25)", lambda: plot_views_ranking(user_summary))
+    lazy_section("Total Engagement by Date", lambda: plot_engagement_total_by_date(CSV_DIRS, window_start, window_end))
+    lazy_section("Top Movers Since Last Scrape", lambda: display_top_movers(CSV_DIRS))
+    lazy_section("Growth over the Last N Hours", growth_section)
+    lazy_section("Top Post by User", lambda: plot_top_post_by_user(user_summary))
+    lazy_section("Full Ranking", full_ranking_section)
+else:
+    # Visão da campanha inteira: só o índice de agregados dos snapshots dentro da janela é lido
+    lazy_section("Total Engagement by Date", lambda: plot_engagement_total_by_date(CSV_DIRS, window_start, window_end))
+
+lazy_section("Engagement Distribution", distribution_section)
+lazy_section("Unique Creators", unique_creators_section)
+lazy_section("Velocity Anomalies", lambda: display_velocity_anomalies(CSV_DIRS, window_start, window_end))
+lazy_section("User Drill-down", lambda: display_user_drilldown(CSV_DIRS))
+
+# Com a tela pronta, aquece em segundo plano as outras semanas (as vizinhas primeiro)
+# ("All Weeks" não está na lista: todas as semanas entram, na ordem)
+prefetch_weeks = neighbours_first(week_directories, selected_week)
+get_prefetcher().prefetch([(week, week_prefetch_steps(week_directories[week])) for week in prefetch_weeks])
+
+@st.fragment(run_every=STORE_REFRESH_SECONDS)
+def refresh_on_new_snapshots():
+    """
+    Verifica periodicamente a versão do store (snapshot_watcher.py) e recarrega a página
+    quando chega um snapshot novo. Cada verificação lê só um JSON pequeno.
+    """
+    if read_store_version() != st.session_state.get("store_version"):
+        st.rerun()
+
+st.session_state["store_version"] = read_store_version()
+refresh_on_new_snapshots()
 
-    plot_top_post_by_user(latest_df)
-    display_full_ranking(latest_df)
+debug_print(f"[DEBUG] Snapshot cache stats: {get_snapshot_cache().stats()}")
 
 # Fórmula do engajamento
 st.write("Total Engagement = Views + (Comments x 6) + (Retweets x 3) + (Likes x 2) + (Bookmarks).")
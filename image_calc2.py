@@ -3,6 +3,9 @@ import csv
 import streamlit as st
 import pandas as pd
 
+from snapshot_schema import SnapshotSchemaError, dedupe_posts, post_ids, read_snapshot_csv, resolve_columns
+from velocity_anomalies import update_velocity
+
 def get_csv_files(folder_path="."):
     """
     Retorna uma lista de arquivos CSV no diretório especificado.
@@ -44,6 +47,18 @@ def get_csv_files(folder_path="."):
     
     return []
 
+def load_velocity_flags(folder_name="."):
+    """
+    Maior Z_Score de velocidade de cada post marcado na pasta (ver velocity_anomalies.py).
+    Retorna {Post_ID: Z_Score}; vazio se a pasta não puder ser processada.
+    """
+    try:
+        _, flags = update_velocity(os.path.abspath(folder_name))
+    except Exception as e:
+        st.warning(f"Não foi possível verificar anomalias de velocidade: {e}")
+        return {}
+    return flags.groupby("Post_ID")["Z_Score"].max().to_dict()
+
 def process_week(folder_name=".", min_engagement=500, weights=None, csv_file=None):
     """
     Processa os dados do CSV especificado ou do último CSV encontrado na pasta.
@@ -74,52 +89,12 @@ def process_week(folder_name=".", min_engagement=500, weights=None, csv_file=Non
     user_data = {}
     
     try:
-        # Tentar ler o arquivo como DataFrame com pandas primeiro
-        df = pd.read_csv(file_path, encoding='utf-8')
-        
-        # Verificar as colunas disponíveis
-        columns = list(df.columns)
-        st.write("Colunas disponíveis:", columns)
-        
-        # Identificar colunas de usuário e engajamento
-        user_col = next((col for col in columns if col.lower() in ['user', 'usuario', 'usuário']), None)
-        engagement_col = next((col for col in columns if col.lower() in ['engagement_total', 'engagement']), None)
-        link_col = next((col for col in columns if col.lower() in ['link', 'url']), None)
-        
-        if not all([user_col, engagement_col, link_col]):
-            st.error(f"Colunas necessárias não encontradas. Encontradas: {columns}")
-            return {}, {}, {}
-        
-        # Processar cada linha do DataFrame
-        for _, row in df.iterrows():
-            user = str(row[user_col]).strip()
-            user_lower = user.lower()  # Normalizar para comparação case-insensitive
-            
-            try:
-                engagement = int(row[engagement_col])
-            except (ValueError, TypeError):
-                engagement = 0
-            
-            # Filtra pelo engajamento mínimo
-            if engagement < min_engagement:
-                continue
-            
-            link = str(row[link_col]).strip()
-            
-            # Se o usuário já existir, guarda apenas o post com maior engajamento
-            if user_lower in user_data:
-                if engagement > user_data[user_lower]["engagement"]:
-                    user_data[user_lower]["engagement"] = engagement
-                    user_data[user_lower]["links"] = [link] if link else []
-                    # Mantém o nome original com a capitalização original
-                    user_data[user_lower]["nome_original"] = user
-            else:
-                user_data[user_lower] = {
-                    "nome_original": user,
-                    "engagement": engagement, 
-                    "links": [link] if link else []
-                }
-                
+        # Lê apenas as colunas usadas no ranking, com os tipos do esquema dos snapshots.
+        # O cabeçalho é validado antes de ler o restante do arquivo.
+        df = read_snapshot_csv(file_path, columns=["User", "Engagement_Total", "Link"])
+    except SnapshotSchemaError as e:
+        st.error(f"Colunas necessárias não encontradas: {e}")
+        return {}, {}, {}
     except Exception as e:
         st.error(f"Erro ao processar o arquivo CSV: {str(e)}")
         # Tentar com o método original usando csv.DictReader
@@ -128,47 +103,64 @@ def process_week(folder_name=".", min_engagement=500, weights=None, csv_file=Non
                 reader = csv.DictReader(csvfile)
                 columns = reader.fieldnames
                 
-                # Identificar colunas
-                user_col = next((col for col in columns if col.lower() in ['user', 'usuario', 'usuário']), None)
-                engagement_col = next((col for col in columns if col.lower() in ['engagement_total', 'engagement']), None)
-                link_col = next((col for col in columns if col.lower() in ['link', 'url']), None)
+                # Identificar colunas pelos nomes (e aliases) do esquema
+                names = {canonical: name for name, canonical in resolve_columns(columns).items()}
+                user_col = names.get("User")
+                engagement_col = names.get("Engagement_Total")
+                link_col = names.get("Link")
                 
                 if not all([user_col, engagement_col, link_col]):
                     st.error(f"Colunas necessárias não encontradas. Encontradas: {columns}")
                     return {}, {}, {}
                 
+                rows = []
                 for row in reader:
-                    user = row.get(user_col, "").strip()
-                    user_lower = user.lower()  # Normalizar para comparação case-insensitive
-                    
                     try:
                         engagement = int(row.get(engagement_col, 0))
                     except (ValueError, KeyError):
                         engagement = 0
-                    
-                    # Filtra pelo engajamento mínimo
-                    if engagement < min_engagement:
-                        continue
-                    
-                    link = row.get(link_col, "").strip()
-                    
-                    # Se o usuário já existir, guarda apenas o post com maior engajamento
-                    if user_lower in user_data:
-                        if engagement > user_data[user_lower]["engagement"]:
-                            user_data[user_lower]["engagement"] = engagement
-                            user_data[user_lower]["links"] = [link] if link else []
-                            # Mantém o nome original com a capitalização original
-                            user_data[user_lower]["nome_original"] = user
-                    else:
-                        user_data[user_lower] = {
-                            "nome_original": user,
-                            "engagement": engagement, 
-                            "links": [link] if link else []
-                        }
+                    rows.append({
+                        "User": row.get(user_col, ""),
+                        "Engagement_Total": engagement,
+                        "Link": row.get(link_col, ""),
+                    })
+                df = pd.DataFrame(rows, columns=["User", "Engagement_Total", "Link"])
         except Exception as e2:
             st.error(f"Falha no método alternativo também: {str(e2)}")
             return {}, {}, {}
     
+    # O mesmo post pode aparecer com Links diferentes (.../status/<id> e .../status/<id>/photo/1);
+    # cada status ID entra uma única vez, com o maior engajamento registrado
+    df["Post_ID"] = post_ids(df["Link"])
+    df = dedupe_posts(df)
+    
+    # Processar cada linha do DataFrame
+    for user, engagement, link in zip(df["User"], df["Engagement_Total"], df["Link"]):
+        user = str(user).strip()
+        user_lower = user.lower()  # Normalizar para comparação case-insensitive
+        
+        engagement = int(engagement)
+        
+        # Filtra pelo engajamento mínimo
+        if engagement < min_engagement:
+            continue
+        
+        link = str(link).strip()
+        
+        # Se o usuário já existir, guarda apenas o post com maior engajamento
+        if user_lower in user_data:
+            if engagement > user_data[user_lower]["engagement"]:
+                user_data[user_lower]["engagement"] = engagement
+                user_data[user_lower]["links"] = [link] if link else []
+                # Mantém o nome original com a capitalização original
+                user_data[user_lower]["nome_original"] = user
+        else:
+            user_data[user_lower] = {
+                "nome_original": user,
+                "engagement": engagement, 
+                "links": [link] if link else []
+            }
+    
     if not user_data:
         st.warning("Nenhum dado encontrado que atenda aos critérios de engajamento mínimo.")
         return {}, {}, {}
@@ -345,16 +337,33 @@ if ranking_users:
 
         st.write(f"- **{user}** (Rank {rank}): {ganho:.2f} USD ({percentage:.2f}%) | Links: {aggregated_links.get(user, '')}")
 
+    # Posts premiados com crescimento anormal de engajamento (possível inflação por bots).
+    # Os alertas vêm do histórico da pasta: só valem quando o ranking também veio dela
+    from_folder = not (use_uploaded and uploaded_file)
+    velocity_flags = load_velocity_flags(folder) if from_folder else {}
+    link_ids = dict(zip(user_links, post_ids(pd.Series(list(user_links.values()), dtype=str)))) if user_links else {}
+    user_alerts = {user: velocity_flags.get(post_id) for user, post_id in link_ids.items()}
+    flagged_users = [user for user, z_score in user_alerts.items() if z_score is not None]
+    if flagged_users:
+        st.warning(
+            "Posts com crescimento anormal de engajamento (revisar antes do pagamento): "
+            + ", ".join(f"{user} (z={user_alerts[user]:.1f})" for user in flagged_users)
+        )
+
     st.subheader("Ranking dos Usuários que Mais Ganharam")
     ranking_data = []
     for user, earnings in user_earnings.items():
         total = earnings[week_name]
-        ranking_data.append({
+        row = {
             "Usuário": user,
             week_name: earnings[week_name],
             "Valor Total (USD)": total,
-            "Links": user_links.get(user, "")
-        })
+            "Links": user_links.get(user, ""),
+        }
+        if from_folder:
+            z_score = user_alerts.get(user)
+            row["Alerta de Velocidade"] = f"z={z_score:.1f}" if z_score is not None else ""
+        ranking_data.append(row)
 
     ranking_df = pd.DataFrame(ranking_data).sort_values(by="Valor Total (USD)", ascending=False).reset_index(drop=True)
     ranking_df.index += 1
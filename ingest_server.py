@@ -0,0 +1,352 @@
+"""
+Servidor HTTP (só biblioteca padrão) para o scraper enviar snapshots sem passar pelo git.
+
+Cada requisição é um snapshot completo (as linhas de um *_ranked_results.csv), em CSV
+ou em JSON lines (um objeto por linha). O payload é validado contra o esquema dos
+snapshots (snapshot_schema.normalize_frame) e vai para um buffer em memória; uma
+thread grava o buffer em lotes: cada snapshot vira csv_week<N>/<id>_ranked_results.csv
+(o mesmo layout dos arquivos do git) e o lote inteiro é processado de uma vez pelo
+SnapshotWatcher (ingestão, agregados, deltas, matriz...) com uma única nova versão
+do store, que os dashboards abertos detectam sozinhos.
+
+Endpoints:
+    POST /snapshots?week=Week2[&timestamp=YYYYMMDD_HHMMSS]   corpo CSV (text/csv) ou
+                                                             JSON lines (application/x-ndjson)
+    POST /flush                                              grava o buffer agora
+    GET  /health                                             estado do buffer e versão do store
+
+Payloads com o mesmo week/timestamp enviados dentro do mesmo lote são concatenados
+(envio em partes). Sem timestamp, vale o horário de chegada. Um snapshot aceito (202)
+só sai do buffer depois de gravado: se a gravação falhar, ele volta para o buffer e o
+lote é tentado de novo. Se a ingestão de uma pasta falhar, ela continua pendente e é
+processada de novo no lote seguinte; a versão do store só muda quando a pasta é processada
+sem erros. Se SNAPSHOT_INGEST_TOKEN estiver definido, as requisições precisam de
+'Authorization: Bearer <token>'.
+
+Uso:
+    python ingest_server.py serve                       # 127.0.0.1:8765
+    curl -X POST --data-binary @20250225_104457_ranked_results.csv -H "Content-Type: text/csv" \\
+        "http://127.0.0.1:8765/snapshots?week=Week2&timestamp=20250225_104457"
+"""
+import argparse
+import io
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from snapshot_schema import SnapshotSchemaError, normalize_frame
+from snapshot_store import (
+    BASE_DIR,
+    SNAPSHOT_SUFFIX,
+    STORE_DIR,
+    WEEK_DIRECTORY_PATTERN,
+    _tmp_path,
+    debug_print,
+)
+from snapshot_watcher import SnapshotWatcher, bump_store_version, read_store_version
+
+BATCH_SECONDS = float(os.getenv("SNAPSHOT_INGEST_BATCH_SECONDS", "2"))
+BATCH_MAX_SNAPSHOTS = int(os.getenv("SNAPSHOT_INGEST_BATCH_SNAPSHOTS", "50"))
+MAX_BODY_BYTES = int(os.getenv("SNAPSHOT_INGEST_MAX_MB", "64")) * 1024 * 1024
+INGEST_TOKEN = os.getenv("SNAPSHOT_INGEST_TOKEN")
+SNAPSHOT_ID_FORMAT = "%Y%m%d_%H%M%S"
+
+class PayloadError(ValueError):
+    """
+    Requisição inválida (parâmetros, formato ou esquema); vira uma resposta 4xx.
+    """
+
+    def __init__(self, message, status=HTTPStatus.BAD_REQUEST):
+        super().__init__(message)
+        self.status = status
+
+def parse_payload(body, content_type):
+    """
+    Converte o corpo (CSV ou JSON lines) em um DataFrame no esquema dos snapshots.
+    """
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    try:
+        if content_type in ("application/x-ndjson", "application/jsonl", "application/json"):
+            records = [json.loads(line) for line in body.decode("utf-8").splitlines() if line.strip()]
+            if not all(isinstance(record, dict) for record in records):
+                raise PayloadError("Each JSON line must be an object.")
+            df = pd.DataFrame.from_records(records)
+        elif content_type in ("text/csv", "application/csv", ""):
+            df = pd.read_csv(io.BytesIO(body), dtype=str, keep_default_na=False, encoding="utf-8-sig")
+        else:
+            raise PayloadError(f"Unsupported Content-Type {content_type!r}.", HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
+    except (ValueError, UnicodeDecodeError, pd.errors.ParserError) as e:
+        if isinstance(e, PayloadError):
+            raise
+        raise PayloadError(f"Could not parse payload: {e}")
+    if df.empty:
+        raise PayloadError("Payload has no rows.")
+    try:
+        return normalize_frame(df)
+    except SnapshotSchemaError as e:
+        raise PayloadError(str(e), HTTPStatus.UNPROCESSABLE_ENTITY)
+
+def resolve_week(week, base_dir=BASE_DIR):
+    """
+    Pasta de destino para 'Week<N>' ou 'csv_week<N>'.
+    """
+    name = f"csv_{week.lower()}" if week.lower().startswith("week") else week
+    if not WEEK_DIRECTORY_PATTERN.match(name):
+        raise PayloadError(f"Invalid week {week!r}; expected Week<N> or csv_week<N>.")
+    return os.path.join(base_dir, name)
+
+def resolve_snapshot_id(timestamp):
+    if not timestamp:
+        return datetime.now().strftime(SNAPSHOT_ID_FORMAT)
+    try:
+        datetime.strptime(timestamp, SNAPSHOT_ID_FORMAT)
+    except ValueError:
+        raise PayloadError(f"Invalid timestamp {timestamp!r}; expected YYYYMMDD_HHMMSS.")
+    return timestamp
+
+class IngestBuffer:
+    """
+    Snapshots recebidos e ainda não gravados, com a thread que os grava em lotes.
+    """
+
+    def __init__(self, base_dir=BASE_DIR, store_dir=STORE_DIR, batch_seconds=BATCH_SECONDS,
+                 batch_max_snapshots=BATCH_MAX_SNAPSHOTS):
+        self.base_dir = base_dir
+        self.store_dir = store_dir
+        self.batch_seconds = batch_seconds
+        self.batch_max_snapshots = batch_max_snapshots
+        self._lock = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._pending = {}       # (pasta, snapshot_id) -> [DataFrame]
+        self._first_at = None    # chegada do item mais antigo do buffer (ou da última falha)
+        self._unprocessed = {}   # pasta -> snapshots gravados que o watcher ainda não processou
+        self._stopped = False
+        self._watchers = {}      # pasta -> SnapshotWatcher
+        self.flushed_snapshots = 0
+        self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+        self._thread.start()
+
+    def add(self, directory, snapshot_id, df):
+        """
+        Coloca o snapshot no buffer. Retorna o número de snapshots pendentes.
+        """
+        target = os.path.join(directory, f"{snapshot_id}{SNAPSHOT_SUFFIX}")
+        with self._lock:
+            if os.path.exists(target):
+                raise PayloadError(f"Snapshot {snapshot_id} already exists in {os.path.basename(directory)}.",
+                                   HTTPStatus.CONFLICT)
+            self._pending.setdefault((directory, snapshot_id), []).append(df)
+            if self._first_at is None:
+                self._first_at = time.monotonic()
+            pending = len(self._pending)
+            self._lock.notify()
+        return pending
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _take(self):
+        with self._lock:
+            batch, self._pending, self._first_at = self._pending, {}, None
+        return batch
+
+    def _restore(self, batch):
+        # Devolve ao buffer o que não foi gravado (antes das partes que chegaram depois)
+        # e agenda uma nova tentativa para daqui a batch_seconds
+        with self._lock:
+            for key, frames in batch.items():
+                self._pending[key] = frames + self._pending.get(key, [])
+            if self._first_at is None:
+                self._first_at = time.monotonic()
+            self._lock.notify()
+
+    def _watcher(self, directory):
+        if directory not in self._watchers:
+            self._watchers[directory] = SnapshotWatcher([directory], self.store_dir, self.base_dir, use_inotify=False)
+        return self._watchers[directory]
+
+    def flush(self):
+        """
+        Grava os snapshots pendentes e processa o lote. Retorna a versão do store (ou None se vazio).
+        Se a gravação falhar, os snapshots ainda não gravados voltam para o buffer; se o
+        processamento falhar (SnapshotProcessingError), as pastas pendentes são processadas de
+        novo no próximo lote e só as pastas já processadas contam para a nova versão.
+        """
+        with self._flush_lock:
+            batch = dict(sorted(self._take().items()))
+            if not batch and not self._unprocessed:
+                return None
+            try:
+                for (directory, snapshot_id), frames in list(batch.items()):
+                    target = os.path.join(directory, f"{snapshot_id}{SNAPSHOT_SUFFIX}")
+                    os.makedirs(directory, exist_ok=True)
+                    # O temporário não termina em .csv: o catálogo só enxerga o arquivo completo
+                    tmp_path = _tmp_path(target)
+                    try:
+                        pd.concat(frames, ignore_index=True).to_csv(tmp_path, index=False)
+                        os.replace(tmp_path, target)
+                    finally:
+                        if os.path.exists(tmp_path):
+                            os.remove(tmp_path)
+                    del batch[(directory, snapshot_id)]
+                    self._unprocessed.setdefault(directory, []).append(f"{os.path.basename(directory)}/{snapshot_id}")
+                    self.flushed_snapshots += 1
+            except Exception:
+                self._restore(batch)
+                raise
+
+            written, version = [], None
+            try:
+                for directory in sorted(self._unprocessed):
+                    self._watcher(directory).process_directory(directory)
+                    written.extend(self._unprocessed.pop(directory))
+            except Exception:
+                # Os CSVs já estão gravados; o processamento das pastas restantes é refeito no próximo lote
+                self._restore({})
+                raise
+            finally:
+                if written:
+                    version = bump_store_version(written, self.store_dir)
+                    debug_print(f"[DEBUG] Flushed {len(written)} snapshots (store version {version}): {written}")
+            return version
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._stopped and (
+                    self._first_at is None
+                    or (len(self._pending) < self.batch_max_snapshots
+                        and time.monotonic() - self._first_at < self.batch_seconds)
+                ):
+                    timeout = None if self._first_at is None else self.batch_seconds - (time.monotonic() - self._first_at)
+                    self._lock.wait(timeout)
+                stopped = self._stopped
+            try:
+                self.flush()
+            except Exception as e:
+                debug_print(f"[ERROR] Failed to flush ingest buffer: {e}")
+            if stopped:
+                return
+
+    def close(self):
+        """
+        Para a thread de gravação depois de gravar o que estiver pendente.
+        """
+        with self._lock:
+            self._stopped = True
+            self._lock.notify()
+        self._thread.join()
+
+class IngestHandler(BaseHTTPRequestHandler):
+    server_version = "SnapshotIngest/1.0"
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        token = self.server.token
+        return not token or self.headers.get("Authorization") == f"Bearer {token}"
+
+    def _content_length(self):
+        length = self.headers.get("Content-Length")
+        if length is None:
+            raise PayloadError("Content-Length header is required.", HTTPStatus.LENGTH_REQUIRED)
+        # isdecimal() também recusa sinais: um tamanho negativo faria rfile.read() esperar o fim da conexão
+        if not length.strip().isdecimal():
+            raise PayloadError(f"Invalid Content-Length {length!r}.")
+        return int(length)
+
+    def log_message(self, format, *args):
+        debug_print(f"[DEBUG] {self.address_string()} {format % args}")
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "Not found."})
+            return
+        buffer = self.server.buffer
+        self._send_json(HTTPStatus.OK, {
+            "status": "ok",
+            "pending": buffer.pending(),
+            "flushed": buffer.flushed_snapshots,
+            "store_version": read_store_version(buffer.store_dir),
+        })
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if not self._authorized():
+            self._send_json(HTTPStatus.UNAUTHORIZED, {"error": "Missing or invalid token."})
+            return
+        try:
+            if url.path == "/flush":
+                self._send_json(HTTPStatus.OK, {"store_version": self.server.buffer.flush()})
+                return
+            if url.path != "/snapshots":
+                raise PayloadError("Not found.", HTTPStatus.NOT_FOUND)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            directory = resolve_week(query.get("week", ""), self.server.buffer.base_dir)
+            snapshot_id = resolve_snapshot_id(query.get("timestamp"))
+            length = self._content_length()
+            if length > MAX_BODY_BYTES:
+                raise PayloadError(f"Payload larger than {MAX_BODY_BYTES} bytes.", HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+            df = parse_payload(self.rfile.read(length), self.headers.get("Content-Type"))
+            pending = self.server.buffer.add(directory, snapshot_id, df)
+        except PayloadError as e:
+            self._send_json(e.status, {"error": str(e)})
+            return
+        except Exception as e:
+            debug_print(f"[ERROR] Ingest request failed: {e}")
+            self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)})
+            return
+        self._send_json(HTTPStatus.ACCEPTED, {
+            "week": os.path.basename(directory),
+            "snapshot_id": snapshot_id,
+            "rows": len(df),
+            "pending": pending,
+        })
+
+def make_server(host="127.0.0.1", port=8765, base_dir=BASE_DIR, store_dir=STORE_DIR,
+                batch_seconds=BATCH_SECONDS, token=INGEST_TOKEN):
+    """
+    Cria o servidor (ainda sem atender). Use port=0 para uma porta livre (testes).
+    """
+    server = ThreadingHTTPServer((host, port), IngestHandler)
+    server.buffer = IngestBuffer(base_dir, store_dir, batch_seconds)
+    server.token = token
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor HTTP de ingestão de snapshots.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Atende POST /snapshots.")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Endereço (padrão: só localhost).")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--base-dir", default=BASE_DIR, help="Diretório com as pastas csv_week*.")
+    serve_parser.add_argument("--store", default=STORE_DIR, help="Diretório do snapshot store.")
+    serve_parser.add_argument("--batch-seconds", type=float, default=BATCH_SECONDS,
+                              help="Tempo máximo de um snapshot no buffer antes de ser gravado.")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        server = make_server(args.host, args.port, args.base_dir, args.store, args.batch_seconds)
+        print(f"Listening on http://{args.host}:{server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            server.buffer.close()
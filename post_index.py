@@ -0,0 +1,192 @@
+"""
+Índice de identidade dos posts: em que linha de cada snapshot cada post aparece.
+
+A chave é o Post_ID (status ID numérico extraído do Link na ingestão), então o mesmo
+tweet é reconhecido mesmo quando aparece com Links diferentes (.../status/<id> e
+.../status/<id>/photo/1) ou com outro valor em 'User'. O índice de cada pasta fica em:
+    snapshot_store/week=<pasta>/_post_index.arrow
+com as colunas Post_ID (int64), Snapshot_ID (YYYYMMDD_HHMMSS) e Row (posição da linha
+no snapshot), ordenado por Post_ID. A atualização é incremental (só os snapshots que
+ainda não estão no índice são lidos) e roda a cada lote de ingestão, junto com os deltas.
+
+O histórico de um post (PostIndex.history) lê só os snapshots em que ele aparece e,
+de cada um, só as linhas apontadas pelo índice.
+
+Uso:
+    python post_index.py build                  # pastas csv_week*
+    python post_index.py build csv_week1 ...    # pastas específicas
+    python post_index.py show <Post_ID> [pastas ...]
+"""
+import argparse
+import os
+import threading
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from snapshot_catalog import SnapshotCatalog
+from snapshot_schema import POST_ID_COLUMN, concat_frames, dedupe_posts
+from snapshot_store import (
+    METRICS,
+    STORE_DIR,
+    _key_lock,
+    _write_arrow,
+    debug_print,
+    default_directories,
+    directory_key,
+    map_arrow,
+    read_compact_snapshot,
+)
+
+POST_INDEX_FILE = "_post_index.arrow"
+POST_HISTORY_COLUMNS = ["User", "Link", POST_ID_COLUMN] + METRICS
+
+def post_index_path(directory, store_dir=STORE_DIR):
+    return os.path.join(store_dir, f"week={directory_key(directory)}", POST_INDEX_FILE)
+
+def _index_snapshots(snapshots, loader):
+    tables = []
+    for snapshot in snapshots:
+        try:
+            ids = loader(snapshot.path, columns=[POST_ID_COLUMN])[POST_ID_COLUMN].to_numpy()
+        except Exception as e:
+            debug_print(f"[ERROR] Failed to index posts of {snapshot.path}: {e}")
+            continue
+        rows = np.flatnonzero(ids != 0)
+        tables.append(pa.table({
+            POST_ID_COLUMN: pa.array(ids[rows], type=pa.int64()),
+            "Snapshot_ID": pa.array([snapshot.snapshot_id] * len(rows), type=pa.string()),
+            "Row": pa.array(rows, type=pa.int32()),
+        }))
+    return tables
+
+def update_post_index(directory, store_dir=STORE_DIR, catalog=None, loader=None):
+    """
+    Acrescenta ao índice da pasta os snapshots novos e retorna o índice completo (tabela Arrow mapeada).
+    Se algum snapshot indexado saiu da pasta, o índice é refeito. Atualizações da mesma pasta
+    são serializadas no processo.
+    """
+    with _key_lock("posts", os.path.abspath(store_dir), directory_key(directory)):
+        return _update_post_index_locked(directory, store_dir, catalog, loader)
+
+def _update_post_index_locked(directory, store_dir=STORE_DIR, catalog=None, loader=None):
+    catalog = catalog or SnapshotCatalog([directory], store_dir=store_dir)
+    loader = loader or partial(read_compact_snapshot, store_dir=store_dir)
+    snapshots = catalog.snapshots([directory])
+    path = post_index_path(directory, store_dir)
+
+    existing = map_arrow(path) if os.path.exists(path) else None
+    indexed = set(pc.unique(existing.column("Snapshot_ID")).to_pylist()) if existing is not None else set()
+    if not indexed <= {snapshot.snapshot_id for snapshot in snapshots}:
+        debug_print(f"[DEBUG] Indexed snapshots were removed from {directory}; rebuilding post index.")
+        existing, indexed = None, set()
+
+    pending = [snapshot for snapshot in snapshots if snapshot.snapshot_id not in indexed]
+    if not pending and existing is not None:
+        return existing
+
+    tables = ([existing] if existing is not None else []) + _index_snapshots(pending, loader)
+    if tables:
+        index = pa.concat_tables(tables)
+    else:
+        index = pa.table({
+            POST_ID_COLUMN: pa.array([], type=pa.int64()),
+            "Snapshot_ID": pa.array([], type=pa.string()),
+            "Row": pa.array([], type=pa.int32()),
+        })
+    index = index.take(pc.sort_indices(index, sort_keys=[(POST_ID_COLUMN, "ascending"), ("Snapshot_ID", "ascending")]))
+    _write_arrow(index, path)
+    debug_print(f"[DEBUG] Indexed {len(pending)} snapshots of {directory}: {len(pc.unique(index.column(POST_ID_COLUMN)))} posts")
+    return map_arrow(path)
+
+class PostIndex:
+    """
+    Índices de posts mapeados em memória, atualizados quando o catálogo da pasta muda.
+    """
+
+    def __init__(self, catalog, store_dir=STORE_DIR, loader=None):
+        self.catalog = catalog
+        self.store_dir = store_dir
+        self.loader = loader or partial(read_compact_snapshot, store_dir=store_dir)
+        self._lock = threading.Lock()
+        self._indexes = {}  # directory -> (snapshots indexados, índice, Post_ID como ndarray)
+
+    def index(self, directory):
+        """
+        Índice da pasta (Post_ID, Snapshot_ID, Row), ordenado por Post_ID, e os seus Post_IDs.
+        """
+        snapshots = self.catalog.snapshots([directory])
+        with self._lock:
+            cached = self._indexes.get(directory)
+            if cached is None or cached[0] is not snapshots:
+                index = update_post_index(directory, self.store_dir, self.catalog, self.loader)
+                cached = (snapshots, index, index.column(POST_ID_COLUMN).to_numpy())
+                self._indexes[directory] = cached
+            return cached[1], cached[2]
+
+    def locate(self, directories, post_id):
+        """
+        Linhas do post em cada snapshot das pastas: DataFrame com Directory, Snapshot_ID e Row.
+        A busca é binária sobre o Post_ID ordenado.
+        """
+        frames = []
+        for directory in directories:
+            index, keys = self.index(directory)
+            lo = np.searchsorted(keys, post_id, side="left")
+            hi = np.searchsorted(keys, post_id, side="right")
+            if hi > lo:
+                frames.append(index.slice(lo, hi - lo).select(["Snapshot_ID", "Row"]).to_pandas().assign(Directory=directory))
+        if not frames:
+            return pd.DataFrame(columns=["Directory", "Snapshot_ID", "Row"])
+        return pd.concat(frames, ignore_index=True)[["Directory", "Snapshot_ID", "Row"]]
+
+    def history(self, directories, post_id, columns=POST_HISTORY_COLUMNS):
+        """
+        Linhas do post em todos os snapshots das pastas (uma por snapshot), por Datetime.
+        Só os snapshots em que o post aparece são lidos.
+        """
+        frames = []
+        for directory, located in self.locate(directories, post_id).groupby("Directory", sort=False):
+            snapshots = {snapshot.snapshot_id: snapshot for snapshot in self.catalog.snapshots([directory])}
+            for snapshot_id, rows in located.groupby("Snapshot_ID", sort=False)["Row"]:
+                snapshot = snapshots.get(snapshot_id)
+                if snapshot is None:
+                    continue
+                try:
+                    df = self.loader(snapshot.path, columns=columns)
+                except Exception as e:
+                    debug_print(f"[ERROR] Failed to load {snapshot.path}: {e}")
+                    continue
+                df = dedupe_posts(df.iloc[rows.to_numpy()]).reset_index(drop=True)
+                df.insert(0, "Snapshot_ID", snapshot_id)
+                df.insert(1, "Datetime", snapshot.timestamp)
+                frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=["Snapshot_ID", "Datetime"] + list(columns))
+        return concat_frames(frames).sort_values("Datetime", kind="stable").reset_index(drop=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Índice de identidade dos posts.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Atualiza o índice de posts das pastas.")
+    build_parser.add_argument("directories", nargs="*", help="Pastas com *_ranked_results.csv (padrão: csv_week*).")
+    build_parser.add_argument("--store", default=STORE_DIR, help="Diretório do snapshot store.")
+
+    show_parser = subparsers.add_parser("show", help="Mostra o histórico de um post.")
+    show_parser.add_argument("post_id", type=int, help="Status ID do post.")
+    show_parser.add_argument("directories", nargs="*", help="Pastas com *_ranked_results.csv (padrão: csv_week*).")
+    show_parser.add_argument("--store", default=STORE_DIR, help="Diretório do snapshot store.")
+
+    args = parser.parse_args()
+    directories = [os.path.abspath(directory) for directory in args.directories or default_directories()]
+    if args.command == "build":
+        for directory in directories:
+            index = update_post_index(directory, args.store)
+            print(f"{directory}: {index.num_rows} entries, {len(pc.unique(index.column(POST_ID_COLUMN)))} posts")
+    elif args.command == "show":
+        post_index = PostIndex(SnapshotCatalog(directories, store_dir=args.store), args.store)
+        print(post_index.history(directories, args.post_id).to_string())
@@ -0,0 +1,136 @@
+"""
+Sketch de quantis mergeável (estilo KLL) para distribuições de engajamento.
+
+Cada snapshot guarda no índice de agregados (ver snapshot_store.compute_aggregates)
+um sketch do Engagement_Total por usuário. Sketches de snapshots diferentes se
+combinam com merge(), então a distribuição de qualquer intervalo de tempo sai dos
+agregados, sem reler as linhas dos snapshots.
+
+O sketch é uma pilha de compactadores: o nível h guarda itens com peso 2**h. Quando
+um nível passa da sua capacidade, os seus itens são ordenados e metade deles (as
+posições pares ou ímpares, sorteadas) sobe para o nível seguinte com o dobro do peso.
+A memória fica em O(k log(n/k)) itens e o erro de posto é de cerca de 1.7/k
+(k=200: ~1% do número de itens). Enquanto cabem em um nível, os valores são exatos.
+"""
+import math
+import os
+import random
+
+import numpy as np
+
+SKETCH_K = int(os.getenv("SNAPSHOT_SKETCH_K", "200"))
+MIN_CAPACITY = 2
+CAPACITY_DECAY = 2 / 3
+
+class KLLSketch:
+    """
+    Sketch de quantis de um fluxo de números. 'k' controla a precisão e a memória.
+    """
+
+    def __init__(self, k=SKETCH_K):
+        self.k = k
+        self.n = 0
+        self.levels = [[]]
+        self.min = None
+        self.max = None
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(MIN_CAPACITY, int(math.ceil(self.k * CAPACITY_DECAY ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) <= self._capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+            items = sorted(items)
+            # Número ímpar de itens: o maior fica no nível atual
+            keep = items[len(items) - len(items) % 2:]
+            offset = random.Random(self.n * 31 + level).getrandbits(1)
+            self.levels[level + 1].extend(items[offset:len(items) - len(keep):2])
+            self.levels[level] = keep
+            # A capacidade dos níveis de baixo depende da altura: recomeça do nível 0
+            level = 0
+
+    def update(self, values):
+        """
+        Acrescenta os valores (qualquer iterável de números) ao sketch.
+        """
+        values = [value.item() if hasattr(value, "item") else value for value in values]
+        if not values:
+            return self
+        self.levels[0].extend(values)
+        self.n += len(values)
+        low, high = min(values), max(values)
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """
+        Incorpora 'other' a este sketch (in place) e retorna este sketch.
+        """
+        if other.n == 0:
+            return self
+        self.k = min(self.k, other.k)
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.n += other.n
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _weighted(self):
+        items = np.array([item for items in self.levels for item in items])
+        weights = np.concatenate([np.full(len(items), 2 ** level, dtype="int64") for level, items in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        return items[order], np.cumsum(weights[order])
+
+    def quantiles(self, fractions):
+        """
+        Valores nos quantis 'fractions' (entre 0 e 1); quantil 0 é o mínimo e 1 é o máximo.
+        """
+        fractions = np.clip(np.asarray(fractions, dtype="float64"), 0, 1)
+        if self.n == 0:
+            return np.full(fractions.shape, np.nan)
+        items, cumulative = self._weighted()
+        # Os pesos somam n; o quantil q é o menor item cujo peso acumulado alcança q * n
+        positions = np.searchsorted(cumulative, fractions * cumulative[-1], side="left")
+        values = items[np.minimum(positions, len(items) - 1)].astype("float64")
+        values[fractions == 0] = self.min
+        values[fractions == 1] = self.max
+        return values
+
+    def quantile(self, fraction):
+        return float(self.quantiles([fraction])[0])
+
+    def to_dict(self):
+        return {"k": self.k, "n": self.n, "min": self.min, "max": self.max, "levels": self.levels}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["k"])
+        sketch.n = data["n"]
+        sketch.min = data["min"]
+        sketch.max = data["max"]
+        sketch.levels = [list(items) for items in data["levels"]] or [[]]
+        return sketch
+
+def merge_sketches(sketches, k=SKETCH_K):
+    """
+    Sketch com a união de todos os 'sketches' (dicts de to_dict() ou KLLSketch); None são ignorados.
+    """
+    merged = KLLSketch(k)
+    for sketch in sketches:
+        if sketch is None:
+            continue
+        merged.merge(KLLSketch.from_dict(sketch) if isinstance(sketch, dict) else sketch)
+    return merged
@@ -0,0 +1,59 @@
+"""
+Redução de séries temporais para os gráficos (Largest-Triangle-Three-Buckets, LTTB).
+
+O LTTB mantém o primeiro e o último ponto e escolhe um ponto por balde (faixa de
+índices de tamanho igual): o que forma o maior triângulo com o ponto escolhido no
+balde anterior e a média do balde seguinte. Picos e vales, que são o que o olho
+procura num gráfico de linha, sobrevivem à redução; uma média móvel os apagaria.
+
+A seleção é feita no servidor, então o navegador recebe no máximo 'target' pontos
+por série, não importa quantos snapshots a campanha acumule.
+"""
+import os
+
+import numpy as np
+
+CHART_MAX_POINTS = int(os.getenv("SNAPSHOT_CHART_MAX_POINTS", "1000"))
+
+def _as_float(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype("datetime64[ns]").astype("int64")
+    return x.astype("float64")
+
+def lttb_indices(x, y, target=CHART_MAX_POINTS):
+    """
+    Índices (crescentes) dos pontos que o LTTB mantém de (x, y). 'x' pode ser numérico ou datetime64.
+    Com target >= len(x) (ou target < 3), todos os índices são mantidos.
+    """
+    n = len(x)
+    if target >= n or target < 3:
+        return np.arange(n)
+    x = _as_float(x)
+    y = np.asarray(y, dtype="float64")
+    # Baldes entre o primeiro e o último ponto (fixos)
+    edges = np.linspace(1, n - 1, target - 1).astype("int64")
+    kept = np.empty(target, dtype="int64")
+    kept[0] = 0
+    kept[-1] = n - 1
+    previous = 0
+    for bucket in range(target - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        next_lo, next_hi = hi, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[next_lo:max(next_hi, next_lo + 1)].mean()
+        next_y = y[next_lo:max(next_hi, next_lo + 1)].mean()
+        # Dobro da área do triângulo (ponto anterior, candidato, média do balde seguinte)
+        areas = np.abs(
+            (x[previous] - next_x) * (y[lo:hi] - y[previous])
+            - (x[previous] - x[lo:hi]) * (next_y - y[previous])
+        )
+        previous = lo + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    return kept
+
+def downsample(x, y, target=CHART_MAX_POINTS):
+    """
+    (x, y) reduzidos a no máximo 'target' pontos com LTTB.
+    """
+    indices = lttb_indices(x, y, target)
+    return np.asarray(x)[indices], np.asarray(y)[indices]
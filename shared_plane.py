@@ -0,0 +1,235 @@
+"""
+Plano de dados compartilhado entre processos do dashboard.
+
+Um processo publicador carrega o histórico de snapshots uma vez e o grava como um
+arquivo Arrow IPC (history-<versão>.arrow). Os dashboards mapeiam esse arquivo em
+memória (mmap): todas as réplicas usam as mesmas páginas do page cache em vez de
+manter cada uma a sua cópia do histórico. As consultas (SharedHistory.table,
+SharedHistory.snapshot, SharedHistory.unique_values) trabalham em Arrow sobre o
+mapeamento, sem converter o histórico para pandas: só o snapshot pedido é convertido. O arquivo MANIFEST.json traz a versão atual; quando ela
+muda, os dashboards passam a mapear o arquivo novo.
+
+Uso:
+    python shared_plane.py publish                  # publica uma vez (pastas csv_week*)
+    python shared_plane.py publish --interval 60    # republica quando chegarem snapshots
+
+No dashboard, o modo é ativado com a variável de ambiente SNAPSHOT_PLANE_DIR.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from snapshot_catalog import SnapshotCatalog, parse_snapshot_timestamp
+from snapshot_schema import concat_frames
+from snapshot_store import (
+    STORE_DIR,
+    _write_arrow,
+    debug_print,
+    default_directories,
+    directory_key,
+    map_arrow,
+    read_compact_snapshot,
+    snapshot_id_from_filename,
+)
+
+PLANE_DIR = os.getenv("SNAPSHOT_PLANE_DIR") or os.path.join(STORE_DIR, "_plane")
+MANIFEST_FILE = "MANIFEST.json"
+KEEP_VERSIONS = 2  # versões antigas mantidas para dashboards que ainda não remapearam
+
+def _manifest_path(plane_dir):
+    return os.path.join(plane_dir, MANIFEST_FILE)
+
+def read_manifest(plane_dir=PLANE_DIR):
+    """
+    Manifesto publicado, ou None se ainda não houver publicação.
+    """
+    try:
+        with open(_manifest_path(plane_dir), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def build_history_table(catalog, directories):
+    """
+    Tabela Arrow com todos os snapshots das pastas, agrupada por pasta e em ordem cronológica.
+    Retorna a tabela e {pasta: [offset, linhas]} para fatiar cada pasta sem cópia.
+    """
+    frames = []
+    ranges = {}
+    offset = 0
+    for directory in directories:
+        rows = 0
+        for snapshot in catalog.snapshots([directory]):
+            try:
+                df = read_compact_snapshot(snapshot.path)
+            except Exception as e:
+                debug_print(f"[ERROR] Failed to load {snapshot.path}: {e}")
+                continue
+            df["Datetime"] = snapshot.timestamp
+            frames.append(df)
+            rows += len(df)
+        ranges[directory_key(directory)] = [offset, rows]
+        offset += rows
+    if not frames:
+        return None, ranges
+    return pa.Table.from_pandas(concat_frames(frames), preserve_index=False), ranges
+
+def publish(directories, plane_dir=PLANE_DIR, catalog=None):
+    """
+    Publica uma nova versão do histórico. Retorna o manifesto gravado (ou None se não houver dados).
+    """
+    catalog = catalog or SnapshotCatalog(directories)
+    table, ranges = build_history_table(catalog, directories)
+    if table is None:
+        debug_print("[WARNING] No snapshots to publish.")
+        return None
+
+    os.makedirs(plane_dir, exist_ok=True)
+    previous = read_manifest(plane_dir)
+    version = previous["version"] + 1 if previous else 1
+    filename = f"history-{version:06d}.arrow"
+
+    _write_arrow(table, os.path.join(plane_dir, filename))
+
+    manifest = {"version": version, "file": filename, "rows": table.num_rows, "directories": ranges}
+    tmp_manifest = f"{_manifest_path(plane_dir)}.tmp"
+    with open(tmp_manifest, "w", encoding="utf-8") as file:
+        json.dump(manifest, file)
+    os.replace(tmp_manifest, _manifest_path(plane_dir))
+
+    # Remove versões antigas (no Linux, quem ainda tem o arquivo mapeado continua lendo normalmente)
+    versions = sorted(f for f in os.listdir(plane_dir) if f.startswith("history-") and f.endswith(".arrow"))
+    for old in versions[:-KEEP_VERSIONS]:
+        try:
+            os.remove(os.path.join(plane_dir, old))
+        except OSError as e:
+            debug_print(f"[WARNING] Could not remove {old}: {e}")
+
+    debug_print(f"[DEBUG] Published history version {version}: {table.num_rows} rows, {ranges}")
+    return manifest
+
+class SharedHistory:
+    """
+    Lado do dashboard: mapeia o histórico publicado e o remapeia quando a versão muda.
+    """
+
+    def __init__(self, plane_dir=PLANE_DIR):
+        self.plane_dir = plane_dir
+        self._lock = threading.Lock()
+        self._manifest_mtime = None
+        self._manifest = None
+        self._table = None
+
+    @property
+    def version(self):
+        return self._manifest["version"] if self._manifest else None
+
+    def refresh(self):
+        """
+        Verifica o manifesto (um stat por chamada) e remapeia se houver versão nova.
+        """
+        try:
+            mtime = os.stat(_manifest_path(self.plane_dir)).st_mtime_ns
+        except OSError:
+            return False
+        with self._lock:
+            if mtime == self._manifest_mtime:
+                return False
+            manifest = read_manifest(self.plane_dir)
+            if manifest is None or (self._manifest and manifest["version"] == self._manifest["version"]):
+                self._manifest_mtime = mtime
+                return False
+            self._table = map_arrow(os.path.join(self.plane_dir, manifest["file"]))
+            self._manifest = manifest
+            self._manifest_mtime = mtime
+            debug_print(f"[DEBUG] Mapped shared history version {manifest['version']} ({manifest['rows']} rows)")
+            return True
+
+    def table(self, directories, columns=None, start=None, end=None):
+        """
+        Fatia (sem cópia) do histórico das pastas informadas, ou None se alguma pasta
+        não estiver na versão publicada. Com 'start'/'end', só as linhas dentro da janela:
+        cada pasta está em ordem cronológica, então a janela também é uma fatia.
+        """
+        self.refresh()
+        with self._lock:
+            if self._table is None:
+                return None
+            ranges = self._manifest["directories"]
+            keys = [directory_key(directory) for directory in directories]
+            if any(key not in ranges for key in keys):
+                return None
+            table = self._table
+        slices = [_window(table.slice(*ranges[key]), start, end) for key in keys]
+        if columns is not None:
+            slices = [piece.select(columns) for piece in slices]
+        return pa.concat_tables(slices) if len(slices) > 1 else slices[0]
+
+    def snapshot(self, path, columns=None):
+        """
+        Linhas do snapshot de 'path' (fatia sem cópia, sem a coluna Datetime), ou None se ele
+        não estiver na versão publicada ou não tiver as colunas pedidas.
+        """
+        snapshot_id = snapshot_id_from_filename(os.path.basename(path))
+        if snapshot_id is None:
+            return None
+        timestamp = parse_snapshot_timestamp(snapshot_id)
+        table = self.table([os.path.dirname(os.path.abspath(path))], start=timestamp, end=timestamp)
+        if table is None or not table.num_rows:
+            return None
+        columns = [name for name in table.column_names if name != "Datetime"] if columns is None else list(columns)
+        if any(column not in table.column_names for column in columns):
+            return None
+        return table.select(columns)
+
+    def unique_values(self, directories, column, start=None, end=None):
+        """
+        Valores distintos de 'column' nas pastas (e janela) informadas, ou None.
+        Calculado no Arrow, sobre o mapeamento: colunas categóricas só materializam
+        os valores do dicionário que de fato aparecem.
+        """
+        table = self.table(directories, [column], start, end)
+        if table is None:
+            return None
+        values = set()
+        for chunk in table.column(column).chunks:
+            if pa.types.is_dictionary(chunk.type):
+                chunk = chunk.dictionary.take(pc.unique(chunk.indices.drop_null()))
+            values.update(pc.unique(chunk.drop_null()).to_pylist())
+        return values
+
+def _window(table, start=None, end=None):
+    """
+    Linhas de 'table' (em ordem cronológica) com start <= Datetime <= end, como fatia sem cópia.
+    """
+    if start is None and end is None:
+        return table
+    times = table.column("Datetime")
+    lo = 0 if start is None else pc.sum(pc.less(times, pa.scalar(start, times.type))).as_py() or 0
+    hi = table.num_rows if end is None else pc.sum(pc.less_equal(times, pa.scalar(end, times.type))).as_py() or 0
+    return table.slice(lo, max(0, hi - lo))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publica o histórico de snapshots para os dashboards.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    publish_parser = subparsers.add_parser("publish", help="Publica o histórico em Arrow IPC.")
+    publish_parser.add_argument("directories", nargs="*", help="Pastas com *_ranked_results.csv (padrão: csv_week*).")
+    publish_parser.add_argument("--plane", default=PLANE_DIR, help="Diretório do plano compartilhado.")
+    publish_parser.add_argument("--interval", type=float, default=0,
+                                help="Segundos entre verificações de novos snapshots (0 = publica uma vez).")
+
+    args = parser.parse_args()
+    if args.command == "publish":
+        directories = [os.path.abspath(d) for d in (args.directories or default_directories())]
+        catalog = SnapshotCatalog(directories)
+        publish(directories, args.plane, catalog)
+        while args.interval > 0:
+            time.sleep(args.interval)
+            if catalog.refresh(directories):
+                publish(directories, args.plane, catalog)
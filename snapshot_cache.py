@@ -0,0 +1,145 @@
+"""
+Cache LRU de DataFrames de snapshots, limitado em bytes.
+
+A chave é (caminho, mtime, tamanho, colunas): um arquivo alterado gera uma chave
+nova e a versão antiga sai do cache por LRU. Cada arquivo é lido no máximo uma vez
+por processo enquanto couber no limite de memória, mesmo com várias threads
+(sessões do Streamlit) pedindo o mesmo snapshot ao mesmo tempo.
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from snapshot_store import debug_print, read_compact_snapshot
+
+DEFAULT_MAX_BYTES = int(os.getenv("SNAPSHOT_CACHE_MAX_MB", "512")) * 1024 * 1024
+DEFAULT_WORKERS = int(os.getenv("SNAPSHOT_LOAD_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+def frame_nbytes(df):
+    """
+    Memória ocupada pelo DataFrame (inclui o conteúdo das strings).
+    """
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+class SnapshotCache:
+    """
+    Cache compartilhado de snapshots já interpretados.
+
+    Por padrão guarda os snapshots na forma compacta (ver snapshot_schema.compact_frame).
+    get() devolve uma cópia rasa (copy(deep=False)) do DataFrame em cache: os dados não são
+    copiados a cada acesso. Acrescentar ou substituir colunas na cópia não afeta o cache;
+    com o Copy-on-Write do pandas (padrão a partir do 3.0) qualquer escrita copia só o que muda.
+    Em versões anteriores do pandas, os chamadores não devem alterar valores no lugar
+    (df.loc[...] = ..., inplace=True) sem fazer antes uma cópia própria.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, loader=read_compact_snapshot):
+        self.max_bytes = max_bytes
+        self._loader = loader
+        self._entries = OrderedDict()  # key -> (DataFrame, nbytes)
+        self._loading = {}             # key -> Lock (uma leitura por chave)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(path, columns=None):
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, tuple(columns) if columns else None)
+
+    def _lookup(self, key):
+        """
+        Procura a chave exata ou, se houver, o snapshot completo para projetar as colunas.
+        Deve ser chamado com o lock adquirido.
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+        full_key = key[:3] + (None,)
+        if key[3] is not None and full_key in self._entries:
+            self._entries.move_to_end(full_key)
+            return self._entries[full_key][0][list(key[3])]
+        return None
+
+    def _store(self, key, df):
+        nbytes = frame_nbytes(df)
+        if nbytes > self.max_bytes:
+            debug_print(f"[WARNING] Snapshot {key[0]} ({nbytes} bytes) exceeds cache limit; not cached.")
+            return
+        self._entries[key] = (df, nbytes)
+        self.current_bytes += nbytes
+        while self.current_bytes > self.max_bytes:
+            _, (_, evicted_bytes) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_bytes
+            self.evictions += 1
+
+    def get(self, path, columns=None):
+        """
+        Retorna o snapshot de 'path' (apenas 'columns', se informado), lendo do disco só na primeira vez.
+        """
+        key = self.make_key(path, columns)
+        with self._lock:
+            df = self._lookup(key)
+            if df is not None:
+                self.hits += 1
+                return df.copy(deep=False)
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                df = self._lookup(key)
+                if df is not None:
+                    # Outra thread leu o arquivo enquanto esperávamos
+                    self.hits += 1
+                    return df.copy(deep=False)
+                self.misses += 1
+            try:
+                df = self._loader(path, columns=list(columns) if columns else None)
+                with self._lock:
+                    self._store(key, df)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+        return df.copy(deep=False)
+
+    def get_many(self, paths, columns=None, workers=DEFAULT_WORKERS):
+        """
+        Lê vários snapshots em paralelo (pool de threads; o pyarrow libera o GIL durante a leitura).
+        Retorna os DataFrames na mesma ordem de 'paths'; arquivos que falharem aparecem como None.
+        O loader precisa ser seguro para threads: o padrão (read_compact_snapshot) é, porque a
+        ingestão de cada CSV é serializada e não atualiza os artefatos da pasta (ver snapshot_store).
+        """
+        def load(path):
+            try:
+                return self.get(path, columns=columns)
+            except Exception as e:
+                debug_print(f"[ERROR] Failed to load {path}: {e}")
+                return None
+
+        paths = list(paths)
+        if workers <= 1 or len(paths) <= 1:
+            return [load(path) for path in paths]
+        with ThreadPoolExecutor(max_workers=min(workers, len(paths))) as executor:
+            return list(executor.map(load, paths))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """
+        Contadores do cache (para depuração e monitoramento).
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
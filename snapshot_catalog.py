@@ -0,0 +1,187 @@
+"""
+Catálogo dos snapshots *_ranked_results.csv.
+
+Lista cada pasta uma única vez, interpreta o timestamp do nome de cada arquivo uma
+única vez e mantém os snapshots ordenados por pasta. Uma pasta só é lida de novo
+quando o seu mtime muda (arquivo criado, removido ou renomeado) ou quando o índice
+de conteúdo do snapshot store muda.
+
+Snapshots cujo conteúdo repete o de um snapshot anterior da mesma pasta (mesmos bytes
+com outro timestamp) não entram nas listagens; ficam disponíveis em aliases().
+"""
+import bisect
+import heapq
+import os
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+from snapshot_store import (
+    STORE_DIR,
+    content_index_path,
+    debug_print,
+    snapshot_aliases,
+    snapshot_id_from_filename,
+)
+
+Snapshot = namedtuple("Snapshot", ["timestamp", "snapshot_id", "path", "directory"])
+
+def parse_snapshot_timestamp(snapshot_id):
+    """
+    Converte 'YYYYMMDD_HHMMSS' em datetime.
+    """
+    return datetime.strptime(snapshot_id, "%Y%m%d_%H%M%S")
+
+def scan_directory(directory, aliases=None):
+    """
+    Lista os snapshots de uma pasta, ordenados por timestamp.
+    Arquivos .csv fora do padrão YYYYMMDD_HHMMSS_ranked_results.csv são ignorados.
+    Se 'aliases' ({snapshot_id: original}) for informado, retorna também a lista dos aliases,
+    que ficam fora da lista principal.
+    """
+    aliases = aliases or {}
+    snapshots = []
+    alias_snapshots = []
+    for filename in os.listdir(directory):
+        if not filename.endswith(".csv"):
+            continue
+        snapshot_id = snapshot_id_from_filename(filename)
+        if snapshot_id is None:
+            debug_print(f"[WARNING] Skipping file with unexpected name: {os.path.join(directory, filename)}")
+            continue
+        try:
+            timestamp = parse_snapshot_timestamp(snapshot_id)
+        except ValueError as e:
+            debug_print(f"[ERROR] Failed to extract datetime from filename '{filename}': {e}")
+            continue
+        snapshot = Snapshot(timestamp, snapshot_id, os.path.join(directory, filename), directory)
+        if snapshot_id in aliases:
+            alias_snapshots.append(snapshot)
+        else:
+            snapshots.append(snapshot)
+    snapshots.sort()
+    alias_snapshots.sort()
+    return snapshots, alias_snapshots
+
+class SnapshotCatalog:
+    """
+    Visão indexada dos snapshots de várias pastas.
+
+    As consultas atualizam automaticamente as pastas cujo mtime mudou; as demais
+    são respondidas a partir das listas já ordenadas.
+    """
+
+    def __init__(self, directories=(), store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        self._lock = threading.RLock()
+        self._mtimes = {}      # directory -> (mtime da pasta, mtime do índice de conteúdo)
+        self._snapshots = {}   # directory -> [Snapshot] ordenada por timestamp
+        self._aliases = {}     # directory -> [Snapshot] com conteúdo repetido
+        self._timestamps = {}  # directory -> [datetime] paralela a _snapshots
+        self._merged = {}      # tuple(directories) -> [Snapshot] (cache das uniões)
+        for directory in directories:
+            self._refresh_directory(directory)
+
+    def _refresh_directory(self, directory):
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            mtime = None
+        try:
+            index_mtime = os.stat(content_index_path(self.store_dir)).st_mtime_ns
+        except OSError:
+            index_mtime = None
+
+        if directory in self._mtimes and self._mtimes[directory] == (mtime, index_mtime):
+            return False
+
+        if mtime is None:
+            if directory not in self._mtimes or self._mtimes[directory][0] is not None:
+                debug_print(f"[WARNING] Directory not found: {directory}")
+            snapshots, aliases = [], []
+        else:
+            snapshots, aliases = scan_directory(directory, snapshot_aliases(directory, self.store_dir))
+            debug_print(f"[DEBUG] Catalog scanned {directory}: {len(snapshots)} snapshots, {len(aliases)} aliases")
+
+        self._mtimes[directory] = (mtime, index_mtime)
+        self._snapshots[directory] = snapshots
+        self._aliases[directory] = aliases
+        self._timestamps[directory] = [snapshot.timestamp for snapshot in snapshots]
+        self._merged = {key: value for key, value in self._merged.items() if directory not in key}
+        return True
+
+    def refresh(self, directories=None):
+        """
+        Relê as pastas cujo mtime mudou. Retorna True se alguma mudou.
+        """
+        with self._lock:
+            targets = list(self._mtimes) if directories is None else directories
+            changed = False
+            for directory in targets:
+                changed = self._refresh_directory(directory) or changed
+            return changed
+
+    def snapshots(self, directories):
+        """
+        Todos os snapshots das pastas informadas, em ordem cronológica.
+        """
+        key = tuple(directories)
+        with self._lock:
+            self.refresh(key)
+            if len(key) == 1:
+                return self._snapshots[key[0]]
+            if key not in self._merged:
+                self._merged[key] = list(heapq.merge(*(self._snapshots[d] for d in key)))
+            return self._merged[key]
+
+    def aliases(self, directories):
+        """
+        Snapshots omitidos por repetirem o conteúdo de um snapshot anterior, em ordem cronológica.
+        """
+        with self._lock:
+            self.refresh(directories)
+            return list(heapq.merge(*(self._aliases[d] for d in directories)))
+
+    def latest_n(self, directories, n):
+        """
+        Os 'n' snapshots mais recentes, do mais novo para o mais antigo.
+        """
+        return self.snapshots(directories)[:-n - 1:-1]
+
+    def latest(self, directories):
+        """
+        O snapshot mais recente, ou None se não houver nenhum.
+        """
+        latest = self.latest_n(directories, 1)
+        return latest[0] if latest else None
+
+    def time_bounds(self, directories):
+        """
+        (primeiro, último) timestamp dos snapshots das pastas, ou None se não houver snapshots.
+        Usa apenas o catálogo; nenhum arquivo é aberto.
+        """
+        with self._lock:
+            self.refresh(directories)
+            bounds = [
+                (self._timestamps[d][0], self._timestamps[d][-1]) for d in directories if self._timestamps[d]
+            ]
+        if not bounds:
+            return None
+        return min(first for first, _ in bounds), max(last for _, last in bounds)
+
+    def in_range(self, directories, start=None, end=None):
+        """
+        Snapshots com start <= timestamp <= end (limites None são abertos).
+        Pastas inteiramente fora da janela são descartadas sem busca.
+        """
+        result = []
+        with self._lock:
+            self.refresh(directories)
+            for directory in directories:
+                timestamps = self._timestamps[directory]
+                if not timestamps or (start is not None and timestamps[-1] < start) or (end is not None and timestamps[0] > end):
+                    continue
+                lo = bisect.bisect_left(timestamps, start) if start is not None else 0
+                hi = bisect.bisect_right(timestamps, end) if end is not None else len(timestamps)
+                result.append(self._snapshots[directory][lo:hi])
+        return list(heapq.merge(*result))
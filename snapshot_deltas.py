@@ -0,0 +1,266 @@
+"""
+Deltas entre snapshots consecutivos, calculados uma única vez por snapshot.
+
+Cada snapshot é juntado ao anterior da mesma pasta por post (Post_ID) e por usuário,
+e a variação de cada métrica (<métrica>_Delta) é gravada junto com o valor atual em:
+    snapshot_store/week=<pasta>/_deltas_posts.parquet
+    snapshot_store/week=<pasta>/_deltas_users.parquet
+O primeiro snapshot da pasta é comparado com zero. O crescimento em qualquer janela
+também sai dessas tabelas (valor atual menos o valor no início da janela), sem reler
+os snapshots. Os deltas são atualizados uma vez por lote de ingestão (ingest_directory e o
+watcher) e, no dashboard, quando o catálogo muda; a atualização de uma pasta é serializada
+no processo, então chamadas simultâneas esperam a que está em andamento.
+
+Uso:
+    python snapshot_deltas.py update                 # pastas csv_week*
+    python snapshot_deltas.py update csv_week1 ...   # pastas específicas
+"""
+import argparse
+import os
+import threading
+from datetime import timedelta
+from functools import partial
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from snapshot_catalog import SnapshotCatalog
+from snapshot_schema import POST_ID_COLUMN, concat_frames, dedupe_posts, keyed_posts, post_created_at
+from snapshot_store import (
+    METRICS,
+    STORE_DIR,
+    _key_lock,
+    _write_partition,
+    debug_print,
+    default_directories,
+    directory_key,
+    read_compact_snapshot,
+)
+
+DELTA_COLUMNS = ["User", "Link", POST_ID_COLUMN] + METRICS
+LEVELS = {"posts": POST_ID_COLUMN, "users": "User"}
+
+def deltas_path(directory, level, store_dir=STORE_DIR):
+    """
+    Caminho da tabela de deltas ('posts' ou 'users') de uma pasta.
+    """
+    return os.path.join(store_dir, f"week={directory_key(directory)}", f"_deltas_{level}.parquet")
+
+def _metric_deltas(current, previous):
+    # Valores atuais e variação de cada métrica; chaves ausentes de um lado contam como zero
+    keys = current.index.union(previous.index)
+    current = current.reindex(keys, fill_value=0).astype("int64")
+    previous = previous.reindex(keys, fill_value=0).astype("int64")
+    deltas = current - previous
+    deltas.columns = [f"{metric}_Delta" for metric in METRICS]
+    return pd.concat([current, deltas], axis=1)
+
+def snapshot_deltas(previous, current):
+    """
+    Deltas de 'current' em relação a 'previous' (None para o primeiro snapshot).
+    Retorna (posts, users) com todos os posts (com status ID) e usuários dos dois snapshots;
+    quem saiu do ranking aparece com valores zerados e delta negativo.
+    """
+    current = dedupe_posts(current)
+    previous = dedupe_posts(previous) if previous is not None else current.iloc[0:0]
+
+    current_posts = keyed_posts(current)
+    previous_posts = keyed_posts(previous)
+    labels = pd.concat([previous_posts[["User", "Link"]], current_posts[["User", "Link"]]]).astype(str)
+    labels = labels[~labels.index.duplicated(keep="last")]
+    posts = labels.join(_metric_deltas(current_posts[METRICS], previous_posts[METRICS]), how="right")
+    posts.index.name = POST_ID_COLUMN
+    posts = posts.reset_index()
+
+    current_users = current.groupby(current["User"].astype(str))[METRICS].sum()
+    previous_users = previous.groupby(previous["User"].astype(str))[METRICS].sum()
+    users = _metric_deltas(current_users, previous_users)
+    users.index.name = "User"
+    users = users.reset_index()
+    return posts, users
+
+def _read_table(path):
+    return pq.read_table(path).to_pandas() if os.path.exists(path) else None
+
+def update_deltas(directory, store_dir=STORE_DIR, catalog=None, loader=None):
+    """
+    Calcula os deltas dos snapshots novos da pasta e retorna {'posts': ..., 'users': ...}.
+    Pares (snapshot, anterior) já calculados não são refeitos; pares que deixaram de ser
+    consecutivos (snapshot inserido fora de ordem) são descartados e recalculados.
+    """
+    with _key_lock("deltas", os.path.abspath(store_dir), directory_key(directory)):
+        return _update_deltas_locked(directory, store_dir, catalog, loader)
+
+def _update_deltas_locked(directory, store_dir=STORE_DIR, catalog=None, loader=None):
+    catalog = catalog or SnapshotCatalog([directory], store_dir=store_dir)
+    loader = loader or partial(read_compact_snapshot, store_dir=store_dir)
+    snapshots = catalog.snapshots([directory])
+    pairs = {
+        snapshot.snapshot_id: (snapshots[i - 1] if i else None, snapshot)
+        for i, snapshot in enumerate(snapshots)
+    }
+
+    expected_previous = {
+        snapshot_id: previous.snapshot_id if previous else "" for snapshot_id, (previous, _) in pairs.items()
+    }
+
+    tables = {}
+    done = None
+    for level in LEVELS:
+        table = _read_table(deltas_path(directory, level, store_dir))
+        if table is not None:
+            table = table[table["Previous_ID"] == table["Snapshot_ID"].map(expected_previous)]
+            computed = set(table["Snapshot_ID"])
+            done = computed if done is None else done & computed
+        tables[level] = table
+    done = done or set()
+    pending = [pair for snapshot_id, pair in pairs.items() if snapshot_id not in done]
+    if not pending:
+        return tables
+
+    frames = {level: [] for level in LEVELS}
+    loaded = {}
+    def load(snapshot):
+        if snapshot.path not in loaded:
+            loaded[snapshot.path] = loader(snapshot.path, columns=DELTA_COLUMNS)
+        return loaded[snapshot.path]
+
+    for previous, snapshot in pending:
+        try:
+            posts, users = snapshot_deltas(load(previous) if previous else None, load(snapshot))
+        except Exception as e:
+            debug_print(f"[ERROR] Failed to compute deltas for {snapshot.path}: {e}")
+            continue
+        for level, frame in (("posts", posts), ("users", users)):
+            frame.insert(0, "Snapshot_ID", snapshot.snapshot_id)
+            frame.insert(1, "Previous_ID", previous.snapshot_id if previous else "")
+            frame.insert(2, "Datetime", snapshot.timestamp)
+            frames[level].append(frame)
+
+    for level in LEVELS:
+        kept = tables[level]
+        if kept is not None:
+            kept = kept[~kept["Snapshot_ID"].isin([snapshot.snapshot_id for _, snapshot in pending])]
+        parts = ([kept] if kept is not None and not kept.empty else []) + frames[level]
+        if not parts:
+            continue
+        table = concat_frames(parts).sort_values(["Datetime", LEVELS[level]], kind="stable").reset_index(drop=True)
+        _write_partition(table, deltas_path(directory, level, store_dir))
+        tables[level] = table
+    debug_print(f"[DEBUG] Computed deltas for {len(pending)} snapshots of {directory}.")
+    return tables
+
+class DeltaEngine:
+    """
+    Consultas sobre os deltas das pastas, atualizados quando o catálogo muda.
+    """
+
+    def __init__(self, catalog, store_dir=STORE_DIR, loader=None):
+        self.catalog = catalog
+        self.store_dir = store_dir
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._tables = {}  # directory -> (snapshots considerados, {'posts': ..., 'users': ...})
+
+    def tables(self, directory):
+        snapshots = self.catalog.snapshots([directory])
+        with self._lock:
+            cached = self._tables.get(directory)
+            if cached is None or cached[0] is not snapshots:
+                cached = (snapshots, update_deltas(directory, self.store_dir, self.catalog, self.loader))
+                self._tables[directory] = cached
+            return cached[1]
+
+    def top_movers(self, directories, level="users", metric="Engagement_Total", n=10):
+        """
+        Maiores variações de 'metric' no último snapshot de cada pasta em relação ao anterior.
+        """
+        frames = []
+        for directory in directories:
+            table = self.tables(directory)[level]
+            if table is not None and not table.empty:
+                frames.append(table[table["Datetime"] == table["Datetime"].max()])
+        if not frames:
+            return None
+        movers = concat_frames(frames)
+        return movers.nlargest(n, f"{metric}_Delta").reset_index(drop=True)
+
+    def _created_at(self, directory, level):
+        """
+        Horário de criação de cada post (pelo status ID) ou, por usuário, do seu post mais antigo.
+        """
+        posts = self.tables(directory)["posts"]
+        if posts is None or posts.empty:
+            return pd.Series(dtype="datetime64[ns]")
+        created = post_created_at(posts[POST_ID_COLUMN]).set_axis(posts.index)
+        if level == "posts":
+            return created.groupby(posts[POST_ID_COLUMN].to_numpy()).min()
+        return created.groupby(posts["User"].astype(str).to_numpy()).min()
+
+    def _directory_growth(self, directory, level, cutoff):
+        table = self.tables(directory)[level]
+        if table is None or table.empty:
+            return None
+        key = LEVELS[level]
+        window = table[table["Datetime"] > cutoff]
+        if window.empty:
+            return None
+        latest = window.drop_duplicates(subset=[key], keep="last").set_index(key)
+        first = window.drop_duplicates(subset=[key], keep="first").set_index(key)[METRICS]
+        before = table[table["Datetime"] <= cutoff].drop_duplicates(subset=[key], keep="last").set_index(key)
+        baseline = before[METRICS].reindex(latest.index)
+        # Quem não aparece em nenhum snapshot até o corte só parte de zero se foi criado depois dele;
+        # se já existia (ou a criação é desconhecida), parte do primeiro valor observado na janela
+        unseen = baseline[METRICS[0]].isna()
+        created = self._created_at(directory, level).reindex(latest.index)
+        existed = unseen & ~(created > cutoff).to_numpy()
+        baseline = baseline.fillna(0)
+        baseline.loc[existed] = first.loc[existed[existed].index].to_numpy()
+        growth = latest[METRICS].astype("int64") - baseline.astype("int64")
+        growth.columns = [f"{metric}_Delta" for metric in METRICS]
+        labels = ["User", "Link"] if level == "posts" else []
+        return latest[labels + METRICS].join(growth)
+
+    def growth(self, directories, hours, level="users", metric="Engagement_Total", n=None):
+        """
+        Crescimento de cada usuário (ou post) nas últimas 'hours' horas até o snapshot mais recente:
+        valor no snapshot mais recente menos o valor no último snapshot até o início da janela.
+        Quem não existia no início da janela (pelo horário de criação do status ID) parte de zero;
+        quem existia mas ainda não tinha sido visto parte do primeiro valor observado, para que
+        um recém-chegado não apareça com todo o seu total como crescimento.
+        Com várias pastas, o crescimento de cada pasta é somado. Ordenado pelo crescimento de 'metric'.
+        """
+        tables = [self.tables(directory)[level] for directory in directories]
+        ends = [table["Datetime"].max() for table in tables if table is not None and not table.empty]
+        if not ends:
+            return None
+        cutoff = max(ends) - timedelta(hours=hours)
+        frames = [self._directory_growth(directory, level, cutoff) for directory in directories]
+        frames = [frame for frame in frames if frame is not None]
+        if not frames:
+            return None
+        growth = pd.concat(frames)
+        if len(frames) > 1:
+            labels = ["User", "Link"] if level == "posts" else []
+            sums = growth.groupby(level=0)[METRICS + [f"{column}_Delta" for column in METRICS]].sum()
+            growth = growth[~growth.index.duplicated(keep="last")][labels].join(sums) if labels else sums
+        growth.index.name = LEVELS[level]
+        growth = growth.reset_index()
+        growth = growth.sort_values(f"{metric}_Delta", ascending=False, kind="stable").reset_index(drop=True)
+        return growth.head(n) if n else growth
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deltas entre snapshots consecutivos.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    update_parser = subparsers.add_parser("update", help="Calcula os deltas dos snapshots novos.")
+    update_parser.add_argument("directories", nargs="*", help="Pastas com *_ranked_results.csv (padrão: csv_week*).")
+    update_parser.add_argument("--store", default=STORE_DIR, help="Diretório do snapshot store.")
+
+    args = parser.parse_args()
+    if args.command == "update":
+        for directory in args.directories or default_directories():
+            tables = update_deltas(os.path.abspath(directory), args.store)
+            print(f"{directory}: " + ", ".join(
+                f"{level}={0 if table is None else len(table)}" for level, table in tables.items()
+            ))
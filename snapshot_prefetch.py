@@ -0,0 +1,112 @@
+"""
+Pré-carregamento em segundo plano das outras semanas do dashboard.
+
+Depois que a semana selecionada é exibida, o dashboard agenda uma rodada de
+pré-carregamento para as demais semanas (as vizinhas primeiro). Cada semana é um
+job com vários passos (ler o snapshot mais recente, atualizar a matriz, os deltas...)
+que só aquecem caches compartilhados; nada é desenhado fora da thread do script.
+
+- Pool de threads limitado (SNAPSHOT_PREFETCH_WORKERS, padrão 2).
+- Cancelamento: uma nova rodada (ou cancel()) descarta os jobs que ainda não começaram
+  e interrompe os que estão rodando antes do próximo passo.
+- Orçamento de memória: antes de cada passo, o uso informado por 'usage' (por exemplo
+  os bytes do SnapshotCache) é comparado com 'budget_bytes'; acima dele, o job para,
+  para que o pré-carregamento não expulse do cache o que a tela atual está usando.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from snapshot_store import debug_print
+
+PREFETCH_WORKERS = int(os.getenv("SNAPSHOT_PREFETCH_WORKERS", "2"))
+PREFETCH_BUDGET_BYTES = int(os.getenv("SNAPSHOT_PREFETCH_MAX_MB", "256")) * 1024 * 1024
+
+def neighbours_first(items, current):
+    """
+    Os itens exceto 'current', do mais próximo ao mais distante dele (o seguinte antes do anterior).
+    Se 'current' não estiver na lista, mantém a ordem original.
+    """
+    items = list(items)
+    if current not in items:
+        return items
+    position = items.index(current)
+    others = [item for item in items if item != current]
+    return sorted(others, key=lambda item: (abs(items.index(item) - position), items.index(item) < position))
+
+class Prefetcher:
+    """
+    Executa rodadas de pré-carregamento em um pool limitado, com cancelamento e orçamento de memória.
+    """
+
+    def __init__(self, workers=PREFETCH_WORKERS, budget_bytes=PREFETCH_BUDGET_BYTES, usage=None):
+        self.budget_bytes = budget_bytes
+        self._usage = usage or (lambda: 0)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._futures = []
+        self._counters = {"scheduled": 0, "completed": 0, "cancelled": 0, "over_budget": 0, "failed": 0}
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _run(self, name, steps, cancel):
+        for step in steps:
+            if cancel.is_set():
+                self._count("cancelled")
+                return
+            if self._usage() >= self.budget_bytes:
+                debug_print(f"[DEBUG] Prefetch of {name} stopped: memory budget of {self.budget_bytes} bytes reached.")
+                self._count("over_budget")
+                return
+            try:
+                step()
+            except Exception as e:
+                debug_print(f"[ERROR] Prefetch of {name} failed: {e}")
+                self._count("failed")
+                return
+        self._count("completed")
+
+    def cancel(self):
+        """
+        Cancela a rodada atual: jobs pendentes não começam e os em andamento param no próximo passo.
+        """
+        with self._lock:
+            self._cancel.set()
+            for future in self._futures:
+                if future.cancel():
+                    self._counters["cancelled"] += 1
+            self._futures = []
+
+    def prefetch(self, jobs):
+        """
+        Cancela a rodada anterior e agenda 'jobs': lista de (nome, [funções sem argumentos]),
+        executados na ordem da lista.
+        """
+        self.cancel()
+        with self._lock:
+            self._cancel = cancel = threading.Event()
+            for name, steps in jobs:
+                self._futures.append(self._executor.submit(self._run, name, list(steps), cancel))
+                self._counters["scheduled"] += 1
+        debug_print(f"[DEBUG] Prefetch scheduled: {[name for name, _ in jobs]}")
+
+    def wait(self, timeout=None):
+        """
+        Espera os jobs da rodada atual terminarem (usado em testes e scripts).
+        """
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            if not future.cancelled():
+                future.exception(timeout=timeout)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, pending=sum(not future.done() for future in self._futures))
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
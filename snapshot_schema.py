@@ -0,0 +1,265 @@
+"""
+Esquema declarado dos CSVs de snapshot (*_ranked_results.csv).
+
+Layout atual:
+    Comments,Retweets,Likes,Bookmarks,Views,Link,User,Engagement_Total
+
+Layouts antigos usavam outros nomes de coluna; COLUMN_ALIASES guarda esses nomes
+por versão do layout para que os arquivos antigos continuem legíveis.
+"""
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+METRIC_COLUMNS = ["Comments", "Retweets", "Likes", "Bookmarks", "Views"]
+
+# Colunas canônicas e seus tipos. As métricas são lidas como inteiros anuláveis
+# e normalizadas para int64 (valores ausentes viram 0, como na fórmula de engajamento).
+SNAPSHOT_SCHEMA = {
+    "Comments": "Int64",
+    "Retweets": "Int64",
+    "Likes": "Int64",
+    "Bookmarks": "Int64",
+    "Views": "Int64",
+    "Link": str,
+    "User": str,
+    "Engagement_Total": "Int64",
+}
+SNAPSHOT_COLUMNS = list(SNAPSHOT_SCHEMA)
+
+# Identidade canônica de um post: o status ID numérico extraído do Link
+# (o mesmo tweet aparece como .../status/<id> e .../status/<id>/photo/1)
+POST_ID_COLUMN = "Post_ID"
+STATUS_ID_PATTERN = r"/status(?:es)?/(\d+)"
+TWITTER_EPOCH_MS = 1288834974657  # época dos IDs Snowflake (04/11/2010)
+SNOWFLAKE_MIN_ID = 30_000_000_000  # IDs menores são sequenciais (anteriores ao Snowflake), sem horário
+# Fuso dos timestamps nos nomes dos snapshots em relação ao UTC (o coletor grava no horário de Brasília)
+SNAPSHOT_UTC_OFFSET_HOURS = float(os.getenv("SNAPSHOT_UTC_OFFSET_HOURS", "-3"))
+
+# Colunas de texto com muitas repetições no histórico, guardadas como categóricas
+CATEGORY_COLUMNS = ["User", "Link"]
+
+# Nomes alternativos (em minúsculas) aceitos para cada coluna canônica, por versão do layout
+COLUMN_ALIASES = {
+    1: {
+        "usuario": "User",
+        "usuário": "User",
+        "engagement": "Engagement_Total",
+        "url": "Link",
+    },
+    2: {column.lower(): column for column in SNAPSHOT_COLUMNS},
+}
+
+class SnapshotSchemaError(ValueError):
+    """
+    O cabeçalho do CSV não tem as colunas exigidas pelo esquema.
+    """
+
+def engagement_total(df):
+    """
+    Engagement_Total = Views + (Comments x 6) + (Retweets x 3) + (Likes x 2) + (Bookmarks)
+    """
+    return (
+        df['Views'].fillna(0) +
+        df['Comments'].fillna(0) * 6 +
+        df['Retweets'].fillna(0) * 3 +
+        df['Likes'].fillna(0) * 2 +
+        df['Bookmarks'].fillna(0)
+    )
+
+def post_ids(links):
+    """
+    Status ID de cada Link como int64 (0 quando o Link não tem ID, ex.: 'Unknown').
+    Em colunas categóricas, a extração roda uma vez por categoria.
+    """
+    if isinstance(links.dtype, pd.CategoricalDtype):
+        ids = post_ids(pd.Series(links.cat.categories)).to_numpy()
+        codes = links.cat.codes.to_numpy()
+        values = np.where(codes >= 0, ids[codes], 0) if len(ids) else np.zeros(len(codes), dtype="int64")
+        return pd.Series(values, index=links.index, dtype="int64")
+    ids = links.astype(str).str.extract(STATUS_ID_PATTERN, expand=False)
+    return ids.fillna("0").astype("int64")
+
+def post_created_at(ids):
+    """
+    Horário de criação de cada post a partir do status ID (Snowflake: milissegundos desde
+    TWITTER_EPOCH_MS nos bits acima dos 22 menores), no fuso dos nomes dos snapshots
+    (SNAPSHOT_UTC_OFFSET_HOURS). NaT para IDs 0 ou anteriores ao Snowflake.
+    """
+    ids = np.asarray(ids, dtype="int64")
+    created = pd.to_datetime(np.right_shift(ids, 22) + TWITTER_EPOCH_MS, unit="ms")
+    created = created + pd.Timedelta(hours=SNAPSHOT_UTC_OFFSET_HOURS)
+    return pd.Series(created, dtype="datetime64[ns]").where(ids >= SNOWFLAKE_MIN_ID)
+
+def dedupe_posts(df):
+    """
+    Uma linha por post (por snapshot, se houver 'Datetime'): fica a de maior Engagement_Total.
+    Linhas sem status ID (Post_ID 0) são mantidas. Sem a coluna Post_ID, retorna o DataFrame como está.
+    """
+    if POST_ID_COLUMN not in df.columns:
+        return df
+    subset = [column for column in ["Datetime"] if column in df.columns] + [POST_ID_COLUMN]
+    known = df[POST_ID_COLUMN] != 0
+    if not (known & df.duplicated(subset=subset, keep=False)).any():
+        return df
+    ordered = df.sort_values("Engagement_Total", ascending=False, kind="stable")
+    repeated = (ordered[POST_ID_COLUMN] != 0) & ordered.duplicated(subset=subset)
+    return df[~df.index.isin(ordered.index[repeated])]
+
+def keyed_posts(df):
+    """
+    Posts de um snapshot indexados pelo Post_ID, a chave para cruzar posts entre snapshots:
+    uma linha por post (dedupe_posts), sem as linhas sem status ID.
+    """
+    df = dedupe_posts(df)
+    return df[df[POST_ID_COLUMN] != 0].set_index(POST_ID_COLUMN)
+
+def read_header(csv_path):
+    """
+    Lê apenas a linha de cabeçalho do CSV.
+    """
+    with open(csv_path, "r", newline="", encoding="utf-8-sig") as file:
+        try:
+            return next(csv.reader(file))
+        except StopIteration:
+            raise SnapshotSchemaError(f"{csv_path} is empty.")
+
+def resolve_columns(header):
+    """
+    Mapeia os nomes do cabeçalho para as colunas canônicas: {nome no arquivo: nome canônico}.
+    Colunas desconhecidas são ignoradas.
+    """
+    mapping = {}
+    for name in header:
+        key = name.strip().lower()
+        for version in sorted(COLUMN_ALIASES, reverse=True):
+            canonical = COLUMN_ALIASES[version].get(key)
+            if canonical is not None and canonical not in mapping.values():
+                mapping[name] = canonical
+                break
+    return mapping
+
+def validate_header(header, columns=None, csv_path="CSV"):
+    """
+    Valida o cabeçalho contra o esquema e retorna o mapeamento {nome no arquivo: nome canônico}
+    restrito ao necessário para 'columns' (todas as colunas do esquema, se None).
+    Lança SnapshotSchemaError se faltar alguma coluna.
+    """
+    columns = SNAPSHOT_COLUMNS if columns is None else list(columns)
+    mapping = resolve_columns(header)
+    available = set(mapping.values())
+
+    # Engagement_Total pode ser calculado a partir das métricas quando não estiver no arquivo
+    needed = set(columns) - {"Engagement_Total"}
+    if "Engagement_Total" in columns and "Engagement_Total" not in available:
+        needed.update(METRIC_COLUMNS)
+    missing = sorted(needed - available)
+    if missing:
+        raise SnapshotSchemaError(f"{csv_path} is missing columns {missing}. Header: {header}")
+
+    wanted = needed | ({"Engagement_Total"} & available & set(columns))
+    return {name: canonical for name, canonical in mapping.items() if canonical in wanted}
+
+def read_snapshot_csv(csv_path, columns=None):
+    """
+    Lê um CSV de snapshot segundo o esquema: valida o cabeçalho antes de ler o corpo,
+    lê apenas as colunas necessárias com tipos explícitos (sem inferência) e
+    devolve as colunas com os nomes canônicos, na ordem de 'columns'.
+    """
+    columns = SNAPSHOT_COLUMNS if columns is None else list(columns)
+    mapping = validate_header(read_header(csv_path), columns, csv_path)
+
+    df = pd.read_csv(
+        csv_path,
+        engine="pyarrow",
+        usecols=list(mapping),
+        dtype={name: SNAPSHOT_SCHEMA[canonical] for name, canonical in mapping.items()},
+    )
+    df = df.rename(columns=mapping)
+
+    for column in df.columns:
+        if SNAPSHOT_SCHEMA[column] == "Int64":
+            df[column] = df[column].fillna(0).astype("int64")
+
+    if "Engagement_Total" in columns and "Engagement_Total" not in df.columns:
+        df["Engagement_Total"] = engagement_total(df)
+    return df[columns]
+
+def normalize_frame(df, source="payload"):
+    """
+    Valida e converte um DataFrame já carregado (por exemplo, vindo de uma requisição) para o
+    esquema: nomes canônicos, métricas int64 e Engagement_Total calculado se estiver ausente.
+    Lança SnapshotSchemaError se faltar alguma coluna ou se uma métrica não for numérica.
+    """
+    mapping = validate_header([str(column) for column in df.columns], SNAPSHOT_COLUMNS, source)
+    df = df[list(mapping)].rename(columns=mapping)
+    for column in df.columns:
+        if SNAPSHOT_SCHEMA[column] != "Int64":
+            df[column] = df[column].fillna("").astype(str)
+            continue
+        values = pd.to_numeric(df[column], errors="coerce")
+        invalid = values.isna() & df[column].notna() & (df[column].astype(str).str.strip() != "")
+        if invalid.any():
+            raise SnapshotSchemaError(f"{source}: column {column} has non-numeric values {df.loc[invalid, column].head(3).tolist()}")
+        if (values.dropna() % 1 != 0).any():
+            raise SnapshotSchemaError(f"{source}: column {column} must contain integers.")
+        df[column] = values.fillna(0).astype("int64")
+    if "Engagement_Total" not in df.columns:
+        df["Engagement_Total"] = engagement_total(df)
+    return df[SNAPSHOT_COLUMNS]
+
+def normalize_users(users):
+    """
+    Normaliza os handles para comparação: sem espaços nas pontas e em minúsculas.
+    """
+    return users.astype(str).str.strip().str.lower()
+
+def compact_frame(df):
+    """
+    Representação compacta de um snapshot carregado: 'User' normalizado uma única vez,
+    'User'/'Link' como categóricas e métricas no menor tipo inteiro que comporta os valores.
+    As somas do pandas acumulam em int64; converta para int64 antes de multiplicar colunas.
+    """
+    df = df.copy()
+    if "User" in df.columns and not isinstance(df["User"].dtype, pd.CategoricalDtype):
+        df["User"] = normalize_users(df["User"])
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    for column in METRIC_COLUMNS + ["Engagement_Total"]:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], downcast="integer")
+    return df
+
+def concat_frames(frames):
+    """
+    Concatena snapshots compactos preservando as colunas categóricas
+    (o pd.concat puro volta para strings quando as categorias diferem).
+    """
+    combined = pd.concat(frames, ignore_index=True)
+    for column in CATEGORY_COLUMNS:
+        if column in combined.columns and not isinstance(combined[column].dtype, pd.CategoricalDtype):
+            parts = [frame[column] for frame in frames if column in frame.columns]
+            if parts and all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+                combined[column] = pd.Categorical(union_categoricals(parts, ignore_order=True))
+            else:
+                combined[column] = combined[column].astype("category")
+    for column in METRIC_COLUMNS + ["Engagement_Total"]:
+        if column in combined.columns:
+            combined[column] = pd.to_numeric(combined[column], downcast="integer")
+    return combined
+
+def memory_report(df):
+    """
+    Memória por coluna (bytes, incluindo o conteúdo das strings), com o tipo de cada coluna.
+    """
+    usage = df.memory_usage(index=True, deep=True)
+    report = pd.DataFrame({
+        "dtype": [str(df[column].dtype) if column in df.columns else "index" for column in usage.index],
+        "bytes": usage.values,
+    }, index=usage.index)
+    report.loc["Total"] = ["", int(usage.sum())]
+    return report
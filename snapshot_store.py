@@ -0,0 +1,550 @@
+"""
+Armazenamento colunar (Parquet) dos snapshots *_ranked_results.csv.
+
+Cada snapshot é gravado uma única vez em:
+    snapshot_store/week=<pasta>/snapshot=<YYYYMMDD_HHMMSS>/part-0.parquet
+
+e os seus agregados (totais por métrica, posts, usuários únicos, top usuários, um
+sketch de quantis do engajamento por usuário e um HyperLogLog dos usuários) vão para
+o índice da semana:
+    snapshot_store/week=<pasta>/_aggregates.json
+
+Além das colunas do CSV, cada partição traz Post_ID (status ID numérico extraído do
+Link, ver snapshot_schema.post_ids), a chave inteira usada para cruzar posts entre
+snapshots (ver snapshot_schema.keyed_posts).
+
+O conteúdo de cada CSV é identificado pelo seu hash (snapshot_store/_content_index.json).
+Um arquivo com bytes já vistos (a cópia em dados/csv_week1, ou o mesmo resultado
+gravado com outro timestamp) não é lido nem gravado de novo: vira um alias do
+snapshot original.
+
+A leitura de um snapshot ainda não ingerido (read_snapshot) ingere só esse arquivo; o
+índice de posts e os deltas da pasta (ver post_index.py e snapshot_deltas.py) são
+atualizados uma vez por lote, por ingest_directory e pelo watcher. Threads que pedem o
+mesmo CSV (ou a mesma pasta) ao mesmo tempo esperam o trabalho em andamento em vez de
+refazê-lo.
+
+Uso:
+    python snapshot_store.py ingest                 # todas as pastas csv_week*
+    python snapshot_store.py ingest csv_week1 ...   # pastas específicas
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from cardinality_sketch import HyperLogLog
+from quantile_sketch import KLLSketch
+from snapshot_schema import (
+    POST_ID_COLUMN,
+    SNAPSHOT_COLUMNS,
+    compact_frame,
+    dedupe_posts,
+    normalize_users,
+    post_ids,
+    read_snapshot_csv,
+)
+
+# Set up a debug flag
+DEBUG = True  # Set to False to reduce verbosity
+
+def debug_print(*args):
+    if DEBUG:
+        print(*args)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # Diretório base do repositório
+STORE_DIR = os.path.join(BASE_DIR, "snapshot_store")
+
+SNAPSHOT_SUFFIX = "_ranked_results.csv"
+PARTITION_FILE = "part-0.parquet"
+AGGREGATES_FILE = "_aggregates.json"
+CONTENT_INDEX_FILE = "_content_index.json"
+
+# Versão do layout das partições; partições de versões anteriores são regravadas na próxima leitura
+STORE_FORMAT = 2
+STORE_COLUMNS = SNAPSHOT_COLUMNS + [POST_ID_COLUMN]
+
+METRICS = ["Likes", "Retweets", "Comments", "Bookmarks", "Views", "Engagement_Total"]
+TOP_USERS = 25
+AGGREGATES_FORMAT = 3  # entradas de versões anteriores (sem os sketches) são recalculadas
+
+_index_lock = threading.RLock()
+_content_index_cache = {}  # caminho do índice -> ((mtime, inode, tamanho), conteúdo)
+_key_locks = {}  # chave -> Lock (ingestão de um CSV, atualização dos derivados de uma pasta)
+_key_locks_guard = threading.Lock()
+
+def snapshot_id_from_filename(filename):
+    """
+    Retorna a parte 'YYYYMMDD_HHMMSS' do nome do arquivo, ou None se o nome não seguir o padrão.
+    """
+    if not filename.endswith(SNAPSHOT_SUFFIX):
+        return None
+    snapshot_id = filename[:-len(SNAPSHOT_SUFFIX)]
+    date_part, _, time_part = snapshot_id.partition("_")
+    if len(date_part) != 8 or len(time_part) != 6 or not (date_part + time_part).isdigit():
+        return None
+    return snapshot_id
+
+def directory_key(directory, base_dir=BASE_DIR):
+    """
+    Nome da semana (partição) de uma pasta de snapshots: o caminho relativo ao repositório
+    com '_' no lugar das barras (csv_week1, dados_csv_week1); fora do repositório, o nome da pasta.
+    """
+    directory = os.path.abspath(directory)
+    relative = os.path.relpath(directory, base_dir)
+    if relative.startswith(os.pardir) or os.path.isabs(relative):
+        return os.path.basename(directory)
+    return relative.replace(os.sep, "_")
+
+def _snapshot_key(csv_path):
+    """
+    (semana, snapshot_id) de um CSV (ver directory_key).
+    """
+    filename = os.path.basename(csv_path)
+    snapshot_id = snapshot_id_from_filename(filename) or filename[:-len(".csv")]
+    return directory_key(os.path.dirname(os.path.abspath(csv_path))), snapshot_id
+
+def _content_key(csv_path):
+    return "/".join(_snapshot_key(csv_path))
+
+def read_csv(csv_path, columns=None):
+    """
+    Lê um CSV de snapshot segundo o esquema declarado (ver snapshot_schema), com o leitor
+    multithread do pyarrow, e deriva Post_ID do Link. Retorna só 'columns', se informado.
+    """
+    columns = STORE_COLUMNS if columns is None else list(columns)
+    csv_columns = [column for column in columns if column != POST_ID_COLUMN]
+    if POST_ID_COLUMN in columns and "Link" not in csv_columns:
+        csv_columns.append("Link")
+    df = read_snapshot_csv(csv_path, csv_columns)
+    if POST_ID_COLUMN in columns:
+        df[POST_ID_COLUMN] = post_ids(df["Link"])
+    return df[columns]
+
+def _key_partition_path(key, store_dir=STORE_DIR):
+    week, snapshot_id = key.split("/")
+    return os.path.join(store_dir, f"week={week}", f"snapshot={snapshot_id}", PARTITION_FILE)
+
+def partition_path(csv_path, store_dir=STORE_DIR):
+    """
+    Caminho da partição Parquet própria de um CSV de snapshot
+    (um alias é lido da partição do snapshot original; ver resolve_partition).
+    """
+    return _key_partition_path(_content_key(csv_path), store_dir)
+
+def aggregates_path(week, store_dir=STORE_DIR):
+    """
+    Caminho do índice de agregados de uma semana.
+    """
+    return os.path.join(store_dir, f"week={week}", AGGREGATES_FILE)
+
+def file_digest(path):
+    """
+    Hash SHA-256 do conteúdo do arquivo.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def content_index_path(store_dir=STORE_DIR):
+    return os.path.join(store_dir, CONTENT_INDEX_FILE)
+
+def load_content_index(store_dir=STORE_DIR):
+    """
+    Índice de conteúdo: {"objects": {hash: snapshot original}, "snapshots": {snapshot: registro}}.
+    As chaves de snapshot são 'semana/snapshot_id'. O conteúdo é mantido em memória até o arquivo mudar.
+    """
+    path = content_index_path(store_dir)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return {"objects": {}, "snapshots": {}}
+    # Cada gravação troca o arquivo (os.replace), então o inode muda mesmo no mesmo tick do mtime
+    version = (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+    with _index_lock:
+        cached = _content_index_cache.get(path)
+        if cached is None or cached[0] != version:
+            index = _read_json(path)
+            index.setdefault("objects", {})
+            index.setdefault("snapshots", {})
+            cached = (version, index)
+            _content_index_cache[path] = cached
+        return cached[1]
+
+def _current_record(csv_path, store_dir=STORE_DIR):
+    """
+    Registro do CSV no índice de conteúdo, ou None se ele não foi ingerido ou mudou desde a ingestão.
+    """
+    record = load_content_index(store_dir)["snapshots"].get(_content_key(csv_path))
+    if record is None:
+        return None
+    try:
+        signature = _source_signature(csv_path)
+    except OSError:
+        return None
+    if any(record.get(key) != value for key, value in signature.items()):
+        return None
+    if record.get("format") != STORE_FORMAT:
+        return None
+    return record
+
+def resolve_partition(csv_path, store_dir=STORE_DIR):
+    """
+    Partição com os dados do CSV (a do snapshot original, se for um alias), ou None se o
+    CSV ainda não foi ingerido ou mudou desde a ingestão.
+    """
+    record = _current_record(csv_path, store_dir)
+    if record is None:
+        return None
+    target = _key_partition_path(record.get("alias_of") or _content_key(csv_path), store_dir)
+    return target if os.path.exists(target) else None
+
+def is_partition_fresh(csv_path, store_dir=STORE_DIR):
+    """
+    Verdadeiro se o CSV já foi ingerido e não mudou desde então.
+    """
+    return resolve_partition(csv_path, store_dir) is not None
+
+def snapshot_aliases(directory, store_dir=STORE_DIR):
+    """
+    {snapshot_id: snapshot original} dos snapshots da pasta que repetem os bytes de outro
+    snapshot da mesma pasta. Cópias de snapshots de outras pastas não entram aqui: a pasta
+    continua listando-os, apenas sem gravar os dados de novo.
+    """
+    week = directory_key(directory)
+    aliases = {}
+    for key, record in load_content_index(store_dir)["snapshots"].items():
+        alias_of = record.get("alias_of")
+        if alias_of and key.split("/")[0] == week and alias_of.split("/")[0] == week:
+            aliases[key.split("/")[1]] = alias_of
+    return aliases
+
+def _key_lock(*key):
+    """
+    Lock do processo para 'key', criado na primeira vez: quem chega depois espera o trabalho em andamento.
+    """
+    with _key_locks_guard:
+        return _key_locks.setdefault(key, threading.Lock())
+
+def _tmp_path(path):
+    # Temporário exclusivo por processo e thread: threads gravando o mesmo alvo não se atropelam
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+def _write_partition(df, target):
+    """
+    Grava o DataFrame na partição de forma atômica (arquivo temporário + rename).
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = _tmp_path(target)
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+    os.replace(tmp_path, target)
+
+def _write_arrow(table, target):
+    """
+    Grava a tabela Arrow como arquivo IPC sem compressão, de forma atômica (ver map_arrow).
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = _tmp_path(target)
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, target)
+
+def map_arrow(path):
+    """
+    Tabela de um arquivo gravado por _write_arrow, mapeada em memória (sem cópia): os processos
+    que mapeiam o mesmo arquivo dividem as páginas do page cache. Um arquivo substituído
+    depois continua válido para quem já o mapeou.
+    """
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+def compute_aggregates(df, top_n=TOP_USERS):
+    """
+    Agregados de um snapshot: totais por métrica, número de posts, usuários únicos,
+    os 'top_n' usuários por Engagement_Total, o sketch de quantis (quantile_sketch.py)
+    do Engagement_Total por usuário e o HyperLogLog (cardinality_sketch.py) dos usuários.
+    Cada post (Post_ID) conta uma única vez.
+    """
+    df = dedupe_posts(df)
+    users = normalize_users(df["User"])
+    user_engagement = df["Engagement_Total"].groupby(users).sum()
+    return {
+        "totals": {metric: int(df[metric].fillna(0).sum()) for metric in METRICS if metric in df.columns},
+        "posts": int(len(df)),
+        "unique_users": int(users.nunique()),
+        "top_users": [[user, int(value)] for user, value in user_engagement.nlargest(top_n).items()],
+        "engagement_sketch": KLLSketch().update(user_engagement.to_numpy()).to_dict(),
+        "users_sketch": HyperLogLog().update(user_engagement.index).to_dict(),
+        "format": AGGREGATES_FORMAT,
+    }
+
+def top_user_value(entry, rank):
+    """
+    Engajamento exato do usuário na posição 'rank' (1 = maior) segundo 'top_users' dos agregados,
+    ou None se a posição estiver fora da lista (rank > TOP_USERS ou além do número de usuários).
+    """
+    top_users = entry.get("top_users", [])
+    if rank < 1 or rank > len(top_users):
+        return None
+    return top_users[rank - 1][1]
+
+def _read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        debug_print(f"[WARNING] Ignoring corrupt index {path}: {e}")
+        return {}
+
+def _write_json(data, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def _source_signature(csv_path):
+    stat = os.stat(csv_path)
+    return {"source_mtime_ns": stat.st_mtime_ns, "source_size": stat.st_size}
+
+def _record_aggregates(csv_path, df, store_dir=STORE_DIR):
+    """
+    Calcula e grava no índice da semana os agregados do snapshot. Retorna a entrada gravada.
+    """
+    return _store_aggregates(csv_path, dict(compute_aggregates(df), **_source_signature(csv_path)), store_dir)
+
+def _alias_aggregates(csv_path, original, store_dir=STORE_DIR, indexes=None):
+    """
+    Entrada de agregados de um alias: a do snapshot original (mesmo conteúdo) com a assinatura
+    do próprio CSV, sem reler os dados. None se o original não tiver uma entrada atual
+    calculada a partir do conteúdo registrado no índice de conteúdo.
+    """
+    indexes = {} if indexes is None else indexes
+    week, snapshot_id = original.split("/")
+    if week not in indexes:
+        indexes[week] = _read_json(aggregates_path(week, store_dir))
+    entry = indexes[week].get(snapshot_id)
+    record = load_content_index(store_dir)["snapshots"].get(original, {})
+    if (
+        entry is None or entry.get("format") != AGGREGATES_FORMAT
+        or any(entry.get(key) != record.get(key) for key in ("source_mtime_ns", "source_size"))
+    ):
+        return None
+    return dict(entry, alias_of=original, **_source_signature(csv_path))
+
+def _store_aggregates(csv_path, entry, store_dir=STORE_DIR):
+    week, snapshot_id = _snapshot_key(csv_path)
+    path = aggregates_path(week, store_dir)
+    with _index_lock:
+        index = _read_json(path)
+        index[snapshot_id] = entry
+        _write_json(index, path)
+    return entry
+
+def _record_content(csv_path, digest, signature, alias_of=None, store_dir=STORE_DIR):
+    """
+    Registra no índice de conteúdo o hash do CSV e, se for o caso, de qual snapshot ele é alias.
+    """
+    key = _content_key(csv_path)
+    path = content_index_path(store_dir)
+    with _index_lock:
+        index = _read_json(path)
+        index.setdefault("objects", {})
+        index.setdefault("snapshots", {})
+        if alias_of is None:
+            index["objects"][digest] = key
+        index["snapshots"][key] = dict(signature, digest=digest, alias_of=alias_of, format=STORE_FORMAT)
+        _write_json(index, path)
+
+def update_derived(directory, store_dir=STORE_DIR):
+    """
+    Atualiza o índice de posts e os deltas da pasta (ver post_index e snapshot_deltas)
+    depois de um lote de ingestões.
+    """
+    # Importados aqui: os dois módulos dependem deste
+    from post_index import update_post_index
+    from snapshot_deltas import update_deltas
+    for update in (update_post_index, update_deltas):
+        try:
+            update(directory, store_dir)
+        except Exception as e:
+            debug_print(f"[ERROR] {update.__name__} failed for {directory}: {e}")
+
+def ingest_file(csv_path, store_dir=STORE_DIR, force=False):
+    """
+    Converte um CSV de snapshot para a sua partição Parquet e registra os seus agregados.
+    Se os bytes do CSV já foram ingeridos (em qualquer pasta), só registra o alias.
+    Retorna o caminho da partição com os dados; não faz nada se o CSV já foi ingerido.
+    Os deltas da pasta não são atualizados aqui (ver update_derived).
+    """
+    if not force:
+        target = resolve_partition(csv_path, store_dir)
+        if target is not None:
+            return target
+    with _key_lock("ingest", os.path.abspath(store_dir), _content_key(csv_path)):
+        if not force:
+            # Outra thread pode ter ingerido o arquivo enquanto esperávamos o lock
+            target = resolve_partition(csv_path, store_dir)
+            if target is not None:
+                return target
+        return _ingest_locked(csv_path, store_dir)
+
+def _ingest_locked(csv_path, store_dir=STORE_DIR):
+    signature = _source_signature(csv_path)
+    digest = file_digest(csv_path)
+    key = _content_key(csv_path)
+    index = load_content_index(store_dir)
+    original = index["objects"].get(digest)
+    if (
+        original is not None and original != key
+        and index["snapshots"].get(original, {}).get("format") == STORE_FORMAT
+        and os.path.exists(_key_partition_path(original, store_dir))
+    ):
+        _record_content(csv_path, digest, signature, alias_of=original, store_dir=store_dir)
+        entry = _alias_aggregates(csv_path, original, store_dir)
+        if entry is not None:
+            _store_aggregates(csv_path, entry, store_dir)
+        debug_print(f"[DEBUG] {csv_path} has the same content as {original}. Recorded as alias.")
+        return _key_partition_path(original, store_dir)
+
+    target = partition_path(csv_path, store_dir)
+    df = read_csv(csv_path)
+    _write_partition(df, target)
+    _record_aggregates(csv_path, df, store_dir)
+    _record_content(csv_path, digest, signature, store_dir=store_dir)
+    debug_print(f"[DEBUG] Ingested {csv_path} -> {target}. Shape: {df.shape}")
+    return target
+
+def ingest_directory(directory, store_dir=STORE_DIR, force=False):
+    """
+    Converte todos os CSVs de snapshot de uma pasta. Retorna a lista de partições.
+    """
+    if not os.path.isdir(directory):
+        debug_print(f"[WARNING] Directory not found: {directory}")
+        return []
+    targets = []
+    sources = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".csv"):
+            continue
+        csv_path = os.path.join(directory, filename)
+        try:
+            targets.append(ingest_file(csv_path, store_dir, force=force))
+            sources.append(csv_path)
+        except Exception as e:
+            debug_print(f"[ERROR] Failed to ingest {csv_path}: {e}")
+    # Completa o índice de agregados de partições gravadas antes dele existir
+    load_aggregates(sources, store_dir)
+    if sources:
+        update_derived(directory, store_dir)
+    return targets
+
+def read_snapshot(csv_path, columns=None, store_dir=STORE_DIR):
+    """
+    Lê um snapshot da sua partição Parquet (apenas as colunas pedidas).
+    Se o CSV ainda não foi ingerido (ou mudou), ingere antes de ler; se o store não
+    puder ser gravado, lê direto do CSV.
+    """
+    try:
+        target = ingest_file(csv_path, store_dir)
+    except OSError as e:
+        debug_print(f"[WARNING] Could not write partition for {csv_path}: {e}")
+        return read_csv(csv_path, columns)
+    return pq.read_table(target, columns=columns).to_pandas()
+
+def read_compact_snapshot(csv_path, columns=None, store_dir=STORE_DIR):
+    """
+    read_snapshot() seguido de compact_frame(): usuários normalizados e tipos compactos.
+    """
+    return compact_frame(read_snapshot(csv_path, columns=columns, store_dir=store_dir))
+
+def load_aggregates(csv_paths, store_dir=STORE_DIR):
+    """
+    Agregados dos snapshots informados, na mesma ordem, lidos dos índices das semanas.
+    Snapshots sem entrada (ou com entrada desatualizada) são calculados e registrados;
+    snapshots que não puderem ser lidos aparecem como None.
+    """
+    indexes = {}
+    result = []
+    for csv_path in csv_paths:
+        week, snapshot_id = _snapshot_key(csv_path)
+        if week not in indexes:
+            indexes[week] = _read_json(aggregates_path(week, store_dir))
+        entry = indexes[week].get(snapshot_id)
+        signature = _source_signature(csv_path)
+        if (
+            entry is None or entry.get("format") != AGGREGATES_FORMAT
+            or any(entry.get(key) != value for key, value in signature.items())
+        ):
+            record = _current_record(csv_path, store_dir)
+            alias_of = record.get("alias_of") if record else None
+            entry = _alias_aggregates(csv_path, alias_of, store_dir, indexes) if alias_of else None
+            if entry is not None:
+                # Alias: mesmos bytes do original, então os mesmos agregados
+                try:
+                    _store_aggregates(csv_path, entry, store_dir)
+                except OSError as e:
+                    debug_print(f"[WARNING] Could not write aggregates for {csv_path}: {e}")
+                indexes[week][snapshot_id] = entry
+                result.append(entry)
+                continue
+            debug_print(f"[DEBUG] Aggregates missing or stale for {csv_path}. Computing them.")
+            try:
+                df = read_snapshot(csv_path, store_dir=store_dir)
+            except Exception as e:
+                debug_print(f"[ERROR] Failed to process {csv_path}: {e}")
+                result.append(None)
+                continue
+            try:
+                entry = _record_aggregates(csv_path, df, store_dir)
+            except OSError as e:
+                debug_print(f"[WARNING] Could not write aggregates for {csv_path}: {e}")
+                entry = dict(compute_aggregates(df), **signature)
+            indexes[week][snapshot_id] = entry
+        result.append(entry)
+    return result
+
+WEEK_DIRECTORY_PATTERN = re.compile(r"^csv_week(\d+)$")
+
+def discover_week_directories(base_dir=BASE_DIR):
+    """
+    Semanas disponíveis a partir do layout de pastas: {'Week<N>': caminho de csv_week<N>},
+    em ordem numérica (Week10 vem depois de Week9).
+    """
+    weeks = []
+    for path in glob.glob(os.path.join(base_dir, "csv_week*")):
+        match = WEEK_DIRECTORY_PATTERN.match(os.path.basename(path))
+        if match and os.path.isdir(path):
+            weeks.append((int(match.group(1)), path))
+    return {f"Week{number}": path for number, path in sorted(weeks)}
+
+def default_directories(base_dir=BASE_DIR):
+    """
+    Pastas de snapshots do repositório (csv_week1, csv_week2, ...).
+    """
+    return list(discover_week_directories(base_dir).values())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshot store para os CSVs de ranking.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Converte os CSVs de snapshot para Parquet.")
+    ingest_parser.add_argument("directories", nargs="*", help="Pastas com *_ranked_results.csv (padrão: csv_week*).")
+    ingest_parser.add_argument("--store", default=STORE_DIR, help="Diretório do snapshot store.")
+    ingest_parser.add_argument("--force", action="store_true", help="Regrava partições já atualizadas.")
+
+    args = parser.parse_args()
+    if args.command == "ingest":
+        for directory in args.directories or default_directories():
+            targets = ingest_directory(directory, args.store, force=args.force)
+            print(f"{directory}: {len(targets)} snapshots in {args.store}")
@@ -0,0 +1,251 @@
+"""
+Serviço que observa as pastas csv_week* e processa cada snapshot novo uma única vez.
+
+Quando chega um *_ranked_results.csv (git pull, cópia, upload), o watcher:
+  1. ingere o arquivo no snapshot store (partição Parquet + agregados; ver snapshot_store);
+  2. atualiza de forma incremental os artefatos por pasta: índice de posts, deltas, matriz
+     de engajamento, estado de velocidade e índice de usuários;
+  3. incrementa a versão do store em snapshot_store/_version.json.
+Se a ingestão ou alguma atualização falhar, a versão não muda: a pasta é processada de
+novo na passada seguinte, e a versão só é incrementada quando todos os passos dão certo.
+Cada passo só lê o arquivo novo (os artefatos guardam até onde já foram), então o custo
+por snapshot não depende do tamanho do histórico. Um arquivo já ingerido (o registro no
+índice de conteúdo confere mtime e tamanho) não é processado de novo, nem depois de
+reiniciar o watcher.
+
+No Linux as mudanças chegam por inotify; em outros sistemas (ou se o inotify falhar)
+as pastas são verificadas a cada --interval segundos, com um stat por pasta.
+Os dashboards abertos comparam a versão do store periodicamente e recarregam a página
+quando ela muda (ver image.py).
+
+Uso:
+    python snapshot_watcher.py watch                    # pastas csv_week* (inclusive novas)
+    python snapshot_watcher.py watch csv_week2 --poll   # pasta específica, sem inotify
+    python snapshot_watcher.py once                     # processa o que houver e sai
+"""
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import time
+from datetime import datetime
+
+from engagement_matrix import update_matrix
+from post_index import update_post_index
+from snapshot_catalog import SnapshotCatalog
+from snapshot_deltas import update_deltas
+from snapshot_store import (
+    BASE_DIR,
+    STORE_DIR,
+    _current_record,
+    _read_json,
+    _write_json,
+    debug_print,
+    discover_week_directories,
+    ingest_file,
+)
+from user_index import update_user_index
+from velocity_anomalies import update_velocity
+
+STORE_VERSION_FILE = "_version.json"
+POLL_INTERVAL = float(os.getenv("SNAPSHOT_WATCH_INTERVAL", "5"))
+SETTLE_SECONDS = 0.5  # espera depois de um evento, para o arquivo terminar de ser gravado
+
+# Eventos do inotify (linux/inotify.h)
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+class SnapshotProcessingError(RuntimeError):
+    """
+    Algum snapshot da pasta não pôde ser ingerido ou algum artefato não pôde ser atualizado.
+    """
+
+def store_version_path(store_dir=STORE_DIR):
+    return os.path.join(store_dir, STORE_VERSION_FILE)
+
+def read_store_version(store_dir=STORE_DIR):
+    """
+    Versão atual do store (0 se o watcher nunca rodou).
+    """
+    return _read_json(store_version_path(store_dir)).get("version", 0)
+
+def bump_store_version(snapshot_ids, store_dir=STORE_DIR):
+    """
+    Incrementa a versão do store, registrando os snapshots que a originaram.
+    """
+    version = read_store_version(store_dir) + 1
+    _write_json(
+        {"version": version, "updated_at": datetime.now().isoformat(timespec="seconds"), "snapshots": snapshot_ids},
+        store_version_path(store_dir),
+    )
+    return version
+
+class _Inotify:
+    """
+    Acesso mínimo ao inotify via libc (sem dependências externas).
+    """
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watched = set()
+
+    def watch(self, path):
+        if path in self._watched:
+            return
+        if self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK) < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self._watched.add(path)
+
+    def wait(self, timeout):
+        """
+        Espera até 'timeout' segundos por algum evento. Retorna True se houve evento.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        os.read(self.fd, 64 * 1024)  # descarta os eventos: o catálogo descobre o que mudou
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+class SnapshotWatcher:
+    """
+    Processa os snapshots novos das pastas. Sem 'directories', acompanha as pastas csv_week*
+    de 'base_dir', inclusive as criadas depois.
+    """
+
+    def __init__(self, directories=None, store_dir=STORE_DIR, base_dir=BASE_DIR, interval=POLL_INTERVAL,
+                 use_inotify=True):
+        self.fixed_directories = [os.path.abspath(d) for d in directories] if directories else None
+        self.store_dir = store_dir
+        self.base_dir = base_dir
+        self.interval = interval
+        self.catalog = SnapshotCatalog(self.directories(), store_dir=store_dir)
+        self._unfinished = {}  # pasta -> snapshots ingeridos numa passada que falhou
+        self._inotify = None
+        if use_inotify:
+            try:
+                self._inotify = _Inotify()
+            except OSError as e:
+                debug_print(f"[WARNING] inotify unavailable ({e}); polling every {interval}s.")
+
+    def directories(self):
+        if self.fixed_directories is not None:
+            return self.fixed_directories
+        return list(discover_week_directories(self.base_dir).values())
+
+    def _watch(self, directories):
+        if self._inotify is None:
+            return
+        try:
+            if self.fixed_directories is None:
+                self._inotify.watch(self.base_dir)  # pastas de semana novas
+            for directory in directories:
+                self._inotify.watch(directory)
+        except OSError as e:
+            debug_print(f"[WARNING] {e}; falling back to polling every {self.interval}s.")
+            self._inotify.close()
+            self._inotify = None
+
+    def process_directory(self, directory):
+        """
+        Ingere os snapshots ainda não ingeridos da pasta e atualiza os artefatos incrementais.
+        Retorna os Snapshot_IDs ingeridos. Se algum passo falhar, levanta SnapshotProcessingError
+        depois de tentar os demais; os snapshots ingeridos até ali só são retornados pela próxima
+        chamada que terminar sem erros (que também refaz as atualizações).
+        """
+        snapshots = self.catalog.snapshots([directory]) + self.catalog.aliases([directory])
+        new = [snapshot for snapshot in snapshots if _current_record(snapshot.path, self.store_dir) is None]
+        ingested = self._unfinished.setdefault(directory, [])
+        failures = []
+        for snapshot in sorted(new):
+            try:
+                ingest_file(snapshot.path, self.store_dir)
+                ingested.append(snapshot.snapshot_id)
+            except Exception as e:
+                debug_print(f"[ERROR] Failed to ingest {snapshot.path}: {e}")
+                failures.append(f"ingest of {os.path.basename(snapshot.path)} failed: {e}")
+        if ingested:
+            for update in (update_post_index, update_deltas, update_matrix, update_velocity, update_user_index):
+                try:
+                    update(directory, self.store_dir, self.catalog)
+                except Exception as e:
+                    debug_print(f"[ERROR] {update.__name__} failed for {directory}: {e}")
+                    failures.append(f"{update.__name__} failed: {e}")
+        if failures:
+            raise SnapshotProcessingError(f"{directory}: " + "; ".join(failures))
+        return self._unfinished.pop(directory)
+
+    def run_once(self):
+        """
+        Uma passada sobre as pastas. Retorna a nova versão do store, ou None se nada mudou.
+        """
+        directories = self.directories()
+        self._watch(directories)
+        ingested = []
+        for directory in directories:
+            try:
+                processed = self.process_directory(directory)
+            except SnapshotProcessingError as e:
+                # A versão só muda com a pasta inteira processada; a próxima passada tenta de novo
+                debug_print(f"[ERROR] {e}; retrying on the next pass.")
+                continue
+            ingested += [f"{os.path.basename(directory)}/{snapshot_id}" for snapshot_id in processed]
+        if not ingested:
+            return None
+        version = bump_store_version(ingested, self.store_dir)
+        debug_print(f"[DEBUG] Store version {version}: ingested {ingested}")
+        return version
+
+    def wait(self):
+        """
+        Espera a próxima mudança (inotify) ou o próximo intervalo (polling).
+        Com inotify, o intervalo continua valendo como verificação de segurança.
+        """
+        if self._inotify is not None and self._inotify.wait(self.interval):
+            time.sleep(SETTLE_SECONDS)
+            return
+        if self._inotify is None:
+            time.sleep(self.interval)
+
+    def run(self):
+        mode = "inotify" if self._inotify is not None else f"polling every {self.interval}s"
+        debug_print(f"[DEBUG] Watching {self.directories()} ({mode})")
+        self.run_once()
+        while True:
+            self.wait()
+            self.run_once()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Observa as pastas de snapshots e processa os arquivos novos.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command, help_text in (("watch", "Observa as pastas continuamente."), ("once", "Processa uma vez e sai.")):
+        command_parser = subparsers.add_parser(command, help=help_text)
+        command_parser.add_argument("directories", nargs="*", help="Pastas com *_ranked_results.csv (padrão: csv_week*).")
+        command_parser.add_argument("--store", default=STORE_DIR, help="Diretório do snapshot store.")
+        command_parser.add_argument("--interval", type=float, default=POLL_INTERVAL,
+                                    help="Segundos entre verificações (polling ou verificação de segurança).")
+        command_parser.add_argument("--poll", action="store_true", help="Não usa inotify.")
+
+    args = parser.parse_args()
+    watcher = SnapshotWatcher(args.directories or None, args.store, interval=args.interval, use_inotify=not args.poll)
+    if args.command == "once":
+        print(f"store version: {watcher.run_once() or read_store_version(args.store)}")
+    else:
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            pass
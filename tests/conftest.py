@@ -0,0 +1,17 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+@pytest.fixture
+def week_copy(tmp_path):
+    """
+    Cópia de csv_week1 fora do repositório, com um snapshot store vazio ao lado.
+    """
+    directory = tmp_path / "csv_week1"
+    shutil.copytree(os.path.join(REPO_DIR, "csv_week1"), directory)
+    return str(directory), str(tmp_path / "store")
@@ -0,0 +1,76 @@
+import glob
+import http.client
+import json
+import os
+import threading
+
+import pytest
+
+import snapshot_watcher
+from ingest_server import make_server
+from snapshot_store import BASE_DIR, SNAPSHOT_SUFFIX, resolve_partition
+from snapshot_watcher import read_store_version
+
+@pytest.fixture
+def server(tmp_path):
+    # batch_seconds alto: só o POST /flush grava o buffer durante o teste
+    server = make_server(port=0, base_dir=str(tmp_path), store_dir=str(tmp_path / "store"),
+                         batch_seconds=3600, token=None)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.buffer.close()
+
+@pytest.fixture
+def snapshot_body():
+    path = sorted(glob.glob(os.path.join(BASE_DIR, "csv_week1", f"*{SNAPSHOT_SUFFIX}")))[-1]
+    with open(path, "rb") as file:
+        return file.read()
+
+def post(server, path, body=b"", content_type="text/csv"):
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=30)
+    try:
+        connection.request("POST", path, body=body, headers={"Content-Type": content_type})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read() or b"{}")
+    finally:
+        connection.close()
+
+def test_round_trip_statuses(server, snapshot_body, tmp_path):
+    status, payload = post(server, "/snapshots?week=Week1&timestamp=20250301_120000", snapshot_body)
+    assert status == 202
+    assert payload["week"] == "csv_week1" and payload["rows"] > 0
+
+    assert post(server, "/snapshots?week=Month1", snapshot_body)[0] == 400
+    assert post(server, "/snapshots?week=Week1&timestamp=2025-03-01", snapshot_body)[0] == 400
+    assert post(server, "/snapshots?week=Week1", b"User,Link\na,b\n")[0] == 422
+
+    status, payload = post(server, "/flush")
+    assert status == 200 and payload["store_version"] == 1
+    target = tmp_path / "csv_week1" / f"20250301_120000{SNAPSHOT_SUFFIX}"
+    assert resolve_partition(str(target), server.buffer.store_dir) is not None
+
+    assert post(server, "/snapshots?week=Week1&timestamp=20250301_120000", snapshot_body)[0] == 409
+
+def test_failed_flush_keeps_batch_and_version(server, snapshot_body, tmp_path, monkeypatch):
+    def failing_ingest(csv_path, store_dir):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(snapshot_watcher, "ingest_file", failing_ingest)
+    assert post(server, "/snapshots?week=Week1&timestamp=20250301_120000", snapshot_body)[0] == 202
+
+    assert post(server, "/flush")[0] == 500
+    store_dir = server.buffer.store_dir
+    target = str(tmp_path / "csv_week1" / f"20250301_120000{SNAPSHOT_SUFFIX}")
+    assert read_store_version(store_dir) == 0
+    assert os.path.exists(target) and resolve_partition(target, store_dir) is None
+
+    # A pasta continua pendente: o próximo flush a processa e só então muda a versão
+    monkeypatch.undo()
+    status, payload = post(server, "/flush")
+    assert status == 200 and payload["store_version"] == 1
+    assert resolve_partition(target, store_dir) is not None
+    with open(snapshot_watcher.store_version_path(store_dir), encoding="utf-8") as file:
+        assert json.load(file)["snapshots"] == ["csv_week1/20250301_120000"]
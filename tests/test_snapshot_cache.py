@@ -0,0 +1,53 @@
+import glob
+import os
+import threading
+from collections import Counter
+from functools import partial
+
+import pyarrow.parquet as pq
+import pytest
+
+import snapshot_store
+from snapshot_cache import SnapshotCache
+from snapshot_store import SNAPSHOT_SUFFIX, read_compact_snapshot, resolve_partition
+
+@pytest.fixture
+def ingest_calls(monkeypatch):
+    calls = Counter()
+    lock = threading.Lock()
+    ingest_locked = snapshot_store._ingest_locked
+
+    def counting(csv_path, store_dir=snapshot_store.STORE_DIR):
+        with lock:
+            calls[os.path.basename(csv_path)] += 1
+        return ingest_locked(csv_path, store_dir)
+
+    monkeypatch.setattr(snapshot_store, "_ingest_locked", counting)
+    return calls
+
+@pytest.mark.parametrize("workers", [4, 8])
+def test_cold_get_many_ingests_each_csv_once(week_copy, ingest_calls, workers):
+    directory, store_dir = week_copy
+    paths = sorted(glob.glob(os.path.join(directory, f"*{SNAPSHOT_SUFFIX}")))
+    cache = SnapshotCache(loader=partial(read_compact_snapshot, store_dir=store_dir))
+
+    frames = cache.get_many(paths, workers=workers)
+
+    assert all(df is not None for df in frames)
+    assert ingest_calls == Counter({os.path.basename(path): 1 for path in paths})
+    for path, df in zip(paths, frames):
+        partition = resolve_partition(path, store_dir)
+        assert partition is not None
+        assert pq.read_table(partition).num_rows == len(df)
+    assert not glob.glob(os.path.join(store_dir, "**", "*.tmp"), recursive=True)
+
+def test_get_many_matches_serial_reads(week_copy):
+    directory, store_dir = week_copy
+    paths = sorted(glob.glob(os.path.join(directory, f"*{SNAPSHOT_SUFFIX}")))
+    loader = partial(read_compact_snapshot, store_dir=store_dir)
+
+    parallel = SnapshotCache(loader=loader).get_many(paths, columns=["User", "Engagement_Total"], workers=8)
+    serial = [loader(path, columns=["User", "Engagement_Total"]) for path in paths]
+
+    for left, right in zip(parallel, serial):
+        assert left.equals(right)
@@ -0,0 +1,205 @@
+"""
+Índice usuário → linhas do histórico, para consultar um usuário sem filtrar o histórico inteiro.
+
+Para cada pasta, as linhas de todos os snapshots (um post por linha, já sem duplicados)
+ficam agrupadas por usuário em:
+    snapshot_store/week=<pasta>/_user_history.arrow     ordenado por User_Key e Datetime
+    snapshot_store/week=<pasta>/_user_index.json        snapshots indexados, chaves e offsets
+'users' é a lista ordenada dos handles normalizados (User_Key) e as linhas do usuário
+users[i] são history[offsets[i]:offsets[i + 1]]. Buscar um usuário é uma busca binária
+mais uma fatia, e a busca por prefixo (type-ahead) usa a mesma lista ordenada.
+A atualização é incremental: só os snapshots que ainda não estão no índice são lidos.
+
+O histórico é um arquivo Arrow IPC mapeado em memória (snapshot_store.map_arrow): as
+réplicas do dashboard dividem as mesmas páginas do page cache e só a fatia do usuário
+consultado é convertida para pandas.
+
+Uso:
+    python user_index.py build                  # pastas csv_week*
+    python user_index.py build csv_week1 ...    # pastas específicas
+    python user_index.py show <usuário> [pastas ...]
+"""
+import argparse
+import bisect
+import os
+import threading
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from snapshot_catalog import SnapshotCatalog
+from snapshot_schema import POST_ID_COLUMN, concat_frames, dedupe_posts, normalize_users
+from snapshot_store import (
+    METRICS,
+    STORE_DIR,
+    _read_json,
+    _write_arrow,
+    _write_json,
+    debug_print,
+    default_directories,
+    directory_key,
+    map_arrow,
+    read_compact_snapshot,
+)
+
+USER_HISTORY_FILE = "_user_history.arrow"
+USER_INDEX_FILE = "_user_index.json"
+USER_KEY_COLUMN = "User_Key"
+HISTORY_COLUMNS = ["User", "Link", POST_ID_COLUMN] + METRICS
+
+def user_index_paths(directory, store_dir=STORE_DIR):
+    week_dir = os.path.join(store_dir, f"week={directory_key(directory)}")
+    return os.path.join(week_dir, USER_HISTORY_FILE), os.path.join(week_dir, USER_INDEX_FILE)
+
+def normalize_handle(handle):
+    """
+    Handle normalizado para busca: sem espaços nas pontas, sem '@' inicial e em minúsculas.
+    """
+    return str(handle).strip().lstrip("@").lower()
+
+def _history_table(df):
+    table = pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(None)
+    # Colunas categóricas viram texto: os dicionários de snapshots diferentes não se concatenam
+    fields = [
+        pa.field(field.name, field.type.value_type) if pa.types.is_dictionary(field.type) else field
+        for field in table.schema
+    ]
+    return table.cast(pa.schema(fields))
+
+def _history_rows(snapshots, loader):
+    frames = []
+    for snapshot in snapshots:
+        try:
+            df = loader(snapshot.path, columns=HISTORY_COLUMNS)
+        except Exception as e:
+            debug_print(f"[ERROR] Failed to load {snapshot.path}: {e}")
+            continue
+        df = dedupe_posts(df.dropna(subset=["User"]).drop_duplicates()).reset_index(drop=True)
+        df.insert(0, USER_KEY_COLUMN, normalize_users(df["User"]).str.lstrip("@").to_numpy())
+        df.insert(1, "Snapshot_ID", snapshot.snapshot_id)
+        df.insert(2, "Datetime", snapshot.timestamp)
+        frames.append(_history_table(df))
+    return frames
+
+def _offsets(keys):
+    # Início de cada sequência de chaves iguais, mais o total de linhas
+    starts = np.flatnonzero(np.append(True, keys[1:] != keys[:-1])) if len(keys) else np.array([], dtype="int64")
+    return keys[starts].tolist(), np.append(starts, len(keys)).tolist()
+
+def update_user_index(directory, store_dir=STORE_DIR, catalog=None, loader=None):
+    """
+    Acrescenta ao histórico da pasta os snapshots novos e retorna o índice (.json).
+    O histórico em si é lido com map_arrow; se algum snapshot indexado saiu da pasta, ele é refeito.
+    Sem snapshots pendentes, o histórico não é aberto.
+    """
+    catalog = catalog or SnapshotCatalog([directory], store_dir=store_dir)
+    loader = loader or partial(read_compact_snapshot, store_dir=store_dir)
+    snapshots = catalog.snapshots([directory])
+    history_path, index_path = user_index_paths(directory, store_dir)
+
+    index = _read_json(index_path)
+    indexed = set(index.get("snapshots", []))
+    if not os.path.exists(history_path) or not indexed <= {snapshot.snapshot_id for snapshot in snapshots}:
+        if indexed:
+            debug_print(f"[DEBUG] Indexed snapshots changed in {directory}; rebuilding user index.")
+        indexed = set()
+
+    pending = [snapshot for snapshot in snapshots if snapshot.snapshot_id not in indexed]
+    if not pending and indexed:
+        return index
+
+    tables = ([map_arrow(history_path)] if indexed else []) + _history_rows(pending, loader)
+    if not tables:
+        return {}
+    history = pa.concat_tables(tables, promote_options="permissive")
+    history = history.take(pc.sort_indices(history, sort_keys=[(USER_KEY_COLUMN, "ascending"), ("Datetime", "ascending")]))
+    users, offsets = _offsets(history.column(USER_KEY_COLUMN).to_numpy())
+    _write_arrow(history, history_path)
+    index = {
+        "snapshots": sorted(indexed | {snapshot.snapshot_id for snapshot in pending}),
+        "users": users,
+        "offsets": offsets,
+    }
+    _write_json(index, index_path)
+    debug_print(f"[DEBUG] Indexed {len(pending)} snapshots of {directory}: {len(users)} users, {history.num_rows} rows")
+    return index
+
+class UserIndex:
+    """
+    Históricos por usuário mapeados em memória, atualizados quando o catálogo da pasta muda.
+    """
+
+    def __init__(self, catalog, store_dir=STORE_DIR, loader=None):
+        self.catalog = catalog
+        self.store_dir = store_dir
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._indexes = {}  # directory -> (snapshots indexados, histórico mapeado, índice)
+
+    def _directory_index(self, directory):
+        snapshots = self.catalog.snapshots([directory])
+        with self._lock:
+            cached = self._indexes.get(directory)
+            if cached is None or cached[0] is not snapshots:
+                index = update_user_index(directory, self.store_dir, self.catalog, self.loader)
+                history_path = user_index_paths(directory, self.store_dir)[0]
+                history = map_arrow(history_path) if index.get("users") else None
+                cached = (snapshots, history, index)
+                self._indexes[directory] = cached
+            return cached[1], cached[2]
+
+    def search(self, directories, prefix, limit=20):
+        """
+        Handles normalizados que começam com 'prefix', em ordem alfabética (no máximo 'limit').
+        """
+        prefix = normalize_handle(prefix)
+        matches = set()
+        for directory in directories:
+            users = self._directory_index(directory)[1].get("users", [])
+            lo = bisect.bisect_left(users, prefix)
+            hi = bisect.bisect_left(users, prefix + "\U0010ffff")
+            matches.update(users[lo:min(hi, lo + limit)])
+        return sorted(matches)[:limit]
+
+    def history(self, directories, user):
+        """
+        Linhas do usuário em todos os snapshots das pastas (um post por linha), por Datetime.
+        """
+        key = normalize_handle(user)
+        frames = []
+        for directory in directories:
+            history, index = self._directory_index(directory)
+            users = index.get("users", [])
+            position = bisect.bisect_left(users, key)
+            if position < len(users) and users[position] == key:
+                start, stop = index["offsets"][position], index["offsets"][position + 1]
+                frames.append(history.slice(start, stop - start).to_pandas())
+        if not frames:
+            return pd.DataFrame(columns=[USER_KEY_COLUMN, "Snapshot_ID", "Datetime"] + HISTORY_COLUMNS)
+        return concat_frames(frames).sort_values("Datetime", kind="stable").reset_index(drop=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Índice usuário → linhas do histórico.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Atualiza o índice de usuários das pastas.")
+    build_parser.add_argument("directories", nargs="*", help="Pastas com *_ranked_results.csv (padrão: csv_week*).")
+    build_parser.add_argument("--store", default=STORE_DIR, help="Diretório do snapshot store.")
+
+    show_parser = subparsers.add_parser("show", help="Mostra o histórico de um usuário.")
+    show_parser.add_argument("user", help="Handle do usuário (com ou sem '@').")
+    show_parser.add_argument("directories", nargs="*", help="Pastas com *_ranked_results.csv (padrão: csv_week*).")
+    show_parser.add_argument("--store", default=STORE_DIR, help="Diretório do snapshot store.")
+
+    args = parser.parse_args()
+    directories = [os.path.abspath(directory) for directory in args.directories or default_directories()]
+    if args.command == "build":
+        for directory in directories:
+            index = update_user_index(directory, args.store)
+            print(f"{directory}: {len(index.get('users', []))} users, {(index.get('offsets') or [0])[-1]} rows")
+    elif args.command == "show":
+        user_index = UserIndex(SnapshotCatalog(directories, store_dir=args.store), args.store)
+        print(user_index.history(directories, args.user).to_string())
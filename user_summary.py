@@ -0,0 +1,59 @@
+"""
+Resumo por usuário de um snapshot, calculado em uma única passada agrupada.
+
+Todos os widgets do dashboard que ranqueiam usuários (componentes, ranking por
+engajamento, likes, views, top post) leem desta tabela em vez de agrupar o
+snapshot cada um por conta própria.
+"""
+import numpy as np
+
+from snapshot_schema import METRIC_COLUMNS, POST_ID_COLUMN, dedupe_posts
+
+SUMMARY_METRICS = METRIC_COLUMNS + ["Engagement_Total"]
+COMPONENT_COLUMNS = ["Comments", "Retweets", "Likes", "Bookmarks"]
+
+def summarize_users(df):
+    """
+    Tabela por usuário (índice 'User'), ordenada pelo ranking:
+      - soma de cada métrica e 'Components' (Comments + Retweets + Likes + Bookmarks);
+      - 'Posts': número de posts;
+      - 'Top_Post_Link' / 'Top_Post_Engagement': o post de maior Engagement_Total;
+      - 'Rank': posição por Engagement_Total (empates mantêm a ordem do snapshot).
+    Cada post (Post_ID) conta uma única vez.
+    """
+    df = dedupe_posts(df.dropna(subset=["User", "Engagement_Total"]))
+    df = df.reset_index(drop=True)
+    aggregations = {metric: (metric, "sum") for metric in SUMMARY_METRICS if metric in df.columns}
+    aggregations["Posts"] = ("Engagement_Total", "size")
+    aggregations["Top_Row"] = ("Engagement_Total", "idxmax")
+    summary = df.groupby("User", observed=True, sort=False).agg(**aggregations)
+
+    components = [column for column in COMPONENT_COLUMNS if column in summary.columns]
+    summary["Components"] = summary[components].sum(axis=1)
+    top_rows = summary.pop("Top_Row").to_numpy()
+    summary["Top_Post_Link"] = df["Link"].to_numpy()[top_rows] if "Link" in df.columns else ""
+    summary["Top_Post_Engagement"] = df["Engagement_Total"].to_numpy()[top_rows]
+    if POST_ID_COLUMN in df.columns:
+        summary["Top_Post_ID"] = df[POST_ID_COLUMN].to_numpy()[top_rows]
+
+    summary = summary.sort_values("Engagement_Total", ascending=False, kind="stable")
+    summary["Rank"] = np.arange(1, len(summary) + 1)
+    return summary
+
+def top_k(summary, column, k):
+    """
+    Os 'k' usuários com maior 'column', do maior para o menor; empates são desfeitos pelo nome do usuário.
+    Usa seleção parcial (argpartition) para achar o k-ésimo valor e ordena apenas os candidatos
+    com valor maior ou igual a ele, então o resultado não depende de qual empatado a seleção pegou.
+    """
+    values = summary[column].to_numpy()
+    if k <= 0:
+        return summary.iloc[0:0]
+    if k < len(values):
+        threshold = -np.partition(-values, k - 1)[k - 1]
+        candidates = np.flatnonzero(values >= threshold)
+    else:
+        candidates = np.arange(len(values))
+    users = summary.index.to_numpy().astype(str)[candidates]
+    order = candidates[np.lexsort((users, -values[candidates]))][:k]
+    return summary.iloc[order]
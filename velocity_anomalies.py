@@ -0,0 +1,280 @@
+"""
+Detecção online de anomalias de velocidade de engajamento por post.
+
+A velocidade de um post é o ganho de Engagement_Total por hora entre duas aparições
+consecutivas. Para cada post é mantida a média e a variância das suas velocidades
+(algoritmo de Welford: O(1) por atualização), e para a pasta inteira a média e a
+variância de todas as velocidades. A cada snapshot novo, só as linhas desse snapshot
+são lidas; um post é marcado quando a sua velocidade fica 'z' desvios-padrão acima
+da própria média (ou, com poucas observações, acima da média da pasta) e o ganho
+passa de um mínimo absoluto.
+
+O estado e os alertas de cada pasta ficam em:
+    snapshot_store/week=<pasta>/_velocity_state.parquet   um registro por post
+    snapshot_store/week=<pasta>/_velocity_flags.parquet   um registro por alerta
+    snapshot_store/week=<pasta>/_velocity.json            snapshots processados e estatística da pasta
+Um snapshot que não pôde ser lido conta como processado (fica em 'skipped' no .json), para
+que os seguintes continuem sendo processados de forma incremental.
+
+Uso:
+    python velocity_anomalies.py update                 # pastas csv_week*
+    python velocity_anomalies.py update csv_week1 ...   # pastas específicas
+"""
+import argparse
+import os
+import threading
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from snapshot_catalog import SnapshotCatalog
+from snapshot_schema import POST_ID_COLUMN, concat_frames, keyed_posts
+from snapshot_store import (
+    STORE_DIR,
+    _read_json,
+    _write_json,
+    _write_partition,
+    debug_print,
+    default_directories,
+    directory_key,
+    read_compact_snapshot,
+)
+
+VELOCITY_COLUMNS = ["User", "Link", POST_ID_COLUMN, "Engagement_Total"]
+Z_THRESHOLD = float(os.getenv("SNAPSHOT_VELOCITY_Z", "4"))
+MIN_OBSERVATIONS = 3  # velocidades do próprio post antes de compará-lo com ele mesmo
+MIN_GAIN = int(os.getenv("SNAPSHOT_VELOCITY_MIN_GAIN", "100"))  # ganho mínimo (engajamento) para marcar
+MIN_STD = 1.0  # desvio mínimo (engajamento/hora), evita z infinito em posts de velocidade constante
+
+STATE_COLUMNS = ["User", "Link", "Last_Total", "Last_Seen", "Count", "Mean", "M2"]
+FLAG_COLUMNS = [
+    "Snapshot_ID", "Datetime", POST_ID_COLUMN, "User", "Link",
+    "Gain", "Velocity", "Baseline_Mean", "Baseline_Std", "Z_Score", "Scope",
+]
+
+def velocity_paths(directory, store_dir=STORE_DIR):
+    """
+    Caminhos (estado, alertas, manifesto) de uma pasta.
+    """
+    week_dir = os.path.join(store_dir, f"week={directory_key(directory)}")
+    return (
+        os.path.join(week_dir, "_velocity_state.parquet"),
+        os.path.join(week_dir, "_velocity_flags.parquet"),
+        os.path.join(week_dir, "_velocity.json"),
+    )
+
+def _empty_state():
+    state = pd.DataFrame({
+        "User": pd.Series(dtype=object),
+        "Link": pd.Series(dtype=object),
+        "Last_Total": pd.Series(dtype="float64"),
+        "Last_Seen": pd.Series(dtype="datetime64[ns]"),
+        "Count": pd.Series(dtype="float64"),
+        "Mean": pd.Series(dtype="float64"),
+        "M2": pd.Series(dtype="float64"),
+    })
+    state.index = pd.Index([], dtype="int64", name=POST_ID_COLUMN)
+    return state
+
+def _empty_flags():
+    return pd.DataFrame(columns=FLAG_COLUMNS)
+
+def _merge_moments(moments, values):
+    """
+    Junta (n, média, M2) com as estatísticas de 'values' (fórmula de Chan para Welford em lote).
+    """
+    n, mean, m2 = moments
+    k = len(values)
+    if not k:
+        return moments
+    batch_mean = float(values.mean())
+    batch_m2 = float(((values - batch_mean) ** 2).sum())
+    total = n + k
+    delta = batch_mean - mean
+    return [total, mean + delta * k / total, m2 + batch_m2 + delta * delta * n * k / total]
+
+def observe_snapshot(state, moments, df, snapshot_id, timestamp):
+    """
+    Atualiza o estado dos posts com um snapshot e retorna (estado, estatística da pasta, alertas).
+    'state' é indexado por Post_ID; 'moments' é [n, média, M2] das velocidades da pasta.
+    """
+    current = keyed_posts(df.dropna(subset=["Engagement_Total"]))
+    totals = current["Engagement_Total"].astype("float64")
+
+    seen = current.index.intersection(state.index)
+    previous = state.loc[seen]
+    hours = (timestamp - pd.to_datetime(previous["Last_Seen"])).dt.total_seconds().to_numpy() / 3600
+    gain = totals.loc[seen].to_numpy() - previous["Last_Total"].to_numpy()
+    valid = hours > 0
+    seen, previous, hours, gain = seen[valid], previous[valid], hours[valid], gain[valid]
+    velocity = gain / hours
+
+    # Comparação com o histórico anterior a este snapshot
+    count = previous["Count"].to_numpy()
+    mean = previous["Mean"].to_numpy()
+    std = np.sqrt(np.where(count > 1, previous["M2"].to_numpy() / np.maximum(count - 1, 1), 0))
+    folder_n, folder_mean, folder_m2 = moments
+    folder_std = np.sqrt(folder_m2 / (folder_n - 1)) if folder_n > 1 else 0.0
+    own = count >= MIN_OBSERVATIONS
+    baseline_mean = np.where(own, mean, folder_mean)
+    baseline_std = np.maximum(np.where(own, std, folder_std), MIN_STD)
+    z_scores = (velocity - baseline_mean) / baseline_std
+    flagged = (z_scores >= Z_THRESHOLD) & (gain >= MIN_GAIN) & (own | (folder_n >= MIN_OBSERVATIONS))
+    flags = pd.DataFrame({
+        "Snapshot_ID": snapshot_id,
+        "Datetime": timestamp,
+        POST_ID_COLUMN: seen[flagged].to_numpy(dtype="int64"),
+        "User": current.loc[seen[flagged], "User"].astype(str).to_numpy(),
+        "Link": current.loc[seen[flagged], "Link"].astype(str).to_numpy(),
+        "Gain": gain[flagged],
+        "Velocity": velocity[flagged],
+        "Baseline_Mean": baseline_mean[flagged],
+        "Baseline_Std": baseline_std[flagged],
+        "Z_Score": z_scores[flagged],
+        "Scope": np.where(own[flagged], "post", "folder"),
+    }, columns=FLAG_COLUMNS)
+
+    # Welford: uma atualização por post visto de novo
+    count = count + 1
+    delta = velocity - mean
+    mean = mean + delta / count
+    state.loc[seen, "Count"] = count
+    state.loc[seen, "Mean"] = mean
+    state.loc[seen, "M2"] = previous["M2"].to_numpy() + delta * (velocity - mean)
+    moments = _merge_moments(moments, velocity)
+
+    new = current.index.difference(state.index)
+    if len(new):
+        added = pd.DataFrame({"Count": 0.0, "Mean": 0.0, "M2": 0.0}, index=new)
+        state = pd.concat([state, added.reindex(columns=STATE_COLUMNS)])
+        state.index.name = POST_ID_COLUMN
+    state.loc[current.index, "Last_Total"] = totals.to_numpy()
+    state.loc[current.index, "Last_Seen"] = timestamp
+    state.loc[current.index, "User"] = current["User"].astype(str).to_numpy()
+    state.loc[current.index, "Link"] = current["Link"].astype(str).to_numpy()
+    return state, moments, flags
+
+def _read_table(path):
+    return pq.read_table(path).to_pandas() if os.path.exists(path) else None
+
+def update_velocity(directory, store_dir=STORE_DIR, catalog=None, loader=None):
+    """
+    Processa os snapshots novos da pasta e retorna (estado, alertas).
+    Se a lista de snapshots mudou antes do último processado (snapshot removido ou fora
+    de ordem), o estado é refeito desde o início. Snapshots que falham na leitura são
+    registrados como ignorados, sem invalidar o estado.
+    """
+    catalog = catalog or SnapshotCatalog([directory], store_dir=store_dir)
+    loader = loader or partial(read_compact_snapshot, store_dir=store_dir)
+    snapshots = catalog.snapshots([directory])
+    state_path, flags_path, manifest_path = velocity_paths(directory, store_dir)
+
+    manifest = _read_json(manifest_path)
+    known = manifest.get("snapshots", [])
+    state = _read_table(state_path) if known else None
+    flags = _read_table(flags_path) if known else None
+    if known != [snapshot.snapshot_id for snapshot in snapshots[:len(known)]] or state is None:
+        if known:
+            debug_print(f"[DEBUG] Snapshot list of {directory} changed; rebuilding velocity state.")
+        known, state, flags = [], None, None
+    skipped = manifest.get("skipped", []) if known else []
+    state = state.set_index(POST_ID_COLUMN) if state is not None else _empty_state()
+    flags = flags if flags is not None else _empty_flags()
+    moments = manifest.get("moments", [0, 0.0, 0.0]) if known else [0, 0.0, 0.0]
+
+    pending = snapshots[len(known):]
+    if not pending:
+        return state, flags
+
+    new_flags = []
+    for snapshot in pending:
+        try:
+            df = loader(snapshot.path, columns=VELOCITY_COLUMNS)
+        except Exception as e:
+            debug_print(f"[ERROR] Failed to load {snapshot.path}: {e}; skipping it.")
+            known.append(snapshot.snapshot_id)
+            skipped.append(snapshot.snapshot_id)
+            continue
+        state, moments, snapshot_flags = observe_snapshot(state, moments, df, snapshot.snapshot_id, snapshot.timestamp)
+        if not snapshot_flags.empty:
+            new_flags.append(snapshot_flags)
+        known.append(snapshot.snapshot_id)
+
+    if new_flags:
+        flags = concat_frames(([flags] if not flags.empty else []) + new_flags)
+    _write_partition(state.reset_index(), state_path)
+    _write_partition(flags.astype({"User": str, "Link": str}), flags_path)
+    _write_json({"snapshots": known, "skipped": skipped, "moments": moments}, manifest_path)
+    debug_print(
+        f"[DEBUG] Velocity state of {directory}: {len(pending)} new snapshots, "
+        f"{len(state)} posts, {sum(len(frame) for frame in new_flags)} new flags"
+    )
+    return state, flags
+
+class VelocityMonitor:
+    """
+    Alertas de velocidade das pastas, atualizados quando o catálogo muda.
+    """
+
+    def __init__(self, catalog, store_dir=STORE_DIR, loader=None):
+        self.catalog = catalog
+        self.store_dir = store_dir
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._flags = {}  # directory -> (snapshots considerados, alertas)
+
+    def _directory_flags(self, directory):
+        snapshots = self.catalog.snapshots([directory])
+        with self._lock:
+            cached = self._flags.get(directory)
+            if cached is None or cached[0] is not snapshots:
+                cached = (snapshots, update_velocity(directory, self.store_dir, self.catalog, self.loader)[1])
+                self._flags[directory] = cached
+            return cached[1]
+
+    def flags(self, directories, start=None, end=None):
+        """
+        Alertas das pastas (start <= Datetime <= end; limites None são abertos), do maior Z_Score ao menor.
+        """
+        frames = [self._directory_flags(directory) for directory in directories]
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return _empty_flags()
+        flags = pd.concat(frames, ignore_index=True)
+        if start is not None:
+            flags = flags[flags["Datetime"] >= start]
+        if end is not None:
+            flags = flags[flags["Datetime"] <= end]
+        return flags.sort_values("Z_Score", ascending=False, kind="stable").reset_index(drop=True)
+
+    def post_flags(self, directories, start=None, end=None):
+        """
+        Um registro por post marcado: número de alertas, maior Z_Score e maior ganho, indexado por Post_ID.
+        """
+        flags = self.flags(directories, start, end)
+        return flags.groupby(POST_ID_COLUMN).agg(
+            User=("User", "first"),
+            Link=("Link", "first"),
+            Flags=("Z_Score", "size"),
+            Max_Z_Score=("Z_Score", "max"),
+            Max_Gain=("Gain", "max"),
+            Last_Flag=("Datetime", "max"),
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detecção de anomalias de velocidade de engajamento.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    update_parser = subparsers.add_parser("update", help="Processa os snapshots novos e lista os alertas.")
+    update_parser.add_argument("directories", nargs="*", help="Pastas com *_ranked_results.csv (padrão: csv_week*).")
+    update_parser.add_argument("--store", default=STORE_DIR, help="Diretório do snapshot store.")
+
+    args = parser.parse_args()
+    if args.command == "update":
+        for directory in args.directories or default_directories():
+            state, flags = update_velocity(os.path.abspath(directory), args.store)
+            print(f"{directory}: {len(state)} posts, {len(flags)} flags")
+            if not flags.empty:
+                print(flags[["Datetime", "User", "Gain", "Velocity", "Z_Score", "Scope"]].to_string(index=False))